@@ -7,3 +7,5 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.signals
+        from api.ratelimit import warn_if_not_shared
+        warn_if_not_shared()
@@ -0,0 +1,127 @@
+import heapq
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from .models import User, Genre, Theme
+from .search import normalize_text
+
+AUTOCOMPLETE_KINDS = ['genre', 'theme', 'author']
+
+# Délai entre deux vérifications de la version partagée (les autres processus peuvent avoir modifié les tags)
+AUTOCOMPLETE_CHECK_INTERVAL = 5
+AUTOCOMPLETE_VERSION_KEY = "autocomplete:version"
+# Les préfixes courts couvrent beaucoup de noms : leurs résultats sont gardés en mémoire
+MEMO_PREFIX_LENGTH = 2
+
+
+# Index de préfixes : tableau trié des clés normalisées, parcouru par recherche dichotomique
+# Chaque nom est indexé sur son début et sur le début de chacun de ses mots ("Le Petit Prince" -> "prince")
+class PrefixIndex:
+    def __init__(self, items):
+        self.names = []
+        self.counts = []
+        keyed = []
+        for name, count in items:
+            position = len(self.names)
+            self.names.append(name)
+            self.counts.append(count)
+            normalized = normalize_text(name).strip()
+            keys = {normalized}
+            keys.update(normalized[match.start():] for match in re.finditer(r'(?<=[\s\-\'])\w', normalized))
+            keyed.extend((key, position) for key in keys if key)
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.positions = [position for _, position in keyed]
+        self.memo = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    # Les noms qui commencent par le préfixe, classés par nombre d'utilisations puis par ordre alphabétique
+    def complete(self, prefix, limit=10):
+        prefix = normalize_text(prefix).strip()
+        memo_key = (prefix, limit)
+        if len(prefix) <= MEMO_PREFIX_LENGTH and memo_key in self.memo:
+            return self.memo[memo_key]
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', lo=start)
+        candidates = set(self.positions[start:end])
+        best = heapq.nsmallest(limit, candidates, key=lambda position: (-self.counts[position], self.names[position].lower()))
+        results = [{'name': self.names[position], 'count': self.counts[position]} for position in best]
+
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            self.memo[memo_key] = results
+        return results
+
+
+# Index chargés dans ce processus
+_indexes = None
+_loaded_version = None
+_checked_at = 0.0
+_build_lock = threading.Lock()
+
+
+# Noms et nombre de livres qui les utilisent, pour chaque type de suggestion
+def load_autocomplete_items():
+    return {
+        'genre': list(Genre.objects.annotate(total=Count('books')).values_list('name', 'total')),
+        'theme': list(Theme.objects.annotate(total=Count('books')).values_list('name', 'total')),
+        'author': list(
+            User.objects.filter(deleted_at__isnull=True).exclude(author_name__isnull=True).exclude(author_name='')
+            .annotate(total=Count('books')).values_list('author_name', 'total')
+        ),
+    }
+
+
+def _shared_version():
+    version = cache.get(AUTOCOMPLETE_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(AUTOCOMPLETE_VERSION_KEY, version, None):
+            version = cache.get(AUTOCOMPLETE_VERSION_KEY, version)
+    return version
+
+
+# Retourne les index du processus, en les (re)construisant s'ils sont absents ou périmés
+# Entre deux vérifications, aucune requête (ni base, ni cache) n'est faite
+def get_autocomplete_indexes():
+    global _indexes, _loaded_version, _checked_at
+    now = time.monotonic()
+    if _indexes is not None and now - _checked_at < AUTOCOMPLETE_CHECK_INTERVAL:
+        return _indexes
+
+    with _build_lock:
+        if _indexes is not None and now - _checked_at < AUTOCOMPLETE_CHECK_INTERVAL:
+            return _indexes
+        version = _shared_version()
+        if _indexes is None or version != _loaded_version:
+            _indexes = {kind: PrefixIndex(items) for kind, items in load_autocomplete_items().items()}
+            _loaded_version = version
+        _checked_at = now
+    return _indexes
+
+
+# Marque les index comme périmés : reconstruits au prochain appel dans ce processus,
+# et dans les autres processus à leur prochaine vérification (la version est dans le cache partagé)
+# Fait une fois la transaction validée : un autre processus qui reconstruirait ses index avant lirait les anciens noms
+def invalidate_autocomplete():
+    transaction.on_commit(_bump_version)
+
+
+def _bump_version():
+    global _checked_at, _indexes
+    cache.set(AUTOCOMPLETE_VERSION_KEY, uuid.uuid4().hex, None)
+    with _build_lock:
+        _indexes = None
+        _checked_at = 0.0
+
+
+def autocomplete(prefix, kinds=None, limit=10):
+    indexes = get_autocomplete_indexes()
+    return {kind: indexes[kind].complete(prefix, limit) for kind in (kinds or AUTOCOMPLETE_KINDS)}
@@ -0,0 +1,149 @@
+import hashlib
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Chapter
+from .revisions import record_revision
+from .cdn import purge_surrogate_keys, chapter_keys
+from .jobs import enqueue
+
+# Au plus une écriture du brouillon dans le chapitre toutes les AUTOSAVE_INTERVAL secondes
+AUTOSAVE_INTERVAL = 10
+# Durée de vie d'un brouillon dans le cache (il est écrit en base bien avant, sauf si les workers sont arrêtés)
+AUTOSAVE_DRAFT_TIMEOUT = 60 * 60 * 24
+# Verrou d'un brouillon : durée maximale (processus arrêté en le tenant) et attente avant de répondre par un conflit
+AUTOSAVE_LOCK_TIMEOUT = 5
+AUTOSAVE_LOCK_WAIT = 1
+
+
+class AutosaveConflict(Exception):
+    def __init__(self, version):
+        super().__init__("Le chapitre a été modifié depuis la version de base.")
+        self.version = version
+
+
+class AutosaveBusy(Exception):
+    pass
+
+
+# Identifiant de version d'un contenu (empreinte SHA-1 tronquée)
+def content_version(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+# Applique une liste d'opérations {"pos": int, "delete": int, "insert": str} les unes après les autres
+def apply_operations(content, operations):
+    if not isinstance(operations, list):
+        raise ValueError("'ops' doit être une liste d'opérations.")
+    for operation in operations:
+        try:
+            position = int(operation.get('pos', 0))
+            delete = int(operation.get('delete', 0))
+            insert = str(operation.get('insert', ''))
+        except (AttributeError, TypeError, ValueError):
+            raise ValueError("Opération invalide.")
+        if position < 0 or delete < 0 or position + delete > len(content):
+            raise ValueError("Opération hors du texte.")
+        content = content[:position] + insert + content[position + delete:]
+    return content
+
+
+# Le brouillon d'un chapitre (version, contenu) est gardé dans le cache partagé entre processus, pas en base
+def _draft_key(chapter_id):
+    return f"autosave:draft:{chapter_id}"
+
+
+# Verrou court sur le brouillon d'un chapitre, pris avec cache.add (atomique) : lecture, comparaison de version et
+# écriture du brouillon se font sans autre sauvegarde entre les deux, quel que soit le processus
+@contextmanager
+def _draft_lock(chapter_id):
+    key = f"autosave:lock:{chapter_id}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + AUTOSAVE_LOCK_WAIT
+    while not cache.add(key, token, AUTOSAVE_LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise AutosaveBusy()
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def _get_draft(chapter_id):
+    return cache.get(_draft_key(chapter_id))
+
+
+# Contenu le plus récent du chapitre : brouillon en attente s'il existe, sinon la base
+def current_content(chapter):
+    draft = _get_draft(chapter.pk)
+    return draft[1] if draft is not None else chapter.content
+
+
+# Tâche : écrit le brouillon en attente dans le chapitre (et dans l'historique des révisions)
+# Le brouillon n'est oublié que s'il n'a pas changé pendant l'écriture ; sinon une nouvelle écriture est programmée
+def flush_autosave(chapter_id):
+    draft = _get_draft(chapter_id)
+    if draft is None:
+        return False
+    version, content = draft
+    with transaction.atomic():
+        chapter = Chapter.objects.select_for_update().select_related('book').filter(pk=chapter_id).first()
+        written = chapter is not None and chapter.content != content
+        if written:
+            previous_content = chapter.content
+            chapter.content = content
+            chapter.save(update_fields=['content', 'word_count', 'char_count', 'reading_time'])
+            record_revision(chapter, previous_content=previous_content)
+    if written:
+        purge_surrogate_keys(chapter_keys(chapter.book, chapter.slug))
+
+    with _draft_lock(chapter_id):
+        draft = _get_draft(chapter_id)
+        if draft is not None and draft[0] == version:
+            cache.delete(_draft_key(chapter_id))
+            draft = None
+    if draft is not None and chapter is not None:
+        _schedule_flush(chapter_id, force=True)
+    return written
+
+
+# Programme l'écriture du brouillon en base : seule la première sauvegarde d'un intervalle ajoute une tâche,
+# les suivantes ne touchent que le cache (la tâche lit le brouillon le plus récent au moment de s'exécuter)
+# JOBS_EAGER exécute la tâche tout de suite, sans attendre delay : chaque sauvegarde est alors écrite, sinon les suivantes
+# de l'intervalle resteraient dans le cache sans tâche pour les écrire
+def _schedule_flush(chapter_id, force=False):
+    if settings.JOBS_EAGER or cache.add(f"autosave:scheduled:{chapter_id}", True, AUTOSAVE_INTERVAL) or force:
+        enqueue(flush_autosave, {'chapter_id': chapter_id}, dedup_key=f"autosave:{chapter_id}", delay=AUTOSAVE_INTERVAL)
+
+
+# Applique une sauvegarde automatique et retourne la nouvelle version
+# Le brouillon n'est remplacé que s'il est toujours dans la version de base (compare-and-set sous verrou) : de deux
+# sauvegardes simultanées sur la même version de base, une seule réussit, l'autre reçoit un conflit
+# Aucune écriture en base : les sauvegardes d'un intervalle sont regroupées en une seule écriture, faite par un worker
+def autosave(chapter, base_version, operations):
+    try:
+        with _draft_lock(chapter.pk):
+            draft = _get_draft(chapter.pk)
+            version, content = draft if draft is not None else (content_version(chapter.content), chapter.content)
+            if base_version != version:
+                raise AutosaveConflict(version)
+            new_content = apply_operations(content, operations)
+            new_version = content_version(new_content)
+            cache.set(_draft_key(chapter.pk), (new_version, new_content), AUTOSAVE_DRAFT_TIMEOUT)
+    except AutosaveBusy:
+        # Une autre sauvegarde du même chapitre est en cours : le client repart de la version qu'elle écrira
+        draft = _get_draft(chapter.pk)
+        raise AutosaveConflict(draft[0] if draft is not None else content_version(chapter.content))
+
+    _schedule_flush(chapter.pk)
+    return new_version
+
+
+# Oublie le brouillon en attente (après une modification complète ou une restauration du chapitre)
+def discard_autosave(chapter_id):
+    cache.delete(_draft_key(chapter_id))
@@ -0,0 +1,455 @@
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .models import Book, Genre, Theme, CatalogChange
+from .filters import BookFilter, BookOrderingFilter
+from .jobs import enqueue
+
+# NumPy est optionnel : sans lui (ou sans CATALOG_ENGINE=True), getallbook passe par la base comme avant
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Délai entre deux lectures du journal des modifications (CatalogChange), écrit par tous les processus et les workers
+CATALOG_CHECK_INTERVAL = 2
+# Au-delà de ce nombre de modifications en retard, le catalogue est rechargé entièrement
+CATALOG_MAX_REPLAY = 1000
+# Les numéros du journal peuvent être validés dans le désordre : une modification plus récente que CATALOG_GAP_TIMEOUT
+# secondes est rejouée, sans avancer le numéro de reprise, pour ne pas sauter un numéro pas encore validé
+CATALOG_GAP_TIMEOUT = 30
+# Durée de conservation du journal (nettoyé en tâche de fond toutes les CATALOG_PURGE_EVERY modifications) ;
+# un processus qui ne l'a pas relu depuis plus longtemps recharge tout le catalogue
+CATALOG_CHANGE_RETENTION = 60 * 60
+CATALOG_PURGE_EVERY = 1000
+
+# view_count n'y est pas : les vues sont écrites trop souvent pour être journalisées, le tri par vues passe par la base
+BOOK_COLUMNS = ['id', 'public_type', 'state', 'is_saga', 'rating', 'release_date', 'trending_score', 'title']
+
+# Nombre de tris différents gardés en mémoire par instantané
+MAX_CACHED_ORDERS = 16
+# Titres voisins lus en base pour classer un titre nouveau ou modifié (les plus proches absents du catalogue sont sautés)
+TITLE_NEIGHBOURS = 20
+# Écart minimal entre deux rangs de titres avant de les renuméroter
+TITLE_RANK_MIN_GAP = 1e-6
+
+# Colonnes NumPy d'un instantané (les tags sont à part, dans TagBitmap)
+SNAPSHOT_COLUMNS = ['ids', 'public_type', 'state', 'is_saga', 'rating', 'release_date', 'trending', 'titles', 'title_rank']
+
+# Tables de liaison des tags : type -> (table, colonne du tag, modèle du tag)
+TAG_TABLES = {
+    'genre': (Book.genres.through, 'genre_id', Genre),
+    'theme': (Book.themes.through, 'theme_id', Theme),
+}
+
+# Champs triables dans le catalogue (ceux de BookListAllView.ordering_fields, après BookOrderingFilter)
+SORT_COLUMNS = {
+    'id': 'ids',
+    'pk': 'ids',
+    'release_date': 'release_date',
+    'rating': 'rating',
+    'title': 'title_rank',
+    'trending_score': 'trending',
+}
+
+
+def catalog_enabled():
+    return np is not None and getattr(settings, 'CATALOG_ENGINE', False)
+
+
+# Tags d'un livre stockés en masque de bits : une ligne par livre, un bit par tag (64 tags par mot)
+class TagBitmap:
+    def __init__(self, size):
+        self.bits = {}
+        self.names = []
+        self.matrix = np.zeros((size, 1), dtype=np.uint64)
+
+    def copy(self):
+        bitmap = TagBitmap(0)
+        bitmap.bits = dict(self.bits)
+        bitmap.names = list(self.names)
+        bitmap.matrix = self.matrix.copy()
+        return bitmap
+
+    def bit(self, tag_id, name):
+        if tag_id not in self.bits:
+            self.bits[tag_id] = len(self.names)
+            self.names.append(name.lower())
+            words = (len(self.names) + 63) // 64
+            if words > self.matrix.shape[1]:
+                self.matrix = np.pad(self.matrix, ((0, 0), (0, words - self.matrix.shape[1])))
+        return self.bits[tag_id]
+
+    def set_tags(self, rows, bits):
+        if not len(rows):
+            return
+        np.bitwise_or.at(self.matrix, (rows, (bits // 64).astype(np.intp)), np.left_shift(np.uint64(1), bits % np.uint64(64)))
+
+    # Lignes qui ont au moins un tag dont le nom contient le texte (même sens que name__icontains)
+    def matches(self, text):
+        mask = np.zeros(self.matrix.shape[1], dtype=np.uint64)
+        text = text.lower()
+        for bit, name in enumerate(self.names):
+            if text in name:
+                mask[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return (self.matrix & mask).any(axis=1)
+
+
+# Instantané des colonnes filtrables et triables de tous les livres, trié par id
+class CatalogSnapshot:
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.public_type = np.zeros(0, dtype=np.int32)
+        self.state = np.zeros(0, dtype=np.int32)
+        self.is_saga = np.zeros(0, dtype=bool)
+        self.rating = np.zeros(0, dtype=np.float64)
+        self.release_date = np.zeros(0, dtype=np.int64)
+        self.trending = np.zeros(0, dtype=np.float64)
+        # Rang de chaque titre dans l'ordre de la base (sa collation, celle du tri par titre de la requête ORM de getallbook) :
+        # trier des nombres est bien plus rapide que des chaînes. NaN : titre nouveau ou modifié, pas encore classé
+        self.titles = np.zeros(0, dtype=object)
+        self.title_rank = np.zeros(0, dtype=np.float64)
+        # Valeurs en minuscules -> code entier (public_type et state sont comparés en iexact)
+        self.codes = {'public_type': {}, 'state': {}}
+        self.tags = {kind: TagBitmap(0) for kind in TAG_TABLES}
+        self._reset_derived()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Données dérivées des colonnes, recalculées à la demande après chaque modification
+    def _reset_derived(self):
+        self._orders = {}
+
+    # Les livres sont lus dans l'ordre des titres de la base, qui donne directement leur rang
+    @classmethod
+    def load(cls):
+        snapshot = cls()
+        rows = list(Book.objects.visible().order_by('title', 'id').values_list(*BOOK_COLUMNS))
+        snapshot.upsert_rows(rows)
+        snapshot._set_title_ranks([(row[0], row[7]) for row in rows])
+        snapshot.load_tags(None)
+        return snapshot
+
+    # Rangs de tous les titres à partir de (id, titre) dans l'ordre de la base ; les livres absents gardent leur rang
+    def _set_title_ranks(self, ordered):
+        if not ordered:
+            return
+        ranks, rank, previous = [], -1, None
+        for _, title in ordered:
+            if title != previous:
+                rank, previous = rank + 1, title
+            ranks.append(rank)
+        positions, found = self._find(np.array([book_id for book_id, _ in ordered], dtype=np.int64))
+        self.title_rank[positions[found]] = np.array(ranks, dtype=np.float64)[found]
+
+    def copy(self):
+        snapshot = CatalogSnapshot()
+        for column in SNAPSHOT_COLUMNS:
+            setattr(snapshot, column, getattr(self, column).copy())
+        snapshot.codes = {field: dict(codes) for field, codes in self.codes.items()}
+        snapshot.tags = {kind: bitmap.copy() for kind, bitmap in self.tags.items()}
+        return snapshot
+
+    def _code(self, field, value):
+        codes = self.codes[field]
+        return codes.setdefault((value or '').lower(), len(codes))
+
+    # Ajoute ou remplace des livres (tuples dans l'ordre de BOOK_COLUMNS)
+    def upsert_rows(self, rows):
+        if not rows:
+            return
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        columns = {
+            'public_type': np.array([self._code('public_type', row[1]) for row in rows], dtype=np.int32),
+            'state': np.array([self._code('state', row[2]) for row in rows], dtype=np.int32),
+            'is_saga': np.array([row[3] for row in rows], dtype=bool),
+            'rating': np.array([row[4] for row in rows], dtype=np.float64),
+            'release_date': np.array([row[5].toordinal() for row in rows], dtype=np.int64),
+            'trending': np.array([row[6] for row in rows], dtype=np.float64),
+            'titles': np.array([row[7] for row in rows], dtype=object),
+        }
+
+        self._reset_derived()
+        positions, exists = self._find(ids)
+        # Un titre modifié perd son rang (voir rank_titles)
+        retitled = positions[exists][self.titles[positions[exists]] != columns['titles'][exists]]
+        self.title_rank[retitled] = np.nan
+        for column, values in columns.items():
+            getattr(self, column)[positions[exists]] = values[exists]
+
+        new = ~exists
+        if new.any():
+            self.ids = np.concatenate([self.ids, ids[new]])
+            for column, values in columns.items():
+                setattr(self, column, np.concatenate([getattr(self, column), values[new]]))
+            self.title_rank = np.concatenate([self.title_rank, np.full(int(new.sum()), np.nan)])
+            for bitmap in self.tags.values():
+                bitmap.matrix = np.concatenate([bitmap.matrix, np.zeros((int(new.sum()), bitmap.matrix.shape[1]), dtype=np.uint64)])
+            if (np.diff(self.ids) < 0).any():
+                self._take(np.argsort(self.ids, kind='stable'))
+
+    # Position de chaque id dans le tableau trié, et si l'id y est présent
+    def _find(self, book_ids):
+        positions = np.searchsorted(self.ids, book_ids)
+        found = np.zeros(len(book_ids), dtype=bool)
+        inside = positions < len(self.ids)
+        found[inside] = self.ids[positions[inside]] == book_ids[inside]
+        return positions, found
+
+    def remove(self, book_ids):
+        keep = ~np.isin(self.ids, np.array(list(book_ids), dtype=np.int64))
+        if not keep.all():
+            self._take(np.flatnonzero(keep))
+
+    def _take(self, index):
+        self._reset_derived()
+        for column in SNAPSHOT_COLUMNS:
+            setattr(self, column, getattr(self, column)[index])
+        for bitmap in self.tags.values():
+            bitmap.matrix = bitmap.matrix[index]
+
+    # (Re)charge les tags de certains livres (None = tous) depuis les tables de liaison
+    def load_tags(self, book_ids):
+        for kind, (through, tag_field, tag_model) in TAG_TABLES.items():
+            bitmap = self.tags[kind]
+            links = through.objects.all()
+            if book_ids is not None:
+                links = links.filter(book_id__in=book_ids)
+                rows, found = self._find(np.array(list(book_ids), dtype=np.int64))
+                bitmap.matrix[rows[found]] = 0
+            links = list(links.values_list('book_id', tag_field))
+            missing = {tag_id for _, tag_id in links if tag_id not in bitmap.bits}
+            for tag_id, name in tag_model.objects.filter(pk__in=missing).values_list('pk', 'name'):
+                bitmap.bit(tag_id, name)
+            links = [(book_id, bitmap.bits[tag_id]) for book_id, tag_id in links if tag_id in bitmap.bits]
+            if links:
+                rows, found = self._find(np.array([book_id for book_id, _ in links], dtype=np.int64))
+                bits = np.array([bit for _, bit in links], dtype=np.uint64)
+                bitmap.set_tags(rows[found], bits[found])
+
+    # Relit en base les livres modifiés : mis à jour s'ils existent encore, retirés sinon (ou s'ils sont en cours de suppression)
+    def apply_changes(self, book_ids):
+        book_ids = set(book_ids)
+        rows = list(Book.objects.visible().filter(pk__in=book_ids).values_list(*BOOK_COLUMNS))
+        self.remove(book_ids - {row[0] for row in rows})
+        self.upsert_rows(rows)
+        self.load_tags({row[0] for row in rows})
+        self.rank_titles()
+
+    # Classe les titres sans rang (livres ajoutés ou renommés) entre leurs voisins dans l'ordre de la base,
+    # lus par deux requêtes sur l'index du titre : les autres rangs ne bougent pas, rien n'est relu pour une note ou une tendance
+    def rank_titles(self):
+        missing = np.flatnonzero(np.isnan(self.title_rank))
+        if not len(missing):
+            return
+        ranked = ~np.isnan(self.title_rank)
+        known = dict(zip(self.titles[ranked], self.title_rank[ranked]))
+        try:
+            for position in missing:
+                self.title_rank[position] = self._rank_title(known, self.titles[position])
+        except LookupError:
+            # Aucun des voisins proches n'est dans le catalogue (modifications pas encore rejouées) : tous les rangs sont relus,
+            # les livres qui ne sont plus visibles en base (retirés au prochain passage) passent après les autres
+            self._set_title_ranks(list(Book.objects.visible().order_by('title', 'id').values_list('id', 'title')))
+            unranked = np.isnan(self.title_rank)
+            if unranked.any():
+                self.title_rank[unranked] = np.nanmax(self.title_rank, initial=-1) + 1
+
+    def _rank_title(self, known, title):
+        if title not in known:
+            lower = self._neighbour_rank(known, title, below=True)
+            upper = self._neighbour_rank(known, title, below=False)
+            if lower is not None and upper is not None and upper - lower < TITLE_RANK_MIN_GAP:
+                known.clear()
+                known.update(self._renumber_titles())
+                lower = self._neighbour_rank(known, title, below=True)
+                upper = self._neighbour_rank(known, title, below=False)
+            if lower is None and upper is None:
+                known[title] = 0.0
+            elif lower is None:
+                known[title] = upper - 1
+            elif upper is None:
+                known[title] = lower + 1
+            else:
+                known[title] = (lower + upper) / 2
+        return known[title]
+
+    # Rang du titre déjà classé le plus proche avant (ou après) title dans l'ordre de la base, None s'il n'y en a pas
+    # LookupError si les TITLE_NEIGHBOURS plus proches ne sont pas encore classés
+    def _neighbour_rank(self, known, title, below):
+        if below:
+            neighbours = Book.objects.visible().filter(title__lt=title).order_by('-title')
+        else:
+            neighbours = Book.objects.visible().filter(title__gt=title).order_by('title')
+        neighbours = list(neighbours.values_list('title', flat=True).distinct()[:TITLE_NEIGHBOURS])
+        for neighbour in neighbours:
+            if neighbour in known:
+                return known[neighbour]
+        if neighbours:
+            raise LookupError(title)
+        return None
+
+    # Remplace les rangs par des entiers consécutifs dans le même ordre (quand deux rangs voisins sont trop proches)
+    def _renumber_titles(self):
+        ranked = ~np.isnan(self.title_rank)
+        self.title_rank[ranked] = np.unique(self.title_rank[ranked], return_inverse=True)[1]
+        return dict(zip(self.titles[ranked], self.title_rank[ranked]))
+
+    def _tag_mask(self, kind, names, match):
+        masks = [self.tags[kind].matches(name) for name in names if name]
+        if not masks:
+            return None
+        combine = np.logical_and if match == 'all' else np.logical_or
+        return combine.reduce(masks)
+
+    # Ids des livres correspondant aux filtres (valeurs nettoyées par BookFilter), dans l'ordre demandé
+    # tags = {'genre': (noms, 'any'|'all'), 'theme': (...)}
+    def query(self, cleaned, tags, ordering):
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field in ['public_type', 'state']:
+            if cleaned.get(field):
+                code = self.codes[field].get(cleaned[field].lower())
+                mask &= getattr(self, field) == (code if code is not None else -1)
+        if cleaned.get('is_saga') is not None:
+            mask &= self.is_saga == cleaned['is_saga']
+        if cleaned.get('min_rating') is not None:
+            mask &= self.rating >= float(cleaned['min_rating'])
+        for kind, (names, match) in tags.items():
+            tag_mask = self._tag_mask(kind, names, match)
+            if tag_mask is not None:
+                mask &= tag_mask
+
+        order = self._order(ordering)
+        return self.ids[order[mask[order]]]
+
+    # Permutation de tous les livres dans l'ordre demandé, calculée une fois par tri et par instantané :
+    # une requête filtrée n'a plus qu'à garder les positions retenues, sans retrier
+    def _order(self, ordering):
+        key = tuple(ordering or [])
+        if key not in self._orders:
+            if len(self._orders) >= MAX_CACHED_ORDERS:
+                self._orders.clear()
+            # np.lexsort trie sur la dernière clé d'abord : on empile les clés à l'envers, l'id en dernier recours
+            keys = [self.ids]
+            for term in reversed(key):
+                values = getattr(self, SORT_COLUMNS[term.lstrip('-')])
+                keys.append(-values if term.startswith('-') else values)
+            self._orders[key] = np.lexsort(keys)
+        return self._orders[key]
+
+
+# Catalogue de ce processus : toutes les modifications du journal jusqu'à _sequence y sont appliquées,
+# ainsi que celles de _applied (plus récentes, rejouées tant qu'elles ont moins de CATALOG_GAP_TIMEOUT secondes)
+_snapshot = None
+_sequence = 0
+_applied = set()
+_synced_at = 0.0
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _reload():
+    global _snapshot, _sequence, _applied
+    settled = timezone.now() - timedelta(seconds=CATALOG_GAP_TIMEOUT)
+    sequence = CatalogChange.objects.filter(created_at__lt=settled).aggregate(last=Max('pk'))['last'] or 0
+    applied = set(CatalogChange.objects.filter(pk__gt=sequence).values_list('pk', flat=True))
+    _snapshot = CatalogSnapshot.load()
+    _sequence, _applied = sequence, applied
+
+
+# Avance le numéro de reprise jusqu'à la dernière modification assez ancienne pour qu'aucun numéro avant elle ne manque
+def _advance(changes):
+    global _sequence, _applied
+    settled = timezone.now() - timedelta(seconds=CATALOG_GAP_TIMEOUT)
+    _applied.update(pk for pk, _, _ in changes)
+    _sequence = max([_sequence] + [pk for pk, _, created_at in changes if created_at < settled])
+    _applied = {pk for pk in _applied if pk > _sequence}
+
+
+# Retourne le catalogue à jour : les modifications du journal sont rejouées (rechargement des seuls livres concernés),
+# ou tout est rechargé si le retard est trop grand ou qu'une mise à jour en masse a eu lieu
+def get_catalog():
+    global _snapshot, _synced_at, _checked_at
+    now = time.monotonic()
+    if _snapshot is not None and now - _checked_at < CATALOG_CHECK_INTERVAL:
+        return _snapshot
+
+    with _lock:
+        if _snapshot is not None and now - _checked_at < CATALOG_CHECK_INTERVAL:
+            return _snapshot
+        if _snapshot is None or time.time() - _synced_at > CATALOG_CHANGE_RETENTION - CATALOG_GAP_TIMEOUT:
+            _reload()
+        else:
+            changes = list(CatalogChange.objects.filter(pk__gt=_sequence).order_by('pk').values_list('pk', 'book_id', 'created_at')[:CATALOG_MAX_REPLAY + 1])
+            book_ids = {book_id for pk, book_id, _ in changes if pk not in _applied}
+            if len(changes) > CATALOG_MAX_REPLAY or None in book_ids:
+                _reload()
+            else:
+                if book_ids:
+                    # Copie modifiée puis remplacée : les requêtes en cours gardent l'ancien instantané
+                    snapshot = _snapshot.copy()
+                    snapshot.apply_changes(book_ids)
+                    _snapshot = snapshot
+                _advance(changes)
+        _synced_at = time.time()
+        _checked_at = now
+    return _snapshot
+
+
+# Enregistre les livres modifiés dans le journal partagé (à appeler après le commit)
+def record_book_changes(book_ids):
+    global _checked_at
+    if not catalog_enabled():
+        return
+    changes = CatalogChange.objects.bulk_create([CatalogChange(book_id=book_id) for book_id in book_ids])
+    if any(change.pk and change.pk % CATALOG_PURGE_EVERY == 0 for change in changes):
+        enqueue(purge_catalog_changes, dedup_key='catalog:purge')
+    _checked_at = 0.0
+
+
+# Force le rechargement complet dans tous les processus (après une mise à jour en masse)
+def invalidate_catalog():
+    global _checked_at
+    if not catalog_enabled():
+        return
+    CatalogChange.objects.create(book_id=None)
+    _checked_at = 0.0
+
+
+# Tâche : oublie les modifications du journal plus anciennes que CATALOG_CHANGE_RETENTION
+def purge_catalog_changes():
+    return CatalogChange.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=CATALOG_CHANGE_RETENTION)).delete()[0]
+
+
+# Ids des livres de getallbook calculés par le catalogue, ou None s'il faut passer par la base
+# (catalogue désactivé, recherche textuelle ?search=, ou paramètres invalides laissés à BookFilter)
+def catalog_book_ids(request, view):
+    if not catalog_enabled():
+        return None
+    params = request.query_params
+    if any(params.get(backend.search_param) for backend in view.filter_backends if hasattr(backend, 'search_param')):
+        return None
+
+    filterset = BookFilter(data=params, queryset=Book.objects.none(), request=request)
+    if not filterset.is_valid():
+        return None
+    ordering = BookOrderingFilter().get_ordering(request, view.get_queryset(), view)
+    if any(term.lstrip('-') not in SORT_COLUMNS for term in ordering or []):
+        return None
+
+    tags = {
+        'genre': (params.getlist('genre'), params.get('genre_match')),
+        'theme': (params.getlist('theme'), params.get('theme_match')),
+    }
+    return get_catalog().query(filterset.form.cleaned_data, tags, ordering)
+
+
+# Charge les livres d'une page en gardant l'ordre des ids
+def hydrate_books(queryset, book_ids):
+    book_ids = [int(book_id) for book_id in book_ids]
+    books = queryset.in_bulk(book_ids)
+    return [books[book_id] for book_id in book_ids if book_id in books]
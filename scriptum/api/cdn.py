@@ -0,0 +1,129 @@
+import logging
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+from .models import Book, Review, ChapterComment
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de clés par appel de purge (limite de l'API Fastly)
+PURGE_BATCH_SIZE = 256
+
+# Clés de cache des réponses publiques : chaque GET est étiqueté avec les clés des données qu'il affiche,
+# chaque écriture purge exactement les clés qu'elle modifie
+#   catalog                    getallbook
+#   author:<token>             getallauthorbook d'un auteur
+#   book:<slug>                getbookinfo
+#   book-all:<slug>            toutes les réponses d'un livre (purgée quand le livre lui-même change ou disparaît)
+#   reviews:<slug>             getallbookreviews
+#   toc:<slug>                 getallchapters (table des matières)
+#   chapter:<slug>/<chapitre>  getchapterinfo
+#   comments:<slug>/<chapitre> getallcomments
+#   characters:<slug>          getallcharacters, searchcharacters, charactergraph
+#   character:<slug>/<perso>   getcharacterinfo (de même places:/place: et creatures:/creature:)
+
+
+def book_keys(book):
+    return ['catalog', f"author:{book.author.token}", f"book:{book.slug}"]
+
+
+def book_all_keys(book):
+    return ['catalog', f"author:{book.author.token}", f"book-all:{book.slug}"]
+
+
+def chapter_keys(book, *chapter_slugs):
+    return book_keys(book) + [f"toc:{book.slug}"] + [f"chapter:{book.slug}/{slug}" for slug in chapter_slugs]
+
+
+# kind : 'character', 'place' ou 'creature'
+def worldbuilding_keys(kind, book, *slugs):
+    return [f"{kind}s:{book.slug}"] + [f"{kind}:{book.slug}/{slug}" for slug in slugs if slug]
+
+
+# Réponses qui affichent le nom d'auteur ou le pseudo d'un utilisateur (à calculer avant l'écriture)
+# deleted=True : ses livres, avis et commentaires disparaissent aussi (notes et compteurs de commentaires recalculés)
+def user_keys(user, deleted=False):
+    keys = ['catalog', f"author:{user.token}"]
+    for slug in Book.objects.filter(author=user).values_list('slug', flat=True):
+        keys.append(f"book-all:{slug}" if deleted else f"book:{slug}")
+    for slug, token in Review.objects.filter(user=user).values_list('book__slug', 'book__author__token'):
+        keys.append(f"reviews:{slug}")
+        if deleted:
+            keys += [f"book:{slug}", f"author:{token}"]
+    for book_slug, chapter_slug in ChapterComment.objects.filter(user=user).values_list('chapter__book__slug', 'chapter__slug'):
+        keys.append(f"comments:{book_slug}/{chapter_slug}")
+        if deleted:
+            keys += [f"toc:{book_slug}", f"chapter:{book_slug}/{chapter_slug}"]
+    return keys
+
+
+# Garde les purges en mémoire (développement et tests) : get_purger().purged contient la liste des clés de chaque appel
+class LocalPurger:
+    def __init__(self):
+        self.purged = []
+
+    def purge(self, keys):
+        self.purged.append(sorted(keys))
+
+    def clear(self):
+        self.purged = []
+
+
+# Purge par clés via l'API Fastly (CDN_PURGER=api.cdn.FastlyPurger, FASTLY_API_TOKEN et FASTLY_SERVICE_ID)
+class FastlyPurger:
+    url = "https://api.fastly.com/service/{service_id}/purge"
+
+    def purge(self, keys):
+        keys = sorted(keys)
+        for start in range(0, len(keys), PURGE_BATCH_SIZE):
+            response = requests.post(
+                self.url.format(service_id=settings.FASTLY_SERVICE_ID),
+                headers={'Fastly-Key': settings.FASTLY_API_TOKEN, 'Surrogate-Key': ' '.join(keys[start:start + PURGE_BATCH_SIZE])},
+                timeout=5,
+            )
+            response.raise_for_status()
+
+
+_purger = None
+
+
+def get_purger():
+    global _purger
+    if _purger is None:
+        _purger = import_string(settings.CDN_PURGER)()
+    return _purger
+
+
+# Purge les clés une fois la transaction validée ; une erreur du CDN ne fait jamais échouer l'écriture
+def purge_surrogate_keys(keys):
+    keys = set(keys)
+    if not keys:
+        return
+
+    def send():
+        try:
+            get_purger().purge(keys)
+        except Exception:
+            logger.exception("Échec de la purge CDN : %s", ' '.join(sorted(keys)))
+
+    transaction.on_commit(send)
+
+
+# Ajoute Cache-Control et Surrogate-Key aux réponses GET publiques réussies
+# surrogate_keys contient des gabarits remplis avec les paramètres de l'URL, ex: ['chapter:{slug_book}/{slug_chapter}']
+class SurrogateKeyMixin:
+    surrogate_keys = []
+
+    def get_surrogate_keys(self):
+        return [key.format(**self.kwargs) for key in self.surrogate_keys]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and 200 <= response.status_code < 300:
+            response['Cache-Control'] = f"public, max-age={settings.CDN_BROWSER_MAX_AGE}, s-maxage={settings.CDN_EDGE_MAX_AGE}"
+            response[settings.CDN_SURROGATE_KEY_HEADER] = ' '.join(self.get_surrogate_keys())
+            # Le format dépend de l'en-tête Accept (JSON ou MessagePack)
+            patch_vary_headers(response, ['Accept'])
+        return response
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models import Case, When, Value, F, CharField, IntegerField
+from django.utils.text import slugify
+from .models import Chapter, CHAPTER_POSITION_STEP
+
+
+# Numéros des chapitres de type "chapitre" dans le nouvel ordre (pks), et le slug qui va avec
+# Retourne {pk: (numéro, slug)} pour les chapitres dont le numéro ou le slug change
+def _renumbering(book, order):
+    chapters = {pk: (slug, number) for pk, slug, number in Chapter.objects.filter(book=book, type='chapitre').values_list('pk', 'slug', 'chapter_number')}
+    changes = {}
+    for number, pk in enumerate([pk for pk in order if pk in chapters], start=1):
+        slug = slugify(f"chapitre-{number}")
+        if chapters[pk] != (slug, number):
+            changes[pk] = (number, slug)
+    return changes
+
+
+# Applique des positions {pk: position} et des numéros {pk: (numéro, slug)} en une seule requête UPDATE ... CASE
+def _bulk_set_positions(positions, numbers=None):
+    numbers = numbers or {}
+    if not positions and not numbers:
+        return
+    fields = {}
+    if positions:
+        fields['position'] = Case(
+            *[When(pk=pk, then=Value(position)) for pk, position in positions.items()],
+            default=F('position'), output_field=IntegerField(),
+        )
+    if numbers:
+        # Deux chapitres qui échangent leur numéro échangent aussi leur slug : les slugs sont d'abord libérés (contrainte d'unicité)
+        Chapter.objects.filter(pk__in=numbers.keys()).update(
+            slug=Case(*[When(pk=pk, then=Value(f"reorder-{pk}")) for pk in numbers], output_field=CharField()),
+        )
+        fields['chapter_number'] = Case(
+            *[When(pk=pk, then=Value(number)) for pk, (number, _) in numbers.items()],
+            default=F('chapter_number'), output_field=IntegerField(),
+        )
+        fields['slug'] = Case(
+            *[When(pk=pk, then=Value(slug)) for pk, (_, slug) in numbers.items()],
+            default=F('slug'), output_field=CharField(),
+        )
+    Chapter.objects.filter(pk__in=set(positions) | set(numbers)).update(**fields)
+
+
+# Chapitres d'un livre dans leur ordre actuel : liste de (pk, slug, position, sort_order)
+# Les lignes sont verrouillées jusqu'à la fin de la transaction : deux réorganisations simultanées ne mélangent pas
+# leurs positions, ni les slugs temporaires de la renumérotation
+def _current_order(book):
+    chapters = Chapter.objects.select_for_update().filter(book=book).order_by('sort_order', 'position', 'chapter_number')
+    return list(chapters.values_list('pk', 'slug', 'position', 'sort_order'))
+
+
+# Le prologue reste avant les chapitres et l'épilogue après : l'ordre demandé doit respecter l'ordre des types
+def _check_type_order(sort_orders):
+    if any(previous > following for previous, following in zip(sort_orders, sort_orders[1:])):
+        raise ValueError("Le prologue doit rester avant les chapitres et l'épilogue après.")
+
+
+# Réordonne tous les chapitres d'un livre selon la liste de slugs donnée
+# Les chapitres sont renumérotés dans le même UPDATE (1, 2, 3... dans le nouvel ordre) et leur slug suit leur numéro :
+# l'adresse publique d'un chapitre déplacé change, comme celle de chaque chapitre dont le numéro change
+def reorder_chapters(book, slugs):
+    if not isinstance(slugs, list) or not all(isinstance(slug, str) for slug in slugs):
+        raise ValueError("'chapters' doit être une liste de slugs de chapitres.")
+
+    with transaction.atomic():
+        chapters = {slug: (pk, sort_order) for pk, slug, position, sort_order in _current_order(book)}
+        if len(slugs) != len(set(slugs)) or set(slugs) != set(chapters):
+            raise ValueError("La liste doit contenir chaque chapitre du livre exactement une fois.")
+        _check_type_order([chapters[slug][1] for slug in slugs])
+        order = [chapters[slug][0] for slug in slugs]
+        _bulk_set_positions(
+            {pk: (index + 1) * CHAPTER_POSITION_STEP for index, pk in enumerate(order)},
+            _renumbering(book, order),
+        )
+
+
+# Déplace un chapitre juste avant ou juste après un autre ; seule sa ligne est modifiée tant qu'il reste de la place entre les positions
+# (et que les numéros des chapitres qu'il saute ne changent pas)
+def move_chapter(book, slug, before=None, after=None):
+    if (before is None) == (after is None):
+        raise ValueError("Il faut préciser soit 'before', soit 'after'.")
+    if not isinstance(slug, str) or not isinstance(before if before is not None else after, str):
+        raise ValueError("'chapter', 'before' et 'after' doivent être des slugs de chapitres.")
+
+    with transaction.atomic():
+        current = _current_order(book)
+        order = [chapter for chapter in current if chapter[1] != slug]
+        slugs = [chapter[1] for chapter in order]
+        moved = next((chapter for chapter in current if chapter[1] == slug), None)
+        target = before if before is not None else after
+        if moved is None or target not in slugs:
+            raise ValueError("Chapitre introuvable.")
+
+        index = slugs.index(target) if before is not None else slugs.index(target) + 1
+        _check_type_order([chapter[3] for chapter in order[:index]] + [moved[3]] + [chapter[3] for chapter in order[index:]])
+        moved = moved[0]
+        previous_position = order[index - 1][2] if index > 0 else 0
+        next_position = order[index][2] if index < len(order) else previous_position + 2 * CHAPTER_POSITION_STEP
+        numbers = _renumbering(book, [chapter[0] for chapter in order[:index]] + [moved] + [chapter[0] for chapter in order[index:]])
+
+        # Plus de place entre les deux voisins : on réespace tout le livre (un seul UPDATE)
+        if next_position - previous_position < 2:
+            positions = {chapter[0]: (i + 1) * CHAPTER_POSITION_STEP for i, chapter in enumerate(order[:index])}
+            positions[moved] = (index + 1) * CHAPTER_POSITION_STEP
+            positions.update({chapter[0]: (i + 2) * CHAPTER_POSITION_STEP for i, chapter in enumerate(order[index:], start=index)})
+            _bulk_set_positions(positions, numbers)
+        else:
+            _bulk_set_positions({moved: (previous_position + next_position) // 2}, numbers)
+
+
+# Table des matières allégée (slug, titre, position) après réorganisation
+def chapter_positions(book):
+    return list(Chapter.objects.filter(book=book).order_by('sort_order', 'position', 'chapter_number').values('slug', 'title', 'type', 'chapter_number', 'position'))
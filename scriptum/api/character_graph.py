@@ -0,0 +1,159 @@
+import re
+from collections import deque
+from django.core.cache import cache
+from django.db import transaction
+from .models import Character, CharacterRelation
+
+# Durée de vie du graphe dans le cache partagé (il est aussi invalidé à chaque modification de personnage, pour tous les processus)
+CHARACTER_GRAPH_CACHE_TIMEOUT = 60 * 60
+
+NAME_KEYS = ['name', 'nom', 'character', 'personnage']
+RELATION_KEYS = ['relation', 'lien', 'role', 'type']
+
+# "Aria (soeur)" -> nom "Aria", lien "soeur"
+NAME_WITH_RELATION = re.compile(r'^(?P<name>.+?)\s*\((?P<relation>[^)]*)\)\s*$')
+
+
+# Extrait les couples (nom, lien) du champ family d'un personnage
+def extract_relations(family):
+    if not family:
+        return []
+    items = family if isinstance(family, list) else [family]
+    relations = []
+    for item in items:
+        name, relation = None, ''
+        if isinstance(item, dict):
+            name = next((item[key] for key in NAME_KEYS if item.get(key)), None)
+            relation = next((item[key] for key in RELATION_KEYS if item.get(key)), '')
+        elif isinstance(item, str):
+            match = NAME_WITH_RELATION.match(item.strip())
+            name, relation = (match.group('name'), match.group('relation')) if match else (item, '')
+        if isinstance(name, str) and name.strip():
+            relations.append((name.strip()[:200], str(relation).strip()[:50]))
+    return relations
+
+
+# Reconstruit les liens sortants d'un personnage et rattache les liens qui le visaient par son nom
+def index_character_relations(character):
+    relations = extract_relations(character.family)
+    names = {name.lower() for name, _ in relations}
+    targets = {}
+    if names:
+        for pk, name in Character.objects.filter(book_id=character.book_id).values_list('pk', 'name'):
+            if name.lower() in names:
+                targets[name.lower()] = pk
+
+    with transaction.atomic():
+        CharacterRelation.objects.filter(source=character).delete()
+        CharacterRelation.objects.bulk_create([
+            CharacterRelation(book_id=character.book_id, source=character, target_id=targets.get(name.lower()), target_name=name, relation=relation)
+            for name, relation in relations
+        ])
+        CharacterRelation.objects.filter(book_id=character.book_id, target__isnull=True, target_name__iexact=character.name).update(target=character)
+
+
+def character_graph_cache_key(book_id):
+    return f"character_graph:{book_id}"
+
+
+# Invalidé une fois la transaction validée : un graphe reconstruit entre-temps lirait encore les anciens personnages
+def invalidate_character_graph(book_id):
+    transaction.on_commit(lambda: cache.delete(character_graph_cache_key(book_id)))
+
+
+# Construit le graphe d'un livre : noeuds, arêtes, liste d'adjacence (non orientée), degrés et composantes connexes
+def build_character_graph(book_id):
+    nodes = {pk: {'slug': slug, 'name': name, 'role': role} for pk, slug, name, role in Character.objects.filter(book_id=book_id).values_list('pk', 'slug', 'name', 'role')}
+    adjacency = {pk: set() for pk in nodes}
+    edges = []
+    for source, target, relation in CharacterRelation.objects.filter(book_id=book_id, target__isnull=False).values_list('source_id', 'target_id', 'relation'):
+        if source == target or source not in nodes or target not in nodes:
+            continue
+        edges.append({'source': nodes[source]['slug'], 'target': nodes[target]['slug'], 'relation': relation})
+        adjacency[source].add(target)
+        adjacency[target].add(source)
+
+    # Composantes connexes par parcours en largeur
+    components = {}
+    component_count = 0
+    for start in nodes:
+        if start in components:
+            continue
+        components[start] = component_count
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for neighbour in adjacency[current]:
+                if neighbour not in components:
+                    components[neighbour] = component_count
+                    queue.append(neighbour)
+        component_count += 1
+
+    for pk, node in nodes.items():
+        node['degree'] = len(adjacency[pk])
+        node['component'] = components[pk]
+
+    return {
+        'nodes': nodes,
+        'slugs': {node['slug']: pk for pk, node in nodes.items()},
+        'adjacency': {pk: sorted(neighbours) for pk, neighbours in adjacency.items()},
+        'edges': edges,
+        'components': component_count,
+    }
+
+
+# Retourne le graphe depuis le cache, ou le construit si besoin
+def get_character_graph(book_id):
+    key = character_graph_cache_key(book_id)
+    graph = cache.get(key)
+    if graph is None:
+        graph = build_character_graph(book_id)
+        cache.set(key, graph, CHARACTER_GRAPH_CACHE_TIMEOUT)
+    return graph
+
+
+# Plus court chemin entre deux personnages (liste de slugs), None s'ils ne sont pas reliés
+def shortest_path(graph, from_slug, to_slug):
+    start = graph['slugs'].get(from_slug)
+    goal = graph['slugs'].get(to_slug)
+    if start is None or goal is None:
+        return None
+    if graph['nodes'][start]['component'] != graph['nodes'][goal]['component']:
+        return None
+
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        current = queue.popleft()
+        if current == goal:
+            break
+        for neighbour in graph['adjacency'][current]:
+            if neighbour not in parents:
+                parents[neighbour] = current
+                queue.append(neighbour)
+
+    path = []
+    current = goal
+    while current is not None:
+        path.append(graph['nodes'][current]['slug'])
+        current = parents[current]
+    return list(reversed(path))
+
+
+# Recalcule tous les liens entre personnages, livre par livre
+def rebuild_character_relations():
+    CharacterRelation.objects.all().delete()
+    total = 0
+    book_ids = Character.objects.order_by().values_list('book_id', flat=True).distinct()
+    for book_id in book_ids:
+        characters = list(Character.objects.filter(book_id=book_id).only('pk', 'name', 'family'))
+        targets = {character.name.lower(): character.pk for character in characters}
+        relations = [
+            CharacterRelation(book_id=book_id, source_id=character.pk, target_id=targets.get(name.lower()), target_name=name, relation=relation)
+            for character in characters
+            for name, relation in extract_relations(character.family)
+        ]
+        CharacterRelation.objects.bulk_create(relations, batch_size=500)
+        invalidate_character_graph(book_id)
+        total += len(relations)
+    return total
@@ -0,0 +1,119 @@
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from .models import Character, CharacterAttribute
+
+# Champs JSON des personnages sur lesquels on peut filtrer et compter les valeurs
+CHARACTER_FACET_FIELDS = ['traits', 'languages', 'studies', 'job', 'family', 'addictions', 'fears', 'talents']
+
+# Taille maximale d'une valeur indexée (longueur de CharacterAttribute.value)
+MAX_VALUE_LENGTH = 100
+
+
+# Forme indexée d'une valeur (chaîne ou nombre) : texte sans espaces autour, tronqué ; None si elle n'est pas indexée
+# Sert aussi bien à l'index qu'aux valeurs des filtres, pour que les deux se comparent de la même façon
+def normalize_value(item):
+    if isinstance(item, bool) or not isinstance(item, (str, int, float)):
+        return None
+    return str(item).strip()[:MAX_VALUE_LENGTH] or None
+
+
+# Extrait les valeurs textuelles d'un champ JSON : une chaîne, ou une liste de chaînes/nombres
+# Les objets (ex: membres de la famille détaillés) ne sont pas indexés
+def extract_values(data):
+    if data is None:
+        return []
+    items = data if isinstance(data, list) else [data]
+    values = []
+    for item in items:
+        value = normalize_value(item)
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+# Retire les espaces autour des chaînes d'un champ JSON (enregistré tel qu'il sera indexé et filtré)
+def strip_values(data):
+    if isinstance(data, str):
+        return data.strip()
+    if isinstance(data, list):
+        return [item.strip() if isinstance(item, str) else item for item in data]
+    return data
+
+
+# Valeurs JSON dont la forme indexée est value : la chaîne, et le nombre si elle en représente un ("3" -> "3" ou 3)
+def _json_candidates(value):
+    candidates = [value]
+    for number_type in (int, float):
+        try:
+            number = number_type(value)
+        except ValueError:
+            continue
+        if str(number) == value:
+            candidates.append(number)
+    return candidates
+
+
+# Met à jour les lignes d'index d'un personnage (appelée après chaque sauvegarde)
+def index_character(character):
+    attributes = [
+        CharacterAttribute(character=character, book_id=character.book_id, field=field, value=value)
+        for field in CHARACTER_FACET_FIELDS
+        for value in extract_values(getattr(character, field))
+    ]
+    with transaction.atomic():
+        CharacterAttribute.objects.filter(character=character).delete()
+        CharacterAttribute.objects.bulk_create(attributes)
+
+
+# Filtre les personnages d'un livre : filters = {champ: [valeurs]}, toutes les valeurs doivent être présentes
+# PostgreSQL utilise les index GIN (containment @>), les autres bases passent par la table CharacterAttribute
+def filter_characters(queryset, book, filters):
+    for field, values in filters.items():
+        for value in values:
+            value = normalize_value(value)
+            if value is None:
+                return queryset.none()
+            if connection.vendor == 'postgresql':
+                matches = Q()
+                for candidate in _json_candidates(value):
+                    matches |= Q(**{f"{field}__contains": candidate})
+                queryset = queryset.filter(matches)
+            else:
+                matching = CharacterAttribute.objects.filter(book=book, field=field, value=value).values('character_id')
+                queryset = queryset.filter(pk__in=matching)
+    return queryset
+
+
+# Compte, en une requête groupée, le nombre de personnages par valeur pour chaque champ
+def character_facets(queryset):
+    facets = defaultdict(dict)
+    rows = (
+        CharacterAttribute.objects.filter(character__in=queryset.values('pk'))
+        .values_list('field', 'value')
+        .annotate(total=Count('character', distinct=True))
+        .order_by('field', '-total', 'value')
+    )
+    for field, value, total in rows:
+        facets[field][value] = total
+    return {field: facets.get(field, {}) for field in CHARACTER_FACET_FIELDS}
+
+
+# Recalcule l'index de tous les personnages, par lots
+def rebuild_character_index(chunk_size=500):
+    total = 0
+    batch = []
+    CharacterAttribute.objects.all().delete()
+    characters = Character.objects.only('pk', 'book_id', *CHARACTER_FACET_FIELDS).order_by('pk').iterator(chunk_size=chunk_size)
+    for character in characters:
+        batch.extend(
+            CharacterAttribute(character_id=character.pk, book_id=character.book_id, field=field, value=value)
+            for field in CHARACTER_FACET_FIELDS
+            for value in extract_values(getattr(character, field))
+        )
+        total += 1
+        if len(batch) >= chunk_size:
+            CharacterAttribute.objects.bulk_create(batch)
+            batch = []
+    CharacterAttribute.objects.bulk_create(batch)
+    return total
@@ -0,0 +1,87 @@
+import atexit
+import threading
+from collections import Counter
+from django.db import connection
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+from .models import Book, Chapter
+
+# Les vues sont comptées par les routes viewbook/ et viewchapter/ (les pages elles-mêmes sont servies par le CDN)
+# Les vues sont comptées en mémoire et écrites en base au plus une fois par intervalle et par processus :
+# un arrêt brutal perd au plus VIEW_FLUSH_INTERVAL secondes de vues
+VIEW_FLUSH_INTERVAL = 10
+# Nombre de lignes par UPDATE ... CASE
+VIEW_FLUSH_BATCH_SIZE = 500
+
+COUNTED_MODELS = {'book': Book, 'chapter': Chapter}
+
+# Vues en attente de ce processus, par type puis par id
+_pending = {kind: Counter() for kind in COUNTED_MODELS}
+_lock = threading.Lock()
+_timer = None
+
+
+def record_book_view(book_id):
+    _increment([('book', book_id)])
+
+
+# La vue d'un chapitre compte aussi pour son livre
+def record_chapter_view(chapter_id, book_id):
+    _increment([('chapter', chapter_id), ('book', book_id)])
+
+
+def _increment(items):
+    global _timer
+    with _lock:
+        for kind, pk in items:
+            _pending[kind][pk] += 1
+        if _timer is None:
+            _timer = threading.Timer(VIEW_FLUSH_INTERVAL, _run_scheduled_flush)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _run_scheduled_flush():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush_view_counts()
+    finally:
+        connection.close()
+
+
+# Écrit les vues en attente : un UPDATE par lot, view_count = view_count + CASE id WHEN ... THEN ... END
+# Les incréments sont relatifs, chaque processus peut donc écrire son propre tampon sans coordination
+# Les vues ne sont pas journalisées pour le catalogue en mémoire : le tri par vues passe par la base
+def flush_view_counts():
+    with _lock:
+        pending = {kind: counts for kind, counts in _pending.items() if counts}
+        for kind in pending:
+            _pending[kind] = Counter()
+
+    batches = []
+    for kind, counts in pending.items():
+        items = list(counts.items())
+        batches += [(kind, items[start:start + VIEW_FLUSH_BATCH_SIZE]) for start in range(0, len(items), VIEW_FLUSH_BATCH_SIZE)]
+
+    for position, (kind, batch) in enumerate(batches):
+        increment = Case(*[When(pk=pk, then=Value(count)) for pk, count in batch], output_field=PositiveBigIntegerField())
+        try:
+            COUNTED_MODELS[kind].objects.filter(pk__in=[pk for pk, _ in batch]).update(view_count=F('view_count') + increment)
+        except Exception:
+            # Les lots non écrits retournent dans le tampon pour le prochain passage
+            with _lock:
+                for kind, batch in batches[position:]:
+                    _pending[kind].update(dict(batch))
+            raise
+
+    return sum(sum(counts.values()) for counts in pending.values())
+
+
+# Dernière écriture à l'arrêt normal du processus
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush_view_counts()
+    except Exception:
+        pass
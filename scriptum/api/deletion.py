@@ -0,0 +1,251 @@
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import (
+    User, Book, Review, ReviewHistogram, Chapter, ChapterRevision, ChapterComment, Character, CharacterAttribute,
+    CharacterRelation, Place, Creature, Favorite, FollowedAuthor, ReadingProgress, Notification, InboxEntry, SearchEntry, DeletionJob,
+)
+from .cdn import purge_surrogate_keys, user_keys, book_all_keys
+from .catalog import record_book_changes
+from .facets import invalidate_book_facets
+from .autocomplete import invalidate_autocomplete
+from .stats import invalidate_author_stats
+from .trending import mark_books_active
+from .ratings import schedule_rating_update
+from .jobs import enqueue
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Nombre de lignes supprimées par requête (chaque lot est une transaction courte)
+DELETION_BATCH_SIZE = 500
+# Nombre de livres traités ensemble lors de la suppression d'un compte
+DELETION_BOOK_BATCH_SIZE = 50
+
+# Livres et chapitres dont les recalculs (note, totaux de lecture, compteurs...) sont ignorés par les signaux de ce thread
+_suppressed = threading.local()
+
+
+@contextmanager
+def suppress_updates(book_ids=(), chapter_ids=()):
+    previous = (getattr(_suppressed, 'book_ids', frozenset()), getattr(_suppressed, 'chapter_ids', frozenset()))
+    _suppressed.book_ids, _suppressed.chapter_ids = frozenset(book_ids), frozenset(chapter_ids)
+    try:
+        yield
+    finally:
+        _suppressed.book_ids, _suppressed.chapter_ids = previous
+
+
+def updates_suppressed(book_id=None, chapter_id=None):
+    return book_id in getattr(_suppressed, 'book_ids', ()) or chapter_id in getattr(_suppressed, 'chapter_ids', ())
+
+
+# Pic de mémoire du processus depuis son démarrage, en Ko (indisponible sous Windows)
+def memory_peak():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _hide_books(book_ids):
+    transaction.on_commit(lambda: record_book_changes(book_ids))
+    transaction.on_commit(invalidate_book_facets)
+    invalidate_autocomplete()
+
+
+# Masque le compte et ses livres tout de suite, puis lance la suppression en arrière-plan
+def schedule_user_deletion(user):
+    keys = user_keys(user, deleted=True)
+    now = timezone.now()
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(deleted_at=now)
+        book_ids = list(Book.objects.filter(author=user).values_list('pk', flat=True))
+        Book.objects.filter(pk__in=book_ids).update(deleted_at=now)
+        job = DeletionJob.objects.create(kind='user', object_id=user.pk, label=user.pseudo)
+        _hide_books(book_ids)
+        purge_surrogate_keys(keys)
+        start_deletion_job(job)
+    return job
+
+
+def schedule_book_deletion(book):
+    keys = book_all_keys(book)
+    with transaction.atomic():
+        Book.objects.filter(pk=book.pk).update(deleted_at=timezone.now())
+        job = DeletionJob.objects.create(kind='book', object_id=book.pk, label=book.slug)
+        _hide_books([book.pk])
+        # update() ne déclenche pas les signaux : les statistiques de l'auteur sont invalidées ici
+        transaction.on_commit(lambda: invalidate_author_stats(book.author_id))
+        purge_surrogate_keys(keys)
+        start_deletion_job(job)
+    return job
+
+
+# La suppression est une tâche de fond : un worker la reprend là où elle s'était arrêtée en cas d'erreur ou de redémarrage
+def start_deletion_job(job):
+    enqueue(run_deletion_task, {'job_id': job.pk}, dedup_key=f"deletion:{job.pk}")
+
+
+def run_deletion_task(job_id):
+    run_deletion_job(job_id, resume=True)
+
+
+# Exécute une suppression en attente (ou reprend une suppression interrompue ou échouée si resume=True)
+# Chaque étape relit ce qui reste à supprimer : relancer une suppression interrompue est sans risque
+def run_deletion_job(job_id, resume=False, on_progress=None):
+    statuses = ['pending', 'running', 'failed'] if resume else ['pending']
+    if not DeletionJob.objects.filter(pk=job_id, status__in=statuses).update(status='running', updated_at=timezone.now()):
+        return None
+
+    job = DeletionJob.objects.get(pk=job_id)
+    runner = DeletionRunner(job, on_progress)
+    try:
+        if job.kind == 'user':
+            runner.delete_user(job.object_id)
+        else:
+            runner.delete_books([job.object_id])
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    runner.record_memory_growth()
+    job.save(update_fields=['status', 'finished_at', 'memory_growth', 'updated_at'])
+    return job
+
+
+# Suppressions en attente, et suppressions "en cours" sans progression depuis stale_after (processus arrêté)
+def pending_deletion_jobs(stale_after=timedelta(minutes=10)):
+    return DeletionJob.objects.filter(status='pending') | DeletionJob.objects.filter(status='running', updated_at__lt=timezone.now() - stale_after)
+
+
+class DeletionRunner:
+    def __init__(self, job, on_progress=None):
+        self.job = job
+        self.on_progress = on_progress
+        # ru_maxrss ne redescend jamais : seule sa hausse depuis le début de la suppression est attribuable à celle-ci
+        self.memory_baseline = memory_peak()
+
+    # Garde la plus forte hausse observée, y compris lors d'une exécution précédente de la même suppression
+    def record_memory_growth(self):
+        if self.memory_baseline is None:
+            return
+        growth = memory_peak() - self.memory_baseline
+        self.job.memory_growth = max(self.job.memory_growth or 0, growth)
+
+    # Supprime les lignes du queryset par lots de DELETION_BATCH_SIZE, en enregistrant la progression après chaque lot
+    def delete_batches(self, queryset):
+        model = queryset.model
+        name = model._meta.model_name
+        while True:
+            ids = list(queryset.values_list('pk', flat=True)[:DELETION_BATCH_SIZE])
+            if not ids:
+                return
+            with transaction.atomic():
+                model.objects.filter(pk__in=ids).delete()
+            self.job.progress[name] = self.job.progress.get(name, 0) + len(ids)
+            self.job.deleted += len(ids)
+            self.record_memory_growth()
+            self.job.save(update_fields=['progress', 'deleted', 'memory_growth', 'updated_at'])
+            if self.on_progress:
+                self.on_progress(self.job)
+
+    def estimate(self, querysets):
+        self.job.total = self.job.deleted + sum(queryset.count() for queryset in querysets)
+        self.job.save(update_fields=['total', 'updated_at'])
+
+    def _book_querysets(self, book_ids):
+        chapters = Chapter.objects.filter(book_id__in=book_ids)
+        return [
+            ReadingProgress.objects.filter(book_id__in=book_ids),
+            InboxEntry.objects.filter(notification__book_id__in=book_ids),
+            Notification.objects.filter(book_id__in=book_ids),
+            SearchEntry.objects.filter(book_id__in=book_ids),
+            ChapterComment.objects.filter(chapter__in=chapters),
+            ChapterRevision.objects.filter(chapter__in=chapters),
+            chapters,
+            Review.objects.filter(book_id__in=book_ids),
+            ReviewHistogram.objects.filter(book_id__in=book_ids),
+            Favorite.objects.filter(book_id__in=book_ids),
+            CharacterRelation.objects.filter(book_id__in=book_ids),
+            CharacterAttribute.objects.filter(book_id__in=book_ids),
+            Character.objects.filter(book_id__in=book_ids),
+            Place.objects.filter(book_id__in=book_ids),
+            Creature.objects.filter(book_id__in=book_ids),
+            Book.objects.filter(pk__in=book_ids),
+        ]
+
+    # Supprime des livres en commençant par les tables les plus profondes : chaque .delete() n'a plus rien à cascader
+    # Les signaux ne recalculent ni les notes ni les totaux de livres qui vont disparaître
+    def delete_books(self, book_ids, estimate=True):
+        if estimate:
+            self.estimate(self._book_querysets(book_ids))
+
+        with suppress_updates(book_ids=book_ids):
+            # Progressions de lecture et notifications d'abord : supprimer les chapitres n'a plus rien à cascader
+            self.delete_batches(ReadingProgress.objects.filter(book_id__in=book_ids))
+            self.delete_batches(InboxEntry.objects.filter(notification__book_id__in=book_ids))
+            self.delete_batches(Notification.objects.filter(book_id__in=book_ids))
+            # Commentaires et révisions chapitre par chapitre, pour ne jamais charger tous les commentaires d'un coup
+            chapter_ids = Chapter.objects.filter(book_id__in=book_ids).order_by('pk').values_list('pk', flat=True)
+            while True:
+                batch = list(chapter_ids[:DELETION_BATCH_SIZE])
+                if not batch:
+                    break
+                with suppress_updates(book_ids=book_ids, chapter_ids=batch):
+                    self.delete_batches(ChapterComment.objects.filter(chapter_id__in=batch))
+                    self.delete_batches(ChapterRevision.objects.filter(chapter_id__in=batch))
+                    self.delete_batches(Chapter.objects.filter(pk__in=batch))
+
+            for queryset in self._book_querysets(book_ids):
+                self.delete_batches(queryset)
+
+    # Livres notés ou mis en favori par l'utilisateur, relevés au premier démarrage et conservés dans la progression :
+    # une reprise après la suppression de ses avis ou favoris retrouve les livres à recalculer
+    def affected_books(self, user_id):
+        if 'reviewed_books' not in self.job.progress:
+            self.job.progress['reviewed_books'] = list(Review.objects.filter(user_id=user_id).values_list('book_id', flat=True).distinct())
+            self.job.progress['favorited_books'] = list(Favorite.objects.filter(user_id=user_id).values_list('book_id', flat=True).distinct())
+            self.job.save(update_fields=['progress', 'updated_at'])
+        return set(self.job.progress['reviewed_books']), set(self.job.progress['favorited_books'])
+
+    # Supprime les livres de l'auteur, puis ses avis, commentaires, favoris et suivis, puis le compte
+    def delete_user(self, user_id):
+        reviewed, favorited = self.affected_books(user_id)
+        books = Book.objects.filter(author_id=user_id).order_by('pk').values_list('pk', flat=True)
+        user_querysets = [
+            Review.objects.filter(user_id=user_id),
+            ChapterComment.objects.filter(user_id=user_id),
+            Favorite.objects.filter(user_id=user_id),
+            ReadingProgress.objects.filter(user_id=user_id),
+            InboxEntry.objects.filter(user_id=user_id),
+            FollowedAuthor.objects.filter(user_id=user_id),
+            FollowedAuthor.objects.filter(author_id=user_id),
+            User.objects.filter(pk=user_id),
+        ]
+        self.estimate(self._book_querysets(Book.objects.filter(author_id=user_id).values('pk')) + user_querysets)
+
+        while True:
+            book_ids = list(books[:DELETION_BOOK_BATCH_SIZE])
+            if not book_ids:
+                break
+            self.delete_books(book_ids, estimate=False)
+
+        # Les notes des livres des autres auteurs sont recalculées une seule fois par livre, à la fin
+        with suppress_updates(book_ids=reviewed | favorited):
+            for queryset in user_querysets:
+                self.delete_batches(queryset)
+
+        for book_id in Book.objects.filter(pk__in=reviewed).values_list('pk', flat=True):
+            schedule_rating_update(book_id)
+            ReviewHistogram.rebuild(book_id)
+        mark_books_active(pk__in=reviewed | favorited)
+        for author_id in set(Book.objects.filter(pk__in=reviewed | favorited).values_list('author_id', flat=True)):
+            invalidate_author_stats(author_id)
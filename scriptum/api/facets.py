@@ -0,0 +1,68 @@
+import hashlib
+import uuid
+from django.core.cache import cache
+from django.db.models import Count
+from .models import Book
+
+# Durée de vie des compteurs en cache (ils sont aussi invalidés à chaque modification de livre)
+BOOK_FACETS_CACHE_TIMEOUT = 60 * 10
+BOOK_FACETS_GENERATION_KEY = "book_facets:generation"
+
+# Champs d'un livre comptés dans les facettes, qui le font entrer et sortir du catalogue, ou lus par les filtres
+# ?min_rating= et ?search= (qui font partie de la signature en cache) : seule leur modification invalide les compteurs
+# (pas un nouveau nombre de lectures ou un nouveau score de tendance ; les tags ont leur propre signal)
+FACET_FIELDS = ['state', 'public_type', 'is_saga', 'deleted_at', 'rating', 'title', 'description', 'tome_name']
+# Champ de l'auteur lu par ?search= (author__author_name)
+FACET_AUTHOR_FIELDS = ['author_name']
+
+# Paramètres de getallbook qui ne changent pas l'ensemble des livres filtrés
+NON_FILTER_PARAMS = {'page', 'size', 'ordering', 'facets'}
+
+
+# Signature des filtres actifs : mêmes filtres (dans n'importe quel ordre) -> même clé de cache
+def facets_signature(params):
+    items = sorted((key, value) for key in params if key not in NON_FILTER_PARAMS for value in params.getlist(key) if value)
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+# Les clés contiennent une génération, gardée dans le cache partagé : la changer rend toutes les anciennes entrées
+# inaccessibles dans tous les processus. Une valeur aléatoire plutôt qu'un incr, qui n'est pas atomique sur tous les caches
+def _generation():
+    generation = cache.get(BOOK_FACETS_GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(BOOK_FACETS_GENERATION_KEY, generation, None):
+            generation = cache.get(BOOK_FACETS_GENERATION_KEY, generation)
+    return generation
+
+
+def invalidate_book_facets():
+    cache.set(BOOK_FACETS_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+# Nombre de livres par valeur, une requête groupée par dimension (5 requêtes au total, quel que soit le nombre de valeurs)
+def compute_book_facets(queryset):
+    book_ids = queryset.order_by().values('pk')
+
+    def count_by(rows, field):
+        return {value: total for value, total in rows.values_list(field).annotate(total=Count('pk')).order_by('-total', field)}
+
+    books = Book.objects.filter(pk__in=book_ids).order_by()
+    sagas = count_by(books, 'is_saga')
+    return {
+        'genres': count_by(Book.genres.through.objects.filter(book_id__in=book_ids), 'genre__name'),
+        'themes': count_by(Book.themes.through.objects.filter(book_id__in=book_ids), 'theme__name'),
+        'state': count_by(books, 'state'),
+        'public_type': count_by(books, 'public_type'),
+        'is_saga': {'saga': sagas.get(True, 0), 'standalone': sagas.get(False, 0)},
+    }
+
+
+# Compteurs de la barre latérale pour les filtres actifs de la requête, depuis le cache si possible
+def get_book_facets(params, queryset):
+    key = f"book_facets:{_generation()}:{facets_signature(params)}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_book_facets(queryset)
+        cache.set(key, facets, BOOK_FACETS_CACHE_TIMEOUT)
+    return facets
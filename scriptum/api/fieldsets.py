@@ -0,0 +1,62 @@
+# Champs partiels sur les endpoints de lecture : ?fields=title,slug pour ne garder que ces champs, ?exclude=description pour en retirer
+# Le serializer ne renvoie que les champs demandés et la requête SQL ne lit pas les colonnes inutiles (defer)
+
+
+def parse_field_list(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+# Noms des champs à garder parmi ceux du serializer (les noms inconnus sont ignorés)
+def selected_fields(params, available):
+    selected = set(available)
+    if params.get('fields'):
+        selected &= set(parse_field_list(params.get('fields')))
+    return selected - set(parse_field_list(params.get('exclude')))
+
+
+class SparseFieldsMixin:
+    # Colonnes lues par un champ calculé (propriété du modèle) : elles ne sont pas différées tant que le champ est demandé
+    sparse_dependencies = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        params = request.query_params
+        if not params.get('fields') and not params.get('exclude'):
+            return
+        for name in set(self.fields) - selected_fields(params, self.fields):
+            self.fields.pop(name)
+
+    # Colonnes du modèle dont aucun champ gardé n'a besoin
+    def deferred_columns(self, keep=()):
+        needed = set(keep)
+        for name, field in self.fields.items():
+            if field.source == '*':
+                return []
+            needed.add(field.source.split('.')[0])
+            needed.update(self.sparse_dependencies.get(name, []))
+        return [
+            field.name for field in self.Meta.model._meta.concrete_fields
+            if not field.primary_key and not field.is_relation and field.name not in needed
+        ]
+
+
+# Applique au queryset les champs demandés : les colonnes non renvoyées ne sont pas lues en base
+# keep : colonnes à toujours lire (ex : champs de tri de la pagination par curseur)
+def sparse_queryset(queryset, serializer_class, request, keep=()):
+    params = request.query_params
+    if not issubclass(serializer_class, SparseFieldsMixin) or (not params.get('fields') and not params.get('exclude')):
+        return queryset
+    deferred = serializer_class(context={'request': request}).deferred_columns(keep)
+    return queryset.defer(*deferred) if deferred else queryset
+
+
+# Pour les vues génériques de liste : applique les champs demandés au queryset filtré
+class SparseFieldsViewMixin:
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        ordering = getattr(self.paginator, 'ordering', None) or []
+        keep = [term.lstrip('-') for term in ([ordering] if isinstance(ordering, str) else ordering)]
+        return sparse_queryset(queryset, self.get_serializer_class(), self.request, keep)
@@ -1,14 +1,66 @@
 import django_filters
+from django.db.models import Q
+from rest_framework import filters
 from .models import Book
 
+# ?genre=fantasy&genre=romance : livres ayant l'un des genres (any, par défaut) ou tous les genres (?genre_match=all)
+TAG_MATCH_CHOICES = [("any", "any"), ("all", "all")]
+
+
+# Filtre sur les noms de tags (icontains) par sous-requête sur la table de liaison, sans jointure qui duplique les livres
+def filter_by_tags(queryset, through, field, names, match="any"):
+    subqueries = [through.objects.filter(**{f"{field}__name__icontains": name}).values("book_id") for name in names if name]
+    if not subqueries:
+        return queryset
+    if match == "all":
+        for subquery in subqueries:
+            queryset = queryset.filter(pk__in=subquery)
+        return queryset
+    condition = Q()
+    for subquery in subqueries:
+        condition |= Q(pk__in=subquery)
+    return queryset.filter(condition)
+
+
 class BookFilter(django_filters.FilterSet):
     public_type = django_filters.CharFilter(field_name="public_type", lookup_expr="iexact")
     state =django_filters.CharFilter(field_name="state", lookup_expr="iexact")
-    genre = django_filters.CharFilter(field_name="genres__name", lookup_expr="icontains")
-    theme = django_filters.CharFilter(field_name="themes__name", lookup_expr="icontains")
+    genre = django_filters.CharFilter(method="filter_genres")
+    genre_match = django_filters.ChoiceFilter(choices=TAG_MATCH_CHOICES, method="filter_match")
+    theme = django_filters.CharFilter(method="filter_themes")
+    theme_match = django_filters.ChoiceFilter(choices=TAG_MATCH_CHOICES, method="filter_match")
     is_saga = django_filters.BooleanFilter(field_name="is_saga")
     min_rating = django_filters.NumberFilter(field_name="rating", lookup_expr="gte")
     
     class Meta:
         model = Book
-        fields = ["public_type", "state", "genre", "theme", "min_rating", "is_saga"]
\ No newline at end of file
+        fields = ["public_type", "state", "genre", "theme", "min_rating", "is_saga"]
+
+    # Toutes les valeurs d'un paramètre répété (?genre=a&genre=b)
+    def get_values(self, name, value):
+        return self.data.getlist(name) if hasattr(self.data, "getlist") else [value]
+
+    def filter_genres(self, queryset, name, value):
+        return filter_by_tags(queryset, Book.genres.through, "genre", self.get_values(name, value), self.data.get("genre_match"))
+
+    def filter_themes(self, queryset, name, value):
+        return filter_by_tags(queryset, Book.themes.through, "theme", self.get_values(name, value), self.data.get("theme_match"))
+
+    # genre_match / theme_match sont lus par filter_genres / filter_themes
+    def filter_match(self, queryset, name, value):
+        return queryset
+
+# Tri des livres : "trending" correspond au score de tendance décroissant (les plus populaires en premier)
+class BookOrderingFilter(filters.OrderingFilter):
+    ordering_aliases = {
+        "trending": "-trending_score",
+        "-trending": "trending_score",
+        "views": "-view_count",
+        "-views": "view_count",
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering is None:
+            return None
+        return [self.ordering_aliases.get(term, term) for term in ordering]
\ No newline at end of file
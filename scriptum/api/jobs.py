@@ -0,0 +1,215 @@
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Nombre de tâches prises par un worker à chaque requête
+JOB_BATCH_SIZE = 10
+# Attente d'un worker sans tâche avant de réinterroger la table (secondes)
+JOB_POLL_INTERVAL = 1
+# Nombre d'essais d'une tâche avant de la marquer échouée
+JOB_MAX_ATTEMPTS = 5
+# Attente avant un nouvel essai : JOB_RETRY_BASE_DELAY * 2^(essais - 1), plafonnée, avec un peu d'aléa
+JOB_RETRY_BASE_DELAY = 10
+JOB_RETRY_MAX_DELAY = 60 * 60
+# Un worker signale toutes les JOB_HEARTBEAT_INTERVAL secondes qu'il exécute toujours ses tâches ;
+# une tâche "en cours" sans signal depuis JOB_LOCK_TIMEOUT secondes (worker arrêté) est remise en attente
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_LOCK_TIMEOUT = 10 * 60
+# Reprise des tâches abandonnées et nettoyage des tâches terminées, toutes les JOB_MAINTENANCE_INTERVAL secondes
+JOB_MAINTENANCE_INTERVAL = 60
+# Durée de conservation des tâches terminées (les tâches échouées sont gardées)
+JOB_RETENTION = timedelta(days=7)
+
+
+# Chemin d'import d'une fonction de tâche, ex: 'api.notifications.fan_out_notification'
+def job_name(function):
+    if isinstance(function, str):
+        return function
+    return f"{function.__module__}.{function.__qualname__}"
+
+
+# Ajoute une tâche à la file : function(**payload) sera exécutée par un worker une fois la transaction validée
+# La tâche est écrite dans la même transaction que les données qu'elle concerne : annulée avec elles, jamais perdue après
+# dedup_key : si une tâche avec la même clé attend déjà, aucune tâche n'est ajoutée (retourne None)
+# Les fonctions de tâche doivent pouvoir être relancées sans risque (un essai interrompu est recommencé)
+def enqueue(function, payload=None, dedup_key=None, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+    job = Job(
+        name=job_name(function), payload=payload or {}, dedup_key=dedup_key,
+        run_at=timezone.now() + timedelta(seconds=delay), max_attempts=max_attempts,
+    )
+    if dedup_key is None:
+        job.save()
+    else:
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            return None
+
+    # JOBS_EAGER : exécution dans le processus courant après validation, sans attendre delay (développement sans worker)
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_job_now(job.pk))
+    return job
+
+
+# Prend jusqu'à limit tâches prêtes et les marque "en cours" pour ce worker
+# PostgreSQL : SELECT ... FOR UPDATE SKIP LOCKED, chaque worker saute les lignes déjà verrouillées par les autres
+# SQLite (pas de SKIP LOCKED, un seul écrivain à la fois) : la condition status='queued' de l'UPDATE
+# garantit qu'une tâche n'est marquée que par un seul worker, qui relit ensuite uniquement les siennes
+def claim_jobs(worker_id, limit=JOB_BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        ready = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        ids = list(ready.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids, status='queued').update(status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1)
+    return list(Job.objects.filter(pk__in=ids, locked_by=worker_id, status='running').order_by('run_at', 'pk'))
+
+
+# Exécute une tâche déjà prise ; retourne True si elle a réussi
+def run_job(job):
+    try:
+        function = import_string(job.name)
+        function(**job.payload)
+    except Exception as e:
+        logger.exception("Échec de la tâche %s (%s), essai %s/%s", job.pk, job.name, job.attempts, job.max_attempts)
+        fail_job(job, ''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+        return False
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(status='done', finished_at=timezone.now(), locked_at=None)
+    return True
+
+
+# Exécute tout de suite une tâche en attente (JOBS_EAGER)
+def run_job_now(job_id):
+    worker_id = f"eager:{uuid.uuid4().hex[:8]}"
+    if Job.objects.filter(pk=job_id, status='queued').update(status='running', locked_by=worker_id, locked_at=timezone.now(), attempts=F('attempts') + 1):
+        run_job(Job.objects.get(pk=job_id))
+
+
+def retry_delay(attempts):
+    delay = min(JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.75, 1.25)
+
+
+# Remet une tâche en attente, ou la supprime si une tâche avec la même clé attend déjà (elle fera le même travail)
+def _requeue(job, **fields):
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(status='queued', locked_by='', locked_at=None, **fields)
+    except IntegrityError:
+        Job.objects.filter(pk=job.pk).delete()
+
+
+# Programme un nouvel essai avec attente croissante, ou marque la tâche échouée après max_attempts essais
+def fail_job(job, error):
+    if job.attempts < job.max_attempts:
+        _requeue(job, run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)), last_error=error)
+    else:
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(status='failed', finished_at=timezone.now(), locked_at=None, last_error=error)
+
+
+# Rend des tâches prises mais pas commencées (arrêt du worker) sans compter d'essai
+def release_jobs(jobs):
+    for job in jobs:
+        _requeue(job, attempts=F('attempts') - 1)
+
+
+# Tâches "en cours" dont le worker ne donne plus signe de vie : comptées comme un essai échoué
+def requeue_stale_jobs(timeout=JOB_LOCK_TIMEOUT):
+    stale = Job.objects.filter(status='running', locked_at__lt=timezone.now() - timedelta(seconds=timeout))
+    for job in stale:
+        fail_job(job, f"Worker {job.locked_by} sans nouvelles depuis plus de {timeout} s.")
+
+
+def purge_finished_jobs(older_than=JOB_RETENTION):
+    return Job.objects.filter(status='done', finished_at__lt=timezone.now() - older_than).delete()[0]
+
+
+class Worker:
+    def __init__(self, batch_size=JOB_BATCH_SIZE, poll_interval=JOB_POLL_INTERVAL, worker_id=None):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+        self.failed = 0
+        self._stopping = threading.Event()
+        self._next_maintenance = 0
+
+    def stop(self):
+        self._stopping.set()
+
+    # Traite les tâches jusqu'à l'arrêt ; burst=True s'arrête dès que la file est vide, max_jobs après ce nombre de tâches,
+    # max_seconds ne prend plus de nouvelles tâches passé ce délai (la tâche en cours est terminée)
+    def run(self, burst=False, max_jobs=None, max_seconds=None):
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stopping.is_set():
+                if max_jobs is not None and self.processed + self.failed >= max_jobs:
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                if time.monotonic() >= self._next_maintenance:
+                    self.maintenance()
+                limit = self.batch_size if max_jobs is None else min(self.batch_size, max_jobs - self.processed - self.failed)
+                try:
+                    jobs = claim_jobs(self.worker_id, limit)
+                except OperationalError:
+                    # SQLite : base verrouillée par un autre écrivain, on réessaie au tour suivant
+                    jobs = []
+                    if burst:
+                        continue
+                if not jobs:
+                    if burst:
+                        return
+                    self._stopping.wait(self.poll_interval)
+                    continue
+                for position, job in enumerate(jobs):
+                    if self._stopping.is_set() or (deadline is not None and time.monotonic() >= deadline):
+                        release_jobs(jobs[position:])
+                        break
+                    if run_job(job):
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+        finally:
+            self.stop()
+            heartbeat.join()
+            connection.close()
+
+    def maintenance(self):
+        self._next_maintenance = time.monotonic() + JOB_MAINTENANCE_INTERVAL
+        try:
+            requeue_stale_jobs()
+            purge_finished_jobs()
+        except OperationalError:
+            logger.exception("Maintenance de la file de tâches impossible")
+
+    # Repousse la date de prise des tâches de ce worker tant qu'il tourne (tâches longues comme les suppressions)
+    def _heartbeat(self):
+        try:
+            while not self._stopping.wait(JOB_HEARTBEAT_INTERVAL):
+                try:
+                    Job.objects.filter(locked_by=self.worker_id, status='running').update(locked_at=timezone.now())
+                except OperationalError:
+                    logger.exception("Signal de vie du worker %s impossible", self.worker_id)
+        finally:
+            connection.close()
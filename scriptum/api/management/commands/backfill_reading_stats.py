@@ -0,0 +1,53 @@
+import math
+from django.core.management.base import BaseCommand
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from api.models import Book, Chapter, compute_text_stats, WORDS_PER_MINUTE
+
+
+# Sous-requête qui additionne une statistique de tous les chapitres d'un livre
+def _chapters_total(field):
+    subquery = Chapter.objects.filter(book=OuterRef('pk')).order_by().values('book').annotate(total=Sum(field)).values('total')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+# Commande : python manage.py backfill_reading_stats
+# Calcule les statistiques de lecture des chapitres existants par lots, sans charger tous les chapitres en mémoire
+class Command(BaseCommand):
+    help = "Calcule le nombre de mots, de caractères et le temps de lecture des chapitres et livres existants"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        fields = ['word_count', 'char_count', 'reading_time']
+
+        chapters = Chapter.objects.only('pk', 'content').order_by('pk').iterator(chunk_size=chunk_size)
+        batch = []
+        total = 0
+        for chapter in chapters:
+            chapter.word_count, chapter.char_count, chapter.reading_time = compute_text_stats(chapter.content)
+            batch.append(chapter)
+            if len(batch) >= chunk_size:
+                Chapter.objects.bulk_update(batch, fields)
+                total += len(batch)
+                batch = []
+        if batch:
+            Chapter.objects.bulk_update(batch, fields)
+            total += len(batch)
+
+        # Totaux des livres en une seule requête UPDATE
+        Book.objects.update(word_count=_chapters_total('word_count'), char_count=_chapters_total('char_count'))
+        books = Book.objects.only('pk', 'word_count').order_by('pk').iterator(chunk_size=chunk_size)
+        batch = []
+        for book in books:
+            book.reading_time = math.ceil(book.word_count / WORDS_PER_MINUTE)
+            batch.append(book)
+            if len(batch) >= chunk_size:
+                Book.objects.bulk_update(batch, ['reading_time'])
+                batch = []
+        if batch:
+            Book.objects.bulk_update(batch, ['reading_time'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} chapitre(s) mis à jour"))
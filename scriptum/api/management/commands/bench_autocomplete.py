@@ -0,0 +1,44 @@
+import random
+import statistics
+import string
+import time
+from django.core.management.base import BaseCommand
+from api.autocomplete import PrefixIndex
+
+
+# Commande : python manage.py bench_autocomplete --names 50000
+# Mesure le temps de construction de l'index de suggestions et la latence d'une suggestion (hors accès base de données)
+class Command(BaseCommand):
+    help = "Benchmark de l'index de suggestions (genres, thèmes, auteurs)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=50000)
+        parser.add_argument('--samples', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        items = {}
+        while len(items) < options['names']:
+            words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(rng.randint(1, 3))]
+            items[' '.join(words).title()] = int(rng.paretovariate(1.2))
+
+        start = time.perf_counter()
+        index = PrefixIndex(items.items())
+        build_time = time.perf_counter() - start
+
+        names = list(items)
+        latencies = []
+        for _ in range(options['samples']):
+            name = rng.choice(names)
+            prefix = name[:rng.randint(1, min(len(name), 6))]
+            start = time.perf_counter()
+            index.complete(prefix, 10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+
+        self.stdout.write(f"Noms indexés : {len(index)} ({len(index.keys)} clés), construction en {build_time * 1000:.0f} ms")
+        self.stdout.write(
+            f"Suggestion : moyenne {statistics.mean(latencies):.3f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.3f} ms, max {latencies[-1]:.3f} ms"
+        )
@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.http import QueryDict
+from api.models import User, Genre, Theme, Book
+from api.filters import BookFilter
+from api.catalog import CatalogSnapshot, SNAPSHOT_COLUMNS, np
+
+STATES = ['En cours', 'Terminé', 'En pause']
+PUBLIC_TYPES = ['tout_public', 'young_adult', 'adulte']
+
+# Combinaisons de filtres mesurées (paramètres de getallbook) et tri appliqué
+SCENARIOS = [
+    ("sans filtre", "", ["-rating", "-release_date", "title"]),
+    ("public + état", "public_type=adulte&state=en%20cours", ["-rating", "-release_date", "title"]),
+    ("un genre", "genre=genre-1", ["-rating", "-release_date", "title"]),
+    ("deux genres (any)", "genre=genre-1&genre=genre-2", ["-trending_score"]),
+    ("deux genres (all) + thème", "genre=genre-1&genre=genre-2&genre_match=all&theme=theme-3", ["title"]),
+    ("saga + note min", "is_saga=true&min_rating=3.5", ["-release_date"]),
+]
+
+
+# Commande : python manage.py bench_catalog --books 100000
+# Compare le catalogue en mémoire et la requête ORM de getallbook sur des livres générés (annulés à la fin)
+class Command(BaseCommand):
+    help = "Benchmark du catalogue en mémoire contre la requête ORM de getallbook"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000)
+        parser.add_argument('--genres', type=int, default=40)
+        parser.add_argument('--themes', type=int, default=60)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy n'est pas installé.")
+
+        with transaction.atomic():
+            self.generate(random.Random(options['seed']), options)
+
+            start = time.perf_counter()
+            snapshot = CatalogSnapshot.load()
+            load_time = time.perf_counter() - start
+            size = sum(getattr(snapshot, column).nbytes for column in SNAPSHOT_COLUMNS) + sum(bitmap.matrix.nbytes for bitmap in snapshot.tags.values())
+            self.stdout.write(f"Catalogue : {len(snapshot)} livres chargés en {load_time * 1000:.0f} ms, {size / 1024 / 1024:.1f} Mo")
+
+            for label, query, ordering in SCENARIOS:
+                params = QueryDict(query)
+                orm_times, catalog_times = [], []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    queryset = BookFilter(data=params, queryset=Book.objects.all()).qs.order_by(*ordering)
+                    orm_total = queryset.count()
+                    list(queryset.values_list('id', flat=True)[:20])
+                    orm_times.append((time.perf_counter() - start) * 1000)
+
+                    start = time.perf_counter()
+                    filterset = BookFilter(data=params, queryset=Book.objects.none())
+                    filterset.is_valid()
+                    tags = {
+                        'genre': (params.getlist('genre'), params.get('genre_match')),
+                        'theme': (params.getlist('theme'), params.get('theme_match')),
+                    }
+                    book_ids = snapshot.query(filterset.form.cleaned_data, tags, ordering)
+                    book_ids[:20].tolist()
+                    catalog_times.append((time.perf_counter() - start) * 1000)
+
+                orm_median = statistics.median(orm_times)
+                catalog_median = statistics.median(catalog_times)
+                self.stdout.write(
+                    f"{label:<28} {orm_total:>7} livres | ORM {orm_median:8.1f} ms | catalogue {catalog_median:7.1f} ms"
+                    f" | x{orm_median / catalog_median:.1f}" + ("" if len(book_ids) == orm_total else f" (catalogue : {len(book_ids)} livres)")
+                )
+
+            transaction.set_rollback(True)
+
+    # Génère auteurs, tags et livres en masse (sans signaux)
+    def generate(self, rng, options):
+        authors = User.objects.bulk_create([
+            User(pseudo=f"bench-{n}", first_name="Bench", last_name=str(n), author_name=f"Bench {n}", email=f"bench-{n}@example.com", password="!", birth_date=date(1990, 1, 1))
+            for n in range(200)
+        ])
+        genres = Genre.objects.bulk_create([Genre(name=f"genre-{n}-bench") for n in range(options['genres'])])
+        themes = Theme.objects.bulk_create([Theme(name=f"theme-{n}-bench") for n in range(options['themes'])])
+
+        books = Book.objects.bulk_create([
+            Book(
+                title=f"Livre {rng.randint(0, 10 ** 6)}", slug=f"bench-{n}", author=rng.choice(authors), description="",
+                public_type=rng.choice(PUBLIC_TYPES), image="books/bench.jpg", state=rng.choice(STATES), is_saga=rng.random() < 0.3,
+                rating=round(rng.uniform(0, 5), 1), trending_score=rng.random() * 10,
+            )
+            for n in range(options['books'])
+        ], batch_size=2000)
+
+        # Répartition inégale des tags : les premiers genres/thèmes sont les plus utilisés
+        Book.genres.through.objects.bulk_create([
+            Book.genres.through(book_id=book.pk, genre_id=genre.pk)
+            for book in books
+            for genre in {genres[min(int(rng.paretovariate(1.0)) - 1, len(genres) - 1)] for _ in range(rng.randint(1, 3))}
+        ], batch_size=5000)
+        Book.themes.through.objects.bulk_create([
+            Book.themes.through(book_id=book.pk, theme_id=theme.pk)
+            for book in books
+            for theme in {themes[min(int(rng.paretovariate(1.0)) - 1, len(themes) - 1)] for _ in range(rng.randint(0, 4))}
+        ], batch_size=5000)
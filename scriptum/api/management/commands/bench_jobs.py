@@ -0,0 +1,86 @@
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from api.models import Job
+from api.jobs import Worker, enqueue, job_name
+
+# Nombre d'exécutions de chaque tâche du benchmark, pour vérifier qu'aucune n'est prise par deux workers
+_executions = {}
+_executions_lock = threading.Lock()
+
+
+def bench_task(index):
+    with _executions_lock:
+        _executions[index] = _executions.get(index, 0) + 1
+
+
+# Commande : python manage.py bench_jobs --jobs 2000 --workers 1,2,4
+# Mesure le débit de la file de tâches : ajouts par seconde (une transaction par tâche, ou toutes dans une transaction),
+# ajouts fusionnés par clé de déduplication, puis tâches exécutées par seconde avec 1, 2, 4... workers (threads)
+# Les tâches du benchmark sont supprimées à la fin
+class Command(BaseCommand):
+    help = "Benchmark du débit de la file de tâches (ajout, déduplication, exécution)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=2000)
+        parser.add_argument('--workers', default='1,2,4', help="Nombres de workers mesurés, séparés par des virgules")
+        parser.add_argument('--batch-size', type=int, default=10)
+
+    def handle(self, *args, **options):
+        count = options['jobs']
+        name = job_name(bench_task)
+        self.stdout.write(f"Base : {connection.vendor}, SKIP LOCKED : {'oui' if connection.features.has_select_for_update_skip_locked else 'non'}")
+
+        try:
+            start = time.perf_counter()
+            for index in range(count):
+                enqueue(bench_task, {'index': index})
+            self.report("ajout (une transaction par tâche)", count, time.perf_counter() - start)
+            Job.objects.filter(name=name).delete()
+
+            start = time.perf_counter()
+            with transaction.atomic():
+                for index in range(count):
+                    enqueue(bench_task, {'index': index})
+            self.report("ajout (une seule transaction)", count, time.perf_counter() - start)
+            Job.objects.filter(name=name).delete()
+
+            start = time.perf_counter()
+            for index in range(count):
+                enqueue(bench_task, {'index': index % 10}, dedup_key=f"bench:{index % 10}")
+            self.report(f"ajout avec déduplication ({Job.objects.filter(name=name).count()} tâche(s) gardée(s))", count, time.perf_counter() - start)
+            Job.objects.filter(name=name).delete()
+
+            for workers in [int(value) for value in options['workers'].split(',')]:
+                self.bench_workers(name, count, workers, options['batch_size'])
+        finally:
+            Job.objects.filter(name=name).delete()
+
+    def bench_workers(self, name, count, workers, batch_size):
+        with transaction.atomic():
+            for index in range(count):
+                enqueue(bench_task, {'index': index})
+        _executions.clear()
+
+        pool = [Worker(batch_size=batch_size, poll_interval=0.01) for _ in range(workers)]
+        threads = [threading.Thread(target=worker.run, kwargs={'burst': True}) for worker in pool]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        duplicates = sum(1 for executions in _executions.values() if executions > 1)
+        missing = count - len(_executions)
+        per_worker = [worker.processed for worker in pool]
+        self.report(
+            f"exécution, {workers} worker(s)", count, elapsed,
+            f"répartition {per_worker} (écart-type {statistics.pstdev(per_worker):.0f}), doublons {duplicates}, manquantes {missing}",
+        )
+        Job.objects.filter(name=name).delete()
+
+    def report(self, label, count, elapsed, details=""):
+        self.stdout.write(f"{label:<58} {count / elapsed:8,.0f} tâches/s ({elapsed * 1000:,.0f} ms){' | ' + details if details else ''}")
@@ -0,0 +1,47 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import resolve
+from api.ratelimit import LocalBuckets, check_rate_limit, client_ip, set_rate_limit_headers
+
+
+# Commande : python manage.py bench_ratelimit
+# Mesure le coût de la limite de requêtes par requête : consommation d'un jeton dans un seau en mémoire
+# (un client ou beaucoup de clients différents), puis le chemin complet du middleware (route, IP, seau, en-têtes)
+class Command(BaseCommand):
+    help = "Benchmark du coût par requête de la limite de requêtes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200_000)
+        parser.add_argument('--clients', type=int, default=50_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        buckets = LocalBuckets()
+        keys = [f"ip:10.0.{n // 256 % 256}.{n % 256}:book-getall" for n in range(options['clients'])]
+
+        self.report("seau en mémoire, un client", count, options['repeat'], lambda: [buckets.take("user:1:book-getall", 10**9, 60) for _ in range(count)])
+        self.report(
+            f"seau en mémoire, {len(keys):,} clients", count, options['repeat'],
+            lambda: [buckets.take(keys[n % len(keys)], 60, 60) for n in range(count)],
+        )
+
+        request = RequestFactory().get('/api/getallbook/', REMOTE_ADDR='10.0.0.1')
+        request.resolver_match = resolve('/api/getallbook/')
+        response = {}
+
+        def middleware_path():
+            for _ in range(count):
+                set_rate_limit_headers(response, check_rate_limit(request, f"ip:{client_ip(request)}"))
+
+        self.report("route + IP + seau + en-têtes", count, options['repeat'], middleware_path)
+
+    def report(self, label, count, repeat, function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(f"{label:<36} {statistics.median(timings) / count * 1e6:6.2f} µs/requête")
@@ -0,0 +1,119 @@
+import gzip
+import json
+import random
+import statistics
+import time
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from api.models import User, Book, Chapter, Character, FollowedAuthor
+from api.serializers import BookReadSerializer, ChapterSerializer, CharacterSerializer, FollowedAuthorSerializer
+from api.renderers import FastJSONRenderer, MessagePackRenderer, orjson, msgpack
+from api.middleware import brotli, BROTLI_QUALITY
+
+WORDS = "le la les un une des et mais donc dragon forêt épée roi reine château nuit ombre lumière chemin".split()
+
+
+# Commande : python manage.py bench_renderers
+# Mesure, par endpoint, le temps de rendu JSON (DRF standard contre orjson) et la taille envoyée (brute, gzip, brotli),
+# puis compare JSON et MessagePack : taille, encodage et décodage côté client
+# Les données sont générées dans une transaction annulée à la fin
+class Command(BaseCommand):
+    help = "Benchmark du rendu JSON/MessagePack et de la compression des grosses réponses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chapters', type=int, default=300)
+        parser.add_argument('--characters', type=int, default=300)
+        parser.add_argument('--followed', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        request = Request(RequestFactory().get('/'))
+
+        with transaction.atomic():
+            reader, book, authors = self.generate(rng, options)
+            endpoints = [
+                ('getallbook (page de 100)', BookReadSerializer, Book.objects.prefetch_related('genres', 'themes').select_related('author')[:100]),
+                ('getallchapters', ChapterSerializer, Chapter.objects.filter(book=book).select_related('book')),
+                ('getallcharacters', CharacterSerializer, Character.objects.filter(book=book).select_related('book')),
+                ('getallfollowedauthors', FollowedAuthorSerializer, FollowedAuthor.objects.filter(user=reader).prefetch_related('author__books__genres', 'author__books__themes')),
+            ]
+
+            self.stdout.write(f"orjson : {'oui' if orjson else 'non'}, brotli : {'oui' if brotli else 'non'}, msgpack : {'oui' if msgpack else 'non'}")
+            for label, serializer_class, queryset in endpoints:
+                data = serializer_class(queryset, many=True, context={'request': request}).data
+                results = {}
+                for name, renderer in [('DRF', JSONRenderer()), ('orjson', FastJSONRenderer())]:
+                    timings = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        body = renderer.render(data)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    results[name] = statistics.median(timings)
+
+                sizes = f"brut {len(body) / 1024:,.0f} Ko, gzip {len(gzip.compress(body, 6)) / 1024:,.0f} Ko"
+                if brotli is not None:
+                    sizes += f", brotli {len(brotli.compress(body, quality=BROTLI_QUALITY)) / 1024:,.0f} Ko"
+                self.stdout.write(
+                    f"{label:<26} DRF {results['DRF']:7.2f} ms | orjson {results['orjson']:6.2f} ms "
+                    f"(x{results['DRF'] / results['orjson']:.1f}) | {sizes}"
+                )
+
+                if msgpack is not None:
+                    packed = MessagePackRenderer().render(data)
+                    loads = orjson.loads if orjson else json.loads
+                    encode = self.median_time(lambda: MessagePackRenderer().render(data), options['repeat'])
+                    json_decode = self.median_time(lambda: loads(body), options['repeat'])
+                    decode = self.median_time(lambda: msgpack.unpackb(packed, raw=False), options['repeat'])
+                    self.stdout.write(
+                        f"{'':<26} msgpack {len(packed) / 1024:,.0f} Ko ({len(packed) / len(body):.0%} du JSON, "
+                        f"gzip {len(gzip.compress(packed, 6)) / 1024:,.0f} Ko) | encodage {encode:.2f} ms | "
+                        f"décodage {decode:.2f} ms (JSON {json_decode:.2f} ms)"
+                    )
+
+            transaction.set_rollback(True)
+
+    def median_time(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def _text(self, rng, words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+    # Un lecteur qui suit des auteurs ayant chacun quelques livres, et un gros livre (chapitres, personnages)
+    def generate(self, rng, options):
+        users = User.objects.bulk_create([
+            User(pseudo=f"bench-{n}", first_name="Bench", last_name=str(n), author_name=f"Bench {n}", email=f"bench-{n}@example.com", password="!", birth_date=date(1990, 1, 1))
+            for n in range(options['followed'] + 1)
+        ])
+        reader, authors = users[0], users[1:]
+        books = Book.objects.bulk_create([
+            Book(
+                title=f"Livre {n}", slug=f"bench-{n}", author=authors[n % len(authors)], description=self._text(rng, 80),
+                public_type='adulte', image="books/bench.jpg", warnings=["violence", "langage"], rating=round(rng.uniform(0, 5), 1),
+            )
+            for n in range(len(authors) * 3)
+        ])
+        book = books[0]
+        Chapter.objects.bulk_create([
+            Chapter(book=book, title=f"Chapitre {n}", slug=f"chapitre-{n}", content=self._text(rng, 1500), type='chapitre', chapter_number=n, position=n * 1024)
+            for n in range(options['chapters'])
+        ])
+        Character.objects.bulk_create([
+            Character(
+                book=book, name=f"Personnage {n}", slug=f"personnage-{n}", role='allié', image="characters/bench.jpg", age=rng.randint(10, 90),
+                sexe='femme', height='1m70', background=self._text(rng, 200), traits=["loyal", "têtu"], languages=["commun", "elfique"],
+            )
+            for n in range(options['characters'])
+        ])
+        FollowedAuthor.objects.bulk_create([FollowedAuthor(user=reader, author=author) for author in authors])
+        return reader, book, authors
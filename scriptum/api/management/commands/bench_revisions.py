@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+import zlib
+from django.core.management.base import BaseCommand
+from api.revisions import encode_snapshot, encode_delta, decode_revision, is_snapshot_number, REVISION_SNAPSHOT_INTERVAL
+
+WORDS = "le la les un une des et mais donc or ni car dragon forêt épée roi reine château nuit ombre lumière chemin".split()
+
+
+def _paragraph(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))) + '\n'
+
+
+# Simule une modification d'auteur : réécrit, ajoute ou supprime quelques paragraphes
+def _edit(rng, paragraphs):
+    paragraphs = list(paragraphs)
+    for _ in range(rng.randint(1, 3)):
+        action = rng.random()
+        index = rng.randrange(len(paragraphs))
+        if action < 0.6:
+            words = paragraphs[index].split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            paragraphs[index] = ' '.join(words) + '\n'
+        elif action < 0.85 or len(paragraphs) < 5:
+            paragraphs.insert(index, _paragraph(rng))
+        else:
+            paragraphs.pop(index)
+    return paragraphs
+
+
+# Commande : python manage.py bench_revisions --revisions 5000
+# Mesure la place occupée par l'historique et le temps de reconstruction d'une révision (hors accès base de données)
+class Command(BaseCommand):
+    help = "Benchmark du stockage des révisions de chapitre (octets stockés et latence de reconstruction)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revisions', type=int, default=5000)
+        parser.add_argument('--paragraphs', type=int, default=60)
+        parser.add_argument('--samples', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        paragraphs = [_paragraph(rng) for _ in range(options['paragraphs'])]
+
+        store = []
+        full_bytes = 0
+        compressed_bytes = 0
+        previous_text = None
+        start = time.perf_counter()
+        for number in range(1, options['revisions'] + 1):
+            text = ''.join(paragraphs)
+            snapshot = previous_text is None or is_snapshot_number(number)
+            data = encode_snapshot(text) if snapshot else encode_delta(previous_text, text)
+            store.append((snapshot, data))
+            full_bytes += len(text.encode('utf-8'))
+            compressed_bytes += len(zlib.compress(text.encode('utf-8')))
+            previous_text = text
+            paragraphs = _edit(rng, paragraphs)
+        encode_time = time.perf_counter() - start
+        stored_bytes = sum(len(data) for _, data in store)
+
+        # Reconstruction de révisions tirées au hasard, depuis la copie complète précédente
+        latencies = []
+        for _ in range(options['samples']):
+            number = rng.randint(1, len(store))
+            start = time.perf_counter()
+            first = number
+            while not store[first - 1][0]:
+                first -= 1
+            text = None
+            for snapshot, data in store[first - 1:number]:
+                text = decode_revision(snapshot, data, text)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+
+        self.stdout.write(f"Révisions : {len(store)} (copie complète toutes les {REVISION_SNAPSHOT_INTERVAL})")
+        self.stdout.write(f"Copies complètes brutes     : {full_bytes / 1024:,.0f} Ko")
+        self.stdout.write(f"Copies complètes compressées : {compressed_bytes / 1024:,.0f} Ko")
+        self.stdout.write(f"Copies + diffs compressés    : {stored_bytes / 1024:,.0f} Ko ({full_bytes / stored_bytes:.1f}x plus petit que brut)")
+        self.stdout.write(f"Encodage : {encode_time / len(store) * 1000:.2f} ms par révision")
+        self.stdout.write(
+            f"Reconstruction : moyenne {statistics.mean(latencies):.2f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms, max {latencies[-1]:.2f} ms"
+        )
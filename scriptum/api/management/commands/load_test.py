@@ -0,0 +1,243 @@
+import asyncio
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.urls import reverse
+from api.models import User, Book, Chapter, Review, Favorite, DeletionJob
+from api.deletion import run_deletion_job
+
+# aiohttp est optionnel : il n'est utilisé que par cette commande
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Préfixe des comptes créés par --seed (et supprimés par --cleanup)
+LOAD_PREFIX = "load-"
+
+WORDS = "le la les un une des et mais donc dragon forêt épée roi reine château nuit ombre lumière chemin".split()
+
+# Mélange du trafic : poids de chaque action d'un utilisateur virtuel
+SCENARIO = {
+    'browse': 40,    # getallbook, une page du catalogue (tri et taille variables)
+    'read': 35,      # getchapterinfo, lecture d'un chapitre, suivie de viewchapter comme le ferait le client
+    'favorite': 10,  # newfavorite / deletefavorite, bascule d'un favori
+    'review': 8,     # createreview, sur un livre pas encore noté
+    'edit': 7,       # editchapter, modification d'un chapitre par son auteur
+}
+
+BROWSE_ORDERINGS = ['', '-rating', 'trending', 'views', '-release_date']
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# Commande : python manage.py load_test
+# Génère du trafic réaliste contre un serveur lancé à part (ex: python manage.py runserver, ou gunicorn) sur la même base
+#   python manage.py load_test --seed      crée des lecteurs, des auteurs, leurs livres et chapitres (comptes "load-...")
+#   python manage.py load_test --url http://127.0.0.1:8000 --stages 10,50,100 --duration 30
+#   python manage.py load_test --cleanup   supprime les données créées
+# Chaque palier lance autant d'utilisateurs virtuels qui enchaînent les actions de SCENARIO pendant --duration secondes,
+# puis affiche le débit, les erreurs, les refus de la limite de requêtes (429) et les latences par nom d'URL
+# Les budgets de RATE_LIMITS s'appliquent : lancer le serveur avec RATE_LIMIT_ENABLED=False pour mesurer sa capacité brute
+class Command(BaseCommand):
+    help = "Test de charge : mélange pondéré de lectures et d'écritures sur les routes de l'API, avec paliers de concurrence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Crée les données du test de charge puis s'arrête")
+        parser.add_argument('--cleanup', action='store_true', help="Supprime les données du test de charge puis s'arrête")
+        parser.add_argument('--readers', type=int, default=200)
+        parser.add_argument('--authors', type=int, default=20)
+        parser.add_argument('--books-per-author', type=int, default=5)
+        parser.add_argument('--chapters-per-book', type=int, default=20)
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--stages', default='10,50,100', help="Nombres d'utilisateurs virtuels des paliers successifs")
+        parser.add_argument('--duration', type=float, default=30, help="Durée de chaque palier (secondes)")
+        parser.add_argument('--think-time', type=float, default=0, help="Pause moyenne entre deux actions d'un utilisateur (secondes)")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--random-seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['random_seed'])
+        if options['cleanup']:
+            count = self.cleanup()
+            self.stdout.write(self.style.SUCCESS(f"{count} ligne(s) supprimée(s)"))
+            return
+        if options['seed']:
+            self.seed(options)
+            return
+
+        if aiohttp is None:
+            raise CommandError("aiohttp n'est pas installé.")
+        self.load_state()
+        if not self.books or not self.readers:
+            raise CommandError("Aucune donnée de test : lancer d'abord python manage.py load_test --seed")
+
+        stages = [int(value) for value in options['stages'].split(',')]
+        summaries = [asyncio.run(self.run_stage(users, options)) for users in stages]
+
+        self.stdout.write("\nRésumé")
+        for users, (count, elapsed, errors, limited, p50, p99) in zip(stages, summaries):
+            self.stdout.write(
+                f"  {users:>5} utilisateurs : {count / elapsed:8,.1f} req/s | erreurs {errors / max(count, 1):6.2%} | "
+                f"429 {limited / max(count, 1):6.2%} | p50 {p50:7.1f} ms | p99 {p99:7.1f} ms"
+            )
+
+    def _text(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    # Supprime les comptes "load-..." comme une suppression de compte (DeletionRunner) : par lots, sans cascade géante
+    # Retourne le nombre de lignes supprimées
+    def cleanup(self):
+        count = 0
+        for user_id, pseudo in User.objects.filter(pseudo__startswith=LOAD_PREFIX).values_list('pk', 'pseudo'):
+            job = DeletionJob.objects.create(kind='user', object_id=user_id, label=pseudo)
+            count += run_deletion_job(job.pk).deleted
+        return count
+
+    # Lecteurs et auteurs, chaque auteur avec ses livres et leurs chapitres
+    def seed(self, options):
+        self.cleanup()
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    pseudo=f"{LOAD_PREFIX}{kind}-{n}", first_name="Load", last_name=str(n), author_name=f"Load {kind} {n}",
+                    email=f"{LOAD_PREFIX}{kind}-{n}@example.com", password="!", birth_date=date(1990, 1, 1),
+                )
+                for kind, count in [('reader', options['readers']), ('author', options['authors'])]
+                for n in range(count)
+            ])
+            authors = users[options['readers']:]
+            books = Book.objects.bulk_create([
+                Book(
+                    title=f"Livre {author.pk}-{n}", slug=f"{LOAD_PREFIX}{author.pk}-{n}", author=author, description=self._text(80),
+                    public_type='adulte', image="books/load.jpg", rating=round(self.rng.uniform(0, 5), 1),
+                )
+                for author in authors
+                for n in range(options['books_per_author'])
+            ])
+            Chapter.objects.bulk_create([
+                Chapter(book=book, title=f"Chapitre {n}", slug=f"chapitre-{n}", content=self._text(1500), type='chapitre', chapter_number=n, position=n * 1024)
+                for book in books
+                for n in range(options['chapters_per_book'])
+            ])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(users) - len(authors)} lecteur(s), {len(authors)} auteur(s), {len(books)} livre(s), "
+            f"{len(books) * options['chapters_per_book']} chapitre(s) créés"
+        ))
+
+    # Tokens, livres et chapitres de la base, avec les reviews et favoris déjà présents (reprise d'un test précédent)
+    def load_state(self):
+        users = User.objects.filter(pseudo__startswith=LOAD_PREFIX, deleted_at__isnull=True)
+        self.readers = [str(token) for token in users.filter(pseudo__contains='-reader-').values_list('token', flat=True)]
+        self.books = list(Book.objects.filter(author__in=users).values_list('slug', flat=True))
+        # Chapitres modifiables par chaque auteur : (token, slug du livre, slug du chapitre)
+        self.author_chapters = [
+            (str(token), book_slug, chapter_slug)
+            for token, book_slug, chapter_slug in Chapter.objects.filter(book__author__in=users).values_list('book__author__token', 'book__slug', 'slug')
+        ]
+        self.chapters = [(book_slug, chapter_slug) for _, book_slug, chapter_slug in self.author_chapters]
+        self.reviewed = defaultdict(set)
+        for token, slug in Review.objects.filter(user__in=users).values_list('user__token', 'book__slug'):
+            self.reviewed[str(token)].add(slug)
+        self.favorites = defaultdict(set)
+        for token, slug in Favorite.objects.filter(user__in=users).values_list('user__token', 'book__slug'):
+            self.favorites[str(token)].add(slug)
+
+    # Prochaine requête d'un utilisateur virtuel : (nom d'URL, méthode, chemin, paramètres GET, corps JSON)
+    # Reviews et favoris sont mis à jour dès le choix : deux actions simultanées du même lecteur ne se contredisent pas
+    def next_request(self, reader):
+        action = self.rng.choices(list(SCENARIO), weights=list(SCENARIO.values()))[0]
+
+        if action == 'read':
+            book_slug, chapter_slug = self.rng.choice(self.chapters)
+            return 'chapter-getinfo', 'GET', reverse('chapter-getinfo', kwargs={'slug_book': book_slug, 'slug_chapter': chapter_slug}), None, None
+
+        if action == 'favorite':
+            slug = self.rng.choice(self.books)
+            favorites = self.favorites[reader]
+            if slug in favorites:
+                favorites.discard(slug)
+                return 'favorite-delete', 'DELETE', reverse('favorite-delete', kwargs={'slug_book': slug}), {'token': reader}, None
+            favorites.add(slug)
+            return 'favorite-create', 'POST', reverse('favorite-create'), None, {'token': reader, 'book': slug}
+
+        if action == 'review':
+            remaining = [slug for slug in self.books if slug not in self.reviewed[reader]]
+            if remaining:
+                slug = self.rng.choice(remaining)
+                self.reviewed[reader].add(slug)
+                body = {'token': reader, 'book': slug, 'score': self.rng.randint(0, 5), 'comment': self._text(30)}
+                return 'review-create', 'POST', reverse('review-create'), None, body
+
+        if action == 'edit':
+            token, book_slug, chapter_slug = self.rng.choice(self.author_chapters)
+            body = {'token': token, 'content': self._text(1500)}
+            return 'chapter-update', 'PATCH', reverse('chapter-update', kwargs={'slug_book': book_slug, 'slug_chapter': chapter_slug}), None, body
+
+        # Surtout les premières pages, sans dépasser la dernière
+        size = self.rng.choice([5, 20, 100])
+        params = {'size': size, 'page': min(self.rng.randint(1, 3), math.ceil(len(self.books) / size))}
+        ordering = self.rng.choice(BROWSE_ORDERINGS)
+        if ordering:
+            params['ordering'] = ordering
+        return 'book-getall', 'GET', reverse('book-getall'), params, None
+
+    async def send(self, session, base_url, url_name, method, path, params, body, results):
+        start = time.perf_counter()
+        try:
+            async with session.request(method, base_url + path, params=params, json=body) as response:
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = 0
+        results[url_name].append((status, (time.perf_counter() - start) * 1000))
+        return status
+
+    async def virtual_user(self, session, base_url, reader, deadline, think_time, results):
+        while time.monotonic() < deadline:
+            url_name, method, path, params, body = self.next_request(reader)
+            status = await self.send(session, base_url, url_name, method, path, params, body, results)
+            # La page d'un chapitre est servie par le CDN : le client compte la lecture par une requête à part
+            if url_name == 'chapter-getinfo' and status == 200:
+                await self.send(session, base_url, 'chapter-view', 'POST', path.replace('/getchapterinfo/', '/viewchapter/'), None, None, results)
+            if think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / think_time))
+
+    async def run_stage(self, users, options):
+        results = defaultdict(list)
+        timeout = aiohttp.ClientTimeout(total=options['timeout'])
+        connector = aiohttp.TCPConnector(limit=users)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            start = time.monotonic()
+            deadline = start + options['duration']
+            await asyncio.gather(*[
+                self.virtual_user(session, options['url'].rstrip('/'), self.readers[n % len(self.readers)], deadline, options['think_time'], results)
+                for n in range(users)
+            ])
+            elapsed = time.monotonic() - start
+
+        count = sum(len(samples) for samples in results.values())
+        self.stdout.write(f"\nPalier {users} utilisateurs : {count:,} requête(s) en {elapsed:.1f} s, {count / elapsed:,.1f} req/s")
+        self.stdout.write(f"  {'route':<18} {'requêtes':>9} {'req/s':>8} {'erreurs':>8} {'429':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        all_latencies, errors, limited = [], 0, 0
+        for url_name, samples in sorted(results.items()):
+            latencies = sorted(latency for _, latency in samples)
+            route_errors = sum(1 for status, _ in samples if status == 0 or (status >= 400 and status != 429))
+            route_limited = sum(1 for status, _ in samples if status == 429)
+            all_latencies += latencies
+            errors += route_errors
+            limited += route_limited
+            self.stdout.write(
+                f"  {url_name:<18} {len(samples):>9,} {len(samples) / elapsed:>8,.1f} {route_errors / len(samples):>8.2%} {route_limited / len(samples):>7.2%} "
+                f"{percentile(latencies, 0.5):>6.1f}ms {percentile(latencies, 0.9):>6.1f}ms {percentile(latencies, 0.99):>6.1f}ms {latencies[-1]:>6.1f}ms"
+            )
+        all_latencies.sort()
+        if not all_latencies:
+            return count, elapsed, errors, limited, 0, 0
+        return count, elapsed, errors, limited, percentile(all_latencies, 0.5), percentile(all_latencies, 0.99)
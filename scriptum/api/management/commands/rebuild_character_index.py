@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.character_search import rebuild_character_index
+from api.character_graph import rebuild_character_relations
+
+
+# Commande : python manage.py rebuild_character_index
+# Reconstruit l'index des attributs et les liens entre personnages (à lancer une fois après la migration)
+class Command(BaseCommand):
+    help = "Reconstruit l'index des valeurs JSON des personnages (traits, langues, métiers...) et leurs liens familiaux"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_character_index(chunk_size=options['chunk_size'])
+        relations = rebuild_character_relations()
+        self.stdout.write(self.style.SUCCESS(f"{count} personnage(s) indexé(s), {relations} lien(s)"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.search import rebuild_search_index
+
+
+# Commande : python manage.py rebuild_search_index
+# Reconstruit l'index de recherche des livres, personnages, lieux et créatures par lots
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche commun (livres, personnages, lieux, créatures)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{count} élément(s) indexé(s)"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.trending import refresh_trending_scores
+
+
+# Commande périodique (cron) : python manage.py refresh_trending
+# Ne recalcule que les livres ayant eu de l'activité depuis le dernier passage
+class Command(BaseCommand):
+    help = "Recalcule le score de tendance des livres ayant eu une nouvelle activité"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help="Recalcule tous les livres (ex: après une migration)")
+
+    def handle(self, *args, **options):
+        count = refresh_trending_scores(batch_size=options['batch_size'], full=options['all'])
+        self.stdout.write(self.style.SUCCESS(f"{count} livre(s) recalculé(s)"))
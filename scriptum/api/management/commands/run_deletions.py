@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from api.deletion import pending_deletion_jobs, run_deletion_job
+
+
+# Commande : python manage.py run_deletions
+# Reprend les suppressions de comptes et de livres restées en attente ou interrompues (ex: redémarrage du serveur)
+# et affiche leur progression et la mémoire utilisée
+class Command(BaseCommand):
+    help = "Exécute ou reprend les suppressions de comptes et de livres en attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=int, default=10, help="Reprend les suppressions sans progression depuis ce délai")
+
+    def handle(self, *args, **options):
+        jobs = list(pending_deletion_jobs(stale_after=timedelta(minutes=options['stale_minutes'])).order_by('created_at'))
+        for job in jobs:
+            self.stdout.write(f"Suppression {job.kind} « {job.label} »")
+            job = run_deletion_job(job.pk, resume=True, on_progress=self.report)
+            if job is not None:
+                self.stdout.write(self.style.SUCCESS(f"  terminée : {job.deleted} ligne(s) supprimée(s), hausse du pic mémoire {'?' if job.memory_growth is None else job.memory_growth} Ko"))
+        self.stdout.write(self.style.SUCCESS(f"{len(jobs)} suppression(s) traitée(s)"))
+
+    def report(self, job):
+        self.stdout.write(f"  {job.deleted}/{job.total} ligne(s), hausse du pic mémoire {'?' if job.memory_growth is None else job.memory_growth} Ko", ending='\r')
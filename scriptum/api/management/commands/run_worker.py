@@ -0,0 +1,25 @@
+import signal
+from django.core.management.base import BaseCommand
+from api.jobs import Worker, JOB_BATCH_SIZE, JOB_POLL_INTERVAL
+
+
+# Commande : python manage.py run_worker (process "worker" du Procfile, à lancer en plusieurs exemplaires si besoin)
+# Exécute les tâches de la file (suppressions, notifications, recalcul des notes...) jusqu'à SIGTERM ou Ctrl+C
+# Un arrêt termine la tâche en cours et rend les tâches prises mais pas commencées
+class Command(BaseCommand):
+    help = "Exécute les tâches de fond de la file en base"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=JOB_BATCH_SIZE, help="Tâches prises par requête")
+        parser.add_argument('--poll-interval', type=float, default=JOB_POLL_INTERVAL, help="Attente quand la file est vide (secondes)")
+        parser.add_argument('--burst', action='store_true', help="S'arrête dès que la file est vide")
+        parser.add_argument('--max-jobs', type=int, help="S'arrête après ce nombre de tâches")
+
+    def handle(self, *args, **options):
+        worker = Worker(batch_size=options['batch_size'], poll_interval=options['poll_interval'])
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        self.stdout.write(f"Worker {worker.worker_id} démarré")
+        worker.run(burst=options['burst'], max_jobs=options['max_jobs'])
+        self.stdout.write(self.style.SUCCESS(f"Worker arrêté : {worker.processed} tâche(s) réussie(s), {worker.failed} échouée(s)"))
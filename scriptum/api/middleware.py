@@ -0,0 +1,81 @@
+import re
+from django.http import JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from .ratelimit import check_rate_limit, client_ip, set_rate_limit_headers
+
+# brotli est optionnel : sans lui, seul gzip est proposé
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Les réponses plus petites ne sont pas compressées (le gain ne compense pas le coût)
+COMPRESSION_MIN_SIZE = 1024
+# Niveau brotli adapté aux réponses dynamiques (11 est bien plus lent pour un gain faible)
+BROTLI_QUALITY = 5
+
+ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+
+
+# Compression des réponses au-delà de COMPRESSION_MIN_SIZE : brotli si le client l'accepte, sinon gzip
+# Les réponses en flux sont compressées morceau par morceau
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding') or getattr(response, 'is_async', False):
+            return super().process_response(request, response)
+        if brotli is None or not ACCEPTS_BROTLI.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Même traitement de l'ETag que GZipMiddleware : le contenu compressé n'est plus identique octet pour octet
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    def compress_stream(self, chunks):
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+# Limite de requêtes : les vues protégées par require_token sont limitées dans require_token (par utilisateur,
+# ou par adresse IP si le token est manquant ou invalide), toutes les autres (lectures publiques, inscription, connexion...) par adresse IP
+# Ajoute les en-têtes RateLimit-* à la réponse dans les deux cas
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        limit = getattr(request, 'rate_limit', None)
+        if limit is not None:
+            set_rate_limit_headers(response, limit)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        handler = getattr(view_class, request.method.lower(), None)
+        if getattr(handler, 'requires_token', False):
+            return None
+        limit = check_rate_limit(request, f"ip:{client_ip(request)}")
+        if limit is not None and not limit.allowed:
+            return JsonResponse({'error': 'Trop de requêtes, réessayez plus tard'}, status=429)
+        return None
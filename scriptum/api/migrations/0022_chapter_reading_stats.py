@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_book_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='char_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='char_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+# Donne une position espacée aux chapitres existants, dans l'ordre actuel de chaque livre
+# Livre par livre : seuls les chapitres d'un livre sont en mémoire à la fois
+def init_chapter_positions(apps, schema_editor):
+    Chapter = apps.get_model('api', 'Chapter')
+    book_ids = Chapter.objects.order_by('book_id').values_list('book_id', flat=True).distinct()
+    for book_id in book_ids.iterator(chunk_size=1000):
+        chapters = list(Chapter.objects.filter(book_id=book_id).order_by('sort_order', 'chapter_number', 'pk').only('pk'))
+        for index, chapter in enumerate(chapters, start=1):
+            chapter.position = index * 1024
+        Chapter.objects.bulk_update(chapters, ['position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_chapter_reading_stats'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chapter',
+            options={'ordering': ['sort_order', 'position', 'chapter_number']},
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='position',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='chapter',
+            index=models.Index(fields=['book', 'sort_order', 'position'], name='chapter_book_order_idx'),
+        ),
+        migrations.RunPython(init_chapter_positions, migrations.RunPython.noop),
+    ]
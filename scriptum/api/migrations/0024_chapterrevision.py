@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_chapter_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChapterRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chapter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='api.chapter')),
+            ],
+            options={
+                'ordering': ['-number'],
+                'constraints': [models.UniqueConstraint(fields=('chapter', 'number'), name='unique_revision_number_per_chapter')],
+            },
+        ),
+    ]
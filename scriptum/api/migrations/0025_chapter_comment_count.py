@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:41
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# Initialise le compteur avec les commentaires déjà existants
+def init_comment_counts(apps, schema_editor):
+    Chapter = apps.get_model('api', 'Chapter')
+    ChapterComment = apps.get_model('api', 'ChapterComment')
+    counts = ChapterComment.objects.filter(chapter=OuterRef('pk')).order_by().values('chapter').annotate(total=Count('pk')).values('total')
+    Chapter.objects.update(comment_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_chapterrevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(init_comment_counts, migrations.RunPython.noop),
+    ]
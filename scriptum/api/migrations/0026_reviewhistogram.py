@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Construit l'histogramme des livres qui ont déjà des reviews
+def init_review_histograms(apps, schema_editor):
+    Review = apps.get_model('api', 'Review')
+    ReviewHistogram = apps.get_model('api', 'ReviewHistogram')
+    histograms = {}
+    for book_id, score, total in Review.objects.order_by().values_list('book_id', 'score').annotate(total=models.Count('pk')):
+        histogram = histograms.setdefault(book_id, ReviewHistogram(book_id=book_id))
+        setattr(histogram, f"score_{score}", total)
+    ReviewHistogram.objects.bulk_create(histograms.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_chapter_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewHistogram',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_histogram', serialize=False, to='api.book')),
+                ('score_0', models.PositiveIntegerField(default=0)),
+                ('score_1', models.PositiveIntegerField(default=0)),
+                ('score_2', models.PositiveIntegerField(default=0)),
+                ('score_3', models.PositiveIntegerField(default=0)),
+                ('score_4', models.PositiveIntegerField(default=0)),
+                ('score_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(init_review_histograms, migrations.RunPython.noop),
+    ]
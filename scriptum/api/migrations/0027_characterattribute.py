@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHARACTER_JSON_FIELDS = ['traits', 'languages', 'studies', 'job', 'family', 'addictions', 'fears', 'talents']
+
+
+# Index GIN sur les champs JSON des personnages (PostgreSQL uniquement, pour les filtres @>)
+def create_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in CHARACTER_JSON_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS character_{field}_gin_idx ON api_character USING GIN ("{field}" jsonb_path_ops)'
+        )
+
+
+def drop_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in CHARACTER_JSON_FIELDS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS character_{field}_gin_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_reviewhistogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CharacterAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='character_attributes', to='api.book')),
+                ('character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='api.character')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'field', 'value'], name='character_attr_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+    ]
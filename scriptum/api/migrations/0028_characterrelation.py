@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_characterattribute'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CharacterRelation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_name', models.CharField(max_length=200)),
+                ('relation', models.CharField(blank=True, max_length=50)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='character_relations', to='api.book')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relations', to='api.character')),
+                ('target', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incoming_relations', to='api.character')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'target_name'], name='character_relation_name_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_characterrelation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book', 'Livre'), ('character', 'Personnage'), ('place', 'Lieu'), ('creature', 'Créature')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=200)),
+                ('excerpt', models.CharField(blank=True, max_length=200)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='api.book')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=50)),
+                ('weight', models.FloatField()),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='api.searchentry')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry_per_object'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_deletion_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='view_count',
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
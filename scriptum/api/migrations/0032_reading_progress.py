@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_view_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to='api.book')),
+                ('chapter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.chapter')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to='api.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-updated_at'], name='progress_user_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'book'), name='unique_progress_per_user_per_book')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_reading_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notifications_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('book', 'Nouveau livre'), ('chapter', 'Nouveau chapitre')], max_length=10)),
+                ('fanned_out', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='api.user')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='api.book')),
+                ('chapter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='api.chapter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to='api.user')),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='api.notification')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['author', 'fanned_out', '-id'], name='notification_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('user', 'notification'), name='unique_inbox_entry'),
+        ),
+    ]
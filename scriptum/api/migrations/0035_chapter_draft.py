@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChapterDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField()),
+                ('version', models.CharField(max_length=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chapter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='draft', to='api.chapter')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_catalog_change'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='title',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
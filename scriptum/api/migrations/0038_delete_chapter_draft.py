@@ -0,0 +1,16 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_book_title_index'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ChapterDraft',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_delete_chapter_draft'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='deletionjob',
+            old_name='memory_peak',
+            new_name='memory_growth',
+        ),
+    ]
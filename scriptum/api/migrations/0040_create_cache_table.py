@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:45
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+# Crée la table du cache partagé (DatabaseCache, utilisé quand REDIS_URL n'est pas défini) avec les migrations :
+# un déploiement qui n'exécute que "migrate" ne démarre pas sans elle ; sans effet avec Redis ou si elle existe déjà
+def create_cache_table(apps, schema_editor):
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_deletionjob_memory_growth'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
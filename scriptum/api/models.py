@@ -1,13 +1,75 @@
 import uuid
-from django.db import models
+import math
+from django.db import models, transaction
+from django.db.models import Sum
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.text import slugify
+from django.utils.html import strip_tags
 from cloudinary_storage.storage import MediaCloudinaryStorage
 
+# Vitesse de lecture moyenne utilisée pour estimer le temps de lecture
+WORDS_PER_MINUTE = 230
+
+# Calcule le nombre de mots, de caractères et le temps de lecture (en minutes) d'un texte
+def compute_text_stats(content):
+    text = strip_tags(content or '')
+    word_count = len(text.split())
+    return word_count, len(text), math.ceil(word_count / WORDS_PER_MINUTE)
+
+# Garde les valeurs lues en base pour que les signaux post_save sachent quels champs une sauvegarde a modifiés
+# (ex: pas de réindexation quand seule la note d'un livre change)
+# maintained_fields : champs tenus à jour par des UPDATE ciblés (compteurs, totaux...) ; une sauvegarde complète
+# d'un objet existant ne les réécrit pas, pour ne pas remettre en base une valeur lue avant un incrément
+class TrackedFieldsMixin:
+    maintained_fields = []
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.maintained_fields and not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.maintained_fields and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: self.__dict__[field.attname] for field in self._meta.concrete_fields if field.attname in self.__dict__}
+
+    # Les champs relus (dont un champ différé chargé au premier accès) gardent aussi leur valeur lue en base
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        loaded = getattr(self, '_loaded_values', {})
+        for name in fields if fields is not None else [field.attname for field in self._meta.concrete_fields]:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+        self._loaded_values = loaded
+
+    # À appeler depuis post_save : la sauvegarde a-t-elle créé l'objet ou modifié l'un des champs donnés ?
+    # Un champ différé (.only/.defer) jamais assigné n'a pas pu changer ; un objet jamais lu en base est considéré modifié
+    def fields_changed(self, fields, created=False, update_fields=None):
+        if created:
+            return True
+        if update_fields is not None and not set(update_fields) & set(fields):
+            return False
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        for name in fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__ and (attname not in loaded or loaded[attname] != self.__dict__[attname]):
+                return True
+        return False
+
 # Modèle pour créer la table utilisateur
-class User(models.Model):
+class User(TrackedFieldsMixin, models.Model):
     pseudo = models.CharField(max_length=30, unique=True)
     first_name = models.CharField(max_length=30)
     last_name = models.CharField(max_length=30)
@@ -16,6 +78,13 @@ class User(models.Model):
     password = models.CharField(max_length=128)
     birth_date = models.DateField()
     token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    # Date de la demande de suppression du compte : il est masqué en attendant sa suppression par lots
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Notifications reçues dans la boîte depuis la dernière lecture (incrémenté à chaque envoi), et date de cette lecture
+    unread_notifications = models.PositiveIntegerField(default=0)
+    notifications_read_at = models.DateTimeField(null=True, blank=True)
+
+    maintained_fields = ['unread_notifications', 'deleted_at']
 
     # Fonction pour créer le mot de passe
     def set_password(self, raw_password):
@@ -33,8 +102,13 @@ class Genre(models.Model):
 class Theme(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
+# Les livres en cours de suppression sont exclus de toutes les lectures publiques
+class BookQuerySet(models.QuerySet):
+    def visible(self):
+        return self.filter(deleted_at__isnull=True)
+
 # Modèle pour créer la table livre
-class Book(models.Model):
+class Book(TrackedFieldsMixin, models.Model):
     # Variable pour les choix du type de public
     PUBLIC_CHOICES = [
         ('tout_public', 'Tout Public'),
@@ -42,7 +116,8 @@ class Book(models.Model):
         ('adulte', 'Adulte'),
     ]
 
-    title = models.CharField(max_length=100)
+    # Indexé : tri par titre, et classement d'un titre parmi ses voisins par le catalogue en mémoire
+    title = models.CharField(max_length=100, db_index=True)
     slug = models.SlugField(max_length=200, unique=True)
     release_date = models.DateField(auto_now_add=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='books')
@@ -57,6 +132,22 @@ class Book(models.Model):
     tome_number = models.IntegerField(null=True, blank=True)
     rating = models.FloatField(default=0.0)
     warnings = models.JSONField(null=True, blank=True)
+    # Score de tendance (reviews, favoris, suivis avec décroissance exponentielle), recalculé par refresh_trending
+    trending_score = models.FloatField(default=0.0, db_index=True)
+    trending_updated_at = models.DateTimeField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Totaux de tous les chapitres, mis à jour à chaque sauvegarde/suppression de chapitre
+    word_count = models.PositiveIntegerField(default=0)
+    char_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveIntegerField(default=0)
+    # Nombre de lectures (fiche du livre et chapitres), écrit par lots par api/counters.py
+    view_count = models.PositiveBigIntegerField(default=0, db_index=True)
+    # Date de la demande de suppression (du livre ou du compte de l'auteur) : le livre est masqué en attendant sa suppression par lots
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = BookQuerySet.as_manager()
+
+    maintained_fields = ['rating', 'trending_score', 'trending_updated_at', 'last_activity_at', 'word_count', 'char_count', 'reading_time', 'view_count', 'deleted_at']
 
     class Meta:
         ordering = ['release_date', '-rating', 'title']
@@ -90,7 +181,15 @@ class Book(models.Model):
             self.rating = round(total / reviews.count(), 1)
         else:
             self.rating = 0.0
-        self.save()
+        self.save(update_fields=['rating'])
+
+    # Met à jour les totaux de mots, caractères et temps de lecture à partir des chapitres
+    def update_reading_stats(self):
+        totals = self.chapters.aggregate(words=Sum('word_count'), chars=Sum('char_count'))
+        self.word_count = totals['words'] or 0
+        self.char_count = totals['chars'] or 0
+        self.reading_time = math.ceil(self.word_count / WORDS_PER_MINUTE)
+        Book.objects.filter(pk=self.pk).update(word_count=self.word_count, char_count=self.char_count, reading_time=self.reading_time)
 
 # Modèle pour stocker toutes les reviews des livres
 class Review(models.Model):
@@ -106,8 +205,31 @@ class Review(models.Model):
         constraints = [models.UniqueConstraint(fields=['book', 'user'], name='unique_review_per_user_per_book')]
 
 
+# Modèle pour stocker le nombre de reviews par note (0 à 5) d'un livre, maintenu par les signaux de Review
+class ReviewHistogram(models.Model):
+    book = models.OneToOneField(Book, primary_key=True, related_name='review_histogram', on_delete=models.CASCADE)
+    score_0 = models.PositiveIntegerField(default=0)
+    score_1 = models.PositiveIntegerField(default=0)
+    score_2 = models.PositiveIntegerField(default=0)
+    score_3 = models.PositiveIntegerField(default=0)
+    score_4 = models.PositiveIntegerField(default=0)
+    score_5 = models.PositiveIntegerField(default=0)
+
+    # Recalcule entièrement l'histogramme d'un livre à partir de ses reviews
+    @classmethod
+    def rebuild(cls, book_id):
+        counts = dict(Review.objects.filter(book_id=book_id).order_by().values_list('score').annotate(total=models.Count('pk')))
+        cls.objects.update_or_create(book_id=book_id, defaults={f"score_{score}": counts.get(score, 0) for score in range(6)})
+
+    def as_dict(self):
+        return {str(score): getattr(self, f"score_{score}") for score in range(6)}
+
+
+# Écart entre les positions de deux chapitres consécutifs
+CHAPTER_POSITION_STEP = 1024
+
 # Modèle pour créer la table de Chapitre
-class Chapter(models.Model):
+class Chapter(TrackedFieldsMixin, models.Model):
     # Variable pour les choix du type de chapitre
     TYPE_CHOICES = [
         ('prologue', 'Prologue'),
@@ -122,12 +244,27 @@ class Chapter(models.Model):
     chapter_number = models.IntegerField(null=True, blank=True)
     slug = models.SlugField()
     sort_order = models.IntegerField(editable=False, default=1)
+    # Position libre dans le livre (espacée de CHAPTER_POSITION_STEP pour pouvoir insérer entre deux chapitres)
+    position = models.IntegerField(editable=False, default=0)
+    # Statistiques de lecture calculées à chaque sauvegarde
+    word_count = models.PositiveIntegerField(default=0)
+    char_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveIntegerField(default=0)
+    # Nombre de commentaires, maintenu par les signaux de ChapterComment
+    comment_count = models.PositiveIntegerField(default=0)
+    # Nombre de lectures, écrit par lots par api/counters.py
+    view_count = models.PositiveBigIntegerField(default=0)
+
+    maintained_fields = ['position', 'comment_count', 'view_count']
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['book', 'slug'], name='unique_chapter_per_book_slug')
         ]
-        ordering = ['sort_order', 'chapter_number']
+        ordering = ['sort_order', 'position', 'chapter_number']
+        indexes = [
+            models.Index(fields=['book', 'sort_order', 'position'], name='chapter_book_order_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Déterminer le slug "de base" selon le type
@@ -166,7 +303,16 @@ class Chapter(models.Model):
         else:
             self.sort_order = 3
 
-        super().save(*args, **kwargs)
+        # Un nouveau chapitre est placé à la fin du livre
+        if self._state.adding and not self.position:
+            last_position = Chapter.objects.filter(book=self.book).aggregate(last=models.Max('position'))['last'] or 0
+            self.position = last_position + CHAPTER_POSITION_STEP
+
+        # Calcule les statistiques de lecture et met à jour les totaux du livre dans la même transaction
+        self.word_count, self.char_count, self.reading_time = compute_text_stats(self.content)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.book.update_reading_stats()
 
     # Vérifie la cohérence du type de chapitre et du numéro de chapitre
     def clean(self):
@@ -175,6 +321,22 @@ class Chapter(models.Model):
         if self.type != 'chapitre' and self.chapter_number is not None:
             raise ValidationError("L'épilogue et le prologue ne doivent pas avoir de numéro de chapitre.")
 
+# Modèle pour stocker l'historique des versions d'un chapitre
+# Une révision sur REVISION_SNAPSHOT_INTERVAL est une copie complète compressée, les autres sont des diffs compressés avec la précédente
+class ChapterRevision(models.Model):
+    chapter = models.ForeignKey(Chapter, related_name='revisions', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(default=0) # taille du texte reconstruit
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['chapter', 'number'], name='unique_revision_number_per_chapter')
+        ]
+
 # Modèle pour stocker les commentaires des utilisateurs sur les chapitres
 class ChapterComment(models.Model):
     chapter = models.ForeignKey(Chapter, related_name='comments', on_delete=models.CASCADE)
@@ -193,6 +355,8 @@ class ChapterComment(models.Model):
 class Favorite(models.Model):
     user = models.ForeignKey(User, related_name='favorites', on_delete=models.CASCADE)
     book = models.ForeignKey(Book, related_name='favorites', on_delete=models.CASCADE)
+    # Date d'ajout (vide pour les lignes antérieures à ce champ, ignorées par le score de tendance)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
 
     class Meta:
         ordering = ['book__title']
@@ -201,6 +365,8 @@ class Favorite(models.Model):
 class FollowedAuthor(models.Model):
     user = models.ForeignKey(User, related_name='followers', on_delete=models.CASCADE)
     author = models.ForeignKey(User, related_name='followed_authors', on_delete=models.CASCADE)
+    # Date d'ajout (vide pour les lignes antérieures à ce champ, ignorées par le score de tendance)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
 
     class Meta:
         ordering = ['author__author_name']
@@ -210,8 +376,49 @@ class FollowedAuthor(models.Model):
         if self.user == self.author:
             raise ValidationError("Un utilisateur ne peut pas se suivre lui-même")
 
+# Modèle pour les événements à notifier aux abonnés d'un auteur (nouveau livre, nouveau chapitre)
+# fanned_out : copié dans la boîte de chaque abonné ; sinon (auteur très suivi) lu directement à la consultation
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('book', 'Nouveau livre'),
+        ('chapter', 'Nouveau chapitre'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    author = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, related_name='notifications', on_delete=models.CASCADE)
+    chapter = models.ForeignKey(Chapter, related_name='notifications', null=True, blank=True, on_delete=models.CASCADE)
+    fanned_out = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['author', 'fanned_out', '-id'], name='notification_author_idx')]
+
+# Modèle pour la boîte de notifications d'un utilisateur (une ligne par abonné et par événement)
+class InboxEntry(models.Model):
+    user = models.ForeignKey(User, related_name='inbox', on_delete=models.CASCADE)
+    notification = models.ForeignKey(Notification, related_name='inbox_entries', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'notification'], name='unique_inbox_entry')]
+
+# Modèle pour la progression de lecture d'un utilisateur dans un livre (une ligne par livre, synchronisée entre appareils)
+class ReadingProgress(models.Model):
+    user = models.ForeignKey(User, related_name='reading_progress', on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, related_name='reading_progress', on_delete=models.CASCADE)
+    chapter = models.ForeignKey(Chapter, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    # Position dans le chapitre (en caractères)
+    offset = models.PositiveIntegerField(default=0)
+    # Date de lecture envoyée par l'appareil : la progression la plus récente l'emporte
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'book'], name='unique_progress_per_user_per_book')]
+        # Liste "continuer la lecture" : progressions d'un utilisateur de la plus récente à la plus ancienne
+        indexes = [models.Index(fields=['user', '-updated_at'], name='progress_user_recent_idx')]
+
 # Modèle pour créer la table de Lieux
-class Place(models.Model):
+class Place(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=30)
     image = models.ImageField(storage=MediaCloudinaryStorage(),upload_to='place/')
     content = models.TextField(max_length=1000)
@@ -236,7 +443,7 @@ class Place(models.Model):
         ]
 
 # Modèle pour créer la table de Créatures
-class Creature(models.Model):
+class Creature(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=30)
     image = models.ImageField(storage=MediaCloudinaryStorage(),upload_to='creatures/')
     content = models.TextField(max_length=1000)
@@ -262,7 +469,7 @@ class Creature(models.Model):
      
 
 # Modèle pour créer la table de Personnages
-class Character(models.Model):
+class Character(TrackedFieldsMixin, models.Model):
     ROLE_CHOICES = [
         ('protagoniste', 'Protagoniste'),
         ('antagoniste', 'Antagoniste'),
@@ -377,3 +584,126 @@ class Character(models.Model):
         if self.month_birth is not None and (self.month_birth < 1 or self.month_birth > 12):
             raise ValidationError("Le mois de naissance doit être compris entre 1 et 12.")
     
+
+
+# Modèle pour indexer les valeurs des champs JSON des personnages (index inversé : une ligne par valeur)
+# Sert au calcul des facettes et aux filtres sur les bases qui n'ont pas d'index GIN (SQLite)
+class CharacterAttribute(models.Model):
+    character = models.ForeignKey(Character, related_name='attributes', on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, related_name='character_attributes', on_delete=models.CASCADE)
+    field = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book', 'field', 'value'], name='character_attr_lookup_idx'),
+        ]
+
+# Modèle pour stocker les liens entre personnages extraits du champ family (une ligne par lien)
+class CharacterRelation(models.Model):
+    book = models.ForeignKey(Book, related_name='character_relations', on_delete=models.CASCADE)
+    source = models.ForeignKey(Character, related_name='relations', on_delete=models.CASCADE)
+    # Personnage cible s'il existe dans le livre, sinon seul son nom est conservé
+    target = models.ForeignKey(Character, related_name='incoming_relations', null=True, blank=True, on_delete=models.SET_NULL)
+    target_name = models.CharField(max_length=200)
+    relation = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book', 'target_name'], name='character_relation_name_idx'),
+        ]
+
+# Modèle pour l'index de recherche commun aux livres, personnages, lieux et créatures (une ligne par élément indexé)
+class SearchEntry(models.Model):
+    KIND_CHOICES = [
+        ('book', 'Livre'),
+        ('character', 'Personnage'),
+        ('place', 'Lieu'),
+        ('creature', 'Créature'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    book = models.ForeignKey(Book, related_name='search_entries', on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200)
+    excerpt = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry_per_object')
+        ]
+
+# Modèle pour les termes de l'index de recherche (index inversé : terme -> éléments, avec un poids)
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=50, db_index=True)
+    entry = models.ForeignKey(SearchEntry, related_name='terms', on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+# Journal des livres modifiés, rejoué par le catalogue en mémoire de chaque processus web (voir api/catalog.py)
+# book_id vide : tout le catalogue est à recharger (mise à jour en masse)
+class CatalogChange(models.Model):
+    book_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+# Suppression par lots d'un compte ou d'un livre, exécutée en arrière-plan (voir api/deletion.py)
+class DeletionJob(models.Model):
+    KIND_CHOICES = [
+        ('user', 'Compte'),
+        ('book', 'Livre'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminée'),
+        ('failed', 'Échouée'),
+    ]
+
+    token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    label = models.CharField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    # Progression : nombre de lignes à supprimer (estimé au démarrage), déjà supprimées, et détail par table
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    progress = models.JSONField(default=dict)
+    # Hausse du pic de mémoire du processus pendant la suppression (Ko)
+    memory_growth = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+# Tâche différée exécutée par les workers (voir api/jobs.py et la commande run_worker)
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminée'),
+        ('failed', 'Échouée'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # Une seule tâche en attente par clé : les demandes suivantes sont fusionnées avec elle
+    dedup_key = models.CharField(max_length=200, null=True, blank=True)
+    # Date à partir de laquelle la tâche peut être prise (exécution différée, attente entre deux essais)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Worker qui exécute la tâche et date de la prise (une tâche "en cours" trop ancienne est reprise)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['dedup_key'], condition=models.Q(status='queued'), name='unique_queued_job_dedup_key')]
+        indexes = [
+            # Prise des tâches : WHERE status = 'queued' AND run_at <= now ORDER BY run_at
+            models.Index(fields=['status', 'run_at'], name='job_claim_idx'),
+            models.Index(fields=['locked_by'], name='job_locked_by_idx'),
+        ]
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import User, FollowedAuthor, Notification, InboxEntry
+from .jobs import enqueue
+
+# Au-delà de ce nombre d'abonnés, les notifications d'un auteur ne sont plus copiées dans chaque boîte :
+# elles sont lues directement dans la table des notifications à la consultation (fan-out à la lecture)
+NOTIFICATION_FANOUT_THRESHOLD = 1000
+# Nombre d'abonnés traités par lot lors de la copie dans les boîtes
+NOTIFICATION_BATCH_SIZE = 1000
+
+
+# Enregistre un nouveau livre ou chapitre à notifier ; la copie dans les boîtes des abonnés est une tâche de fond
+def publish_notification(kind, book, chapter=None):
+    fanned_out = FollowedAuthor.objects.filter(author_id=book.author_id).count() <= NOTIFICATION_FANOUT_THRESHOLD
+    notification = Notification.objects.create(kind=kind, author_id=book.author_id, book=book, chapter=chapter, fanned_out=fanned_out)
+    if fanned_out:
+        enqueue(fan_out_notification, {'notification_id': notification.pk})
+    return notification
+
+
+# Copie une notification dans la boîte de chaque abonné, par lots : un INSERT et un UPDATE du compteur de non-lus par lot
+# Les abonnés déjà servis sont ignorés : une tâche relancée après une erreur ne compte pas deux fois la même notification
+def fan_out_notification(notification_id):
+    notification = Notification.objects.filter(pk=notification_id).first()
+    if notification is None:
+        return 0
+    followers = FollowedAuthor.objects.filter(author_id=notification.author_id).order_by('user_id').values_list('user_id', flat=True)
+    total = 0
+    last_id = 0
+    while True:
+        user_ids = list(followers.filter(user_id__gt=last_id)[:NOTIFICATION_BATCH_SIZE])
+        if not user_ids:
+            return total
+        last_id = user_ids[-1]
+        with transaction.atomic():
+            served = set(InboxEntry.objects.filter(notification=notification, user_id__in=user_ids).values_list('user_id', flat=True))
+            user_ids = [user_id for user_id in user_ids if user_id not in served]
+            InboxEntry.objects.bulk_create([InboxEntry(user_id=user_id, notification=notification) for user_id in user_ids], ignore_conflicts=True)
+            User.objects.filter(pk__in=user_ids).update(unread_notifications=F('unread_notifications') + 1)
+        total += len(user_ids)
+
+
+# Notifications d'un utilisateur : celles copiées dans sa boîte, plus celles des auteurs très suivis qu'il suit
+def notifications_for(user):
+    followed = FollowedAuthor.objects.filter(user=user).values('author_id')
+    return Notification.objects.filter(
+        Q(pk__in=InboxEntry.objects.filter(user=user).values('notification_id')) | Q(fanned_out=False, author_id__in=followed),
+        book__deleted_at__isnull=True,
+    ).select_related('author', 'book', 'chapter')
+
+
+# Non-lus : compteur maintenu à chaque copie dans la boîte, plus les notifications récentes des auteurs très suivis
+def unread_count(user):
+    pulled = Notification.objects.filter(fanned_out=False, author_id__in=FollowedAuthor.objects.filter(user=user).values('author_id'))
+    if user.notifications_read_at:
+        pulled = pulled.filter(created_at__gt=user.notifications_read_at)
+    return user.unread_notifications + pulled.count()
+
+
+def mark_notifications_read(user):
+    now = timezone.now()
+    User.objects.filter(pk=user.pk).update(unread_notifications=0, notifications_read_at=now)
+    user.unread_notifications, user.notifications_read_at = 0, now
@@ -1,6 +1,33 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 class BookPagination(PageNumberPagination):
     page_size = 5 # valeur par défaut
     page_size_query_param = "size" # ex: ?size=20
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+# Pagination par page de la recherche de personnages (le total est de toute façon calculé avec les facettes)
+class CharacterPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "size"
+    max_page_size = 100
+
+# Pagination par curseur des commentaires (pas de COUNT(*), stable quand de nouveaux commentaires arrivent)
+class CommentCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "size"
+    max_page_size = 100
+    ordering = ("-publication_date", "-id")
+
+# Pagination par curseur des reviews d'un livre, des plus récentes aux plus anciennes
+class ReviewCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = "size"
+    max_page_size = 100
+    ordering = ("-publication_date", "-id")
+
+# Pagination par curseur des notifications, des plus récentes aux plus anciennes
+class NotificationCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "size"
+    max_page_size = 100
+    ordering = ("-id",)
@@ -0,0 +1,83 @@
+from datetime import timezone as dt_timezone
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import User, Book, Chapter, ReadingProgress
+
+# Nombre maximal de progressions envoyées en une synchronisation
+PROGRESS_SYNC_MAX_ITEMS = 200
+
+
+def _parse_item(item, now):
+    if not isinstance(item, dict) or not item.get('book') or not isinstance(item['book'], str):
+        raise ValueError("Chaque progression doit préciser le slug du livre ('book').")
+    if item.get('chapter') and not isinstance(item['chapter'], str):
+        raise ValueError("'chapter' doit être le slug d'un chapitre.")
+    updated_at = parse_datetime(str(item['updated_at'])) if item.get('updated_at') else now
+    if updated_at is None:
+        raise ValueError("Date 'updated_at' invalide (format ISO 8601 attendu).")
+    if timezone.is_naive(updated_at):
+        updated_at = timezone.make_aware(updated_at, dt_timezone.utc)
+    try:
+        offset = int(item.get('offset') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("'offset' doit être un entier positif.")
+    if offset < 0:
+        raise ValueError("'offset' doit être un entier positif.")
+    # Une horloge d'appareil en avance ne doit pas bloquer les synchronisations suivantes
+    return {'chapter': item.get('chapter') or None, 'offset': offset, 'updated_at': min(updated_at, now)}
+
+
+# Applique un lot de progressions envoyé par un appareil, en un nombre fixe de requêtes quel que soit le nombre de livres
+# Pour chaque livre, la progression la plus récente (lot ou base) l'emporte
+# Retourne les progressions à jour des livres du lot et les slugs de livres inconnus
+def sync_reading_progress(user, items):
+    if not isinstance(items, list):
+        raise ValueError("'progress' doit être une liste.")
+    if len(items) > PROGRESS_SYNC_MAX_ITEMS:
+        raise ValueError(f"{PROGRESS_SYNC_MAX_ITEMS} progressions au maximum par synchronisation.")
+
+    now = timezone.now()
+    updates = {}
+    for item in items:
+        update = _parse_item(item, now)
+        current = updates.get(item['book'])
+        if current is None or update['updated_at'] >= current['updated_at']:
+            updates[item['book']] = update
+
+    books = dict(Book.objects.visible().filter(slug__in=updates).values_list('slug', 'pk'))
+    chapter_slugs = {update['chapter'] for update in updates.values() if update['chapter']}
+    chapters = {
+        (book_id, slug): pk
+        for pk, book_id, slug in Chapter.objects.filter(book_id__in=books.values(), slug__in=chapter_slugs).values_list('pk', 'book_id', 'slug')
+    }
+
+    with transaction.atomic():
+        # Verrou sur l'utilisateur : les synchronisations simultanées de ses appareils s'appliquent l'une après l'autre,
+        # aucune ne peut écrire une progression plus ancienne après la lecture de l'autre (y compris pour un livre sans progression)
+        User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True).first()
+        stored = dict(ReadingProgress.objects.filter(user=user, book_id__in=books.values()).values_list('book_id', 'updated_at'))
+
+        records = []
+        for slug, update in updates.items():
+            book_id = books.get(slug)
+            if book_id is None or (book_id in stored and stored[book_id] >= update['updated_at']):
+                continue
+            records.append(ReadingProgress(
+                user=user, book_id=book_id, chapter_id=chapters.get((book_id, update['chapter'])),
+                offset=update['offset'], updated_at=update['updated_at'],
+            ))
+        ReadingProgress.objects.bulk_create(records, update_conflicts=True, unique_fields=['user', 'book'], update_fields=['chapter', 'offset', 'updated_at'])
+
+    progress = continue_reading(user).filter(book_id__in=books.values())
+    return progress, sorted(set(updates) - set(books))
+
+
+# Liste "continuer la lecture" : une seule requête sur l'index (user, -updated_at), jointe au livre, à l'auteur et au chapitre
+def continue_reading(user, limit=None):
+    progress = (
+        ReadingProgress.objects.filter(user=user, book__deleted_at__isnull=True)
+        .select_related('book__author', 'chapter')
+        .order_by('-updated_at')
+    )
+    return progress[:limit] if limit else progress
@@ -0,0 +1,185 @@
+import functools
+import logging
+import math
+import threading
+import time
+from typing import NamedTuple
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# redis est optionnel : sans lui, seuls les seaux en mémoire du processus sont disponibles
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Durée des périodes utilisables dans les budgets ("120/min")
+PERIODS = {'s': 1, 'sec': 1, 'min': 60, 'hour': 3600, 'day': 86400}
+# Au-delà de ce nombre de seaux en mémoire, les seaux redevenus pleins sont oubliés
+LOCAL_BUCKETS_SWEEP_SIZE = 100_000
+
+
+class RateLimit(NamedTuple):
+    allowed: bool
+    limit: int
+    period: int
+    remaining: int
+    # Secondes avant que le seau soit de nouveau plein, et avant la prochaine requête autorisée si allowed=False
+    reset: int
+    retry_after: int
+
+
+# "120/min" -> (120, 60)
+def parse_rate(rate):
+    count, _, period = rate.partition('/')
+    if period not in PERIODS or not count.isdigit() or int(count) <= 0:
+        raise ValueError(f"Budget de requêtes invalide : {rate!r}")
+    return int(count), PERIODS[period]
+
+
+# Seau à jetons : limit jetons au plus, remplis au rythme de limit par period ; chaque requête consomme un jeton
+# Un client peut donc faire limit requêtes d'un coup, puis une toutes les period / limit secondes
+def _take(tokens, updated_at, now, limit, period):
+    tokens = min(limit, tokens + max(0.0, now - updated_at) * limit / period)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    return tokens, _result(allowed, tokens, limit, period)
+
+
+def _result(allowed, tokens, limit, period):
+    rate = limit / period
+    return RateLimit(
+        allowed, limit, period, int(tokens),
+        math.ceil((limit - tokens) / rate), 0 if allowed else math.ceil((1 - tokens) / rate),
+    )
+
+
+# Seaux gardés en mémoire du processus (développement et tests) : chaque processus web a ses propres budgets
+class LocalBuckets:
+    shared = False
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, limit, period):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (limit, now))
+            tokens, result = _take(tokens, updated_at, now, limit, period)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > LOCAL_BUCKETS_SWEEP_SIZE:
+                self.sweep(now)
+        return result
+
+    # Oublie les seaux inactifs depuis plus d'une journée (ils seraient de nouveau pleins)
+    def sweep(self, now):
+        self.buckets = {key: state for key, state in self.buckets.items() if now - state[1] < PERIODS['day']}
+
+    def clear(self):
+        with self.lock:
+            self.buckets = {}
+
+
+# Seaux partagés entre processus dans Redis (RATE_LIMIT_REDIS_URL), choisis par défaut dès que l'URL est définie
+# Lecture, remplissage et consommation se font dans un script Lua : un seul aller-retour, atomique
+class RedisBuckets:
+    shared = True
+    script = """
+    local limit, period, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or limit
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(limit, tokens + math.max(0, now - updated_at) * limit / period)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], period)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self):
+        if redis is None:
+            raise RuntimeError("RedisBuckets nécessite le paquet redis.")
+        self.client = redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL)
+        self.take_script = self.client.register_script(self.script)
+
+    def take(self, key, limit, period):
+        now = time.time()
+        allowed, tokens = self.take_script(keys=[f"ratelimit:{key}"], args=[limit, period, now])
+        return _result(bool(allowed), float(tokens), limit, period)
+
+
+_buckets = None
+
+
+# Appelée au démarrage (ApiConfig.ready) : hors DEBUG, des seaux propres à chaque processus multiplient les budgets
+def warn_if_not_shared():
+    if settings.RATE_LIMIT_ENABLED and not settings.DEBUG and not getattr(import_string(settings.RATE_LIMIT_BACKEND), 'shared', False):
+        logger.warning(
+            "Limite de requêtes en mémoire du processus (%s) : chaque processus a ses propres budgets. "
+            "Définir RATE_LIMIT_REDIS_URL (ou REDIS_URL) pour les partager.", settings.RATE_LIMIT_BACKEND,
+        )
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        _buckets = import_string(settings.RATE_LIMIT_BACKEND)()
+    return _buckets
+
+
+# Budgets par nom d'URL déclarés dans api/urls.py, et budget des autres routes (RATE_LIMIT_DEFAULT)
+# Lus au premier appel : urls.py importe les vues, qui importent ce module. None : route sans limite
+@functools.cache
+def route_budgets():
+    from .urls import RATE_LIMITS
+    return {name: rate and parse_rate(rate) for name, rate in RATE_LIMITS.items()}, parse_rate(settings.RATE_LIMIT_DEFAULT)
+
+
+def budget_for(url_name):
+    budgets, default = route_budgets()
+    return budgets.get(url_name, default)
+
+
+# Adresse du client : derrière RATE_LIMIT_PROXY_COUNT proxys, l'entrée ajoutée par le premier d'entre eux dans X-Forwarded-For
+def client_ip(request):
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[max(0, len(addresses) - proxies)]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# Consomme un jeton du seau identity (ex: "user:12", "ip:1.2.3.4") pour la route demandée
+# Le résultat est gardé sur la requête pour les en-têtes RateLimit-* de la réponse (voir RateLimitMiddleware)
+def check_rate_limit(request, identity):
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    django_request = getattr(request, '_request', request)
+    url_name = django_request.resolver_match.url_name if django_request.resolver_match else None
+    budget = budget_for(url_name)
+    if budget is None:
+        return None
+    result = get_buckets().take(f"{identity}:{url_name}", *budget)
+    django_request.rate_limit = result
+    return result
+
+
+# En-têtes du brouillon IETF "RateLimit header fields for HTTP"
+def set_rate_limit_headers(response, result):
+    response['RateLimit-Limit'] = str(result.limit)
+    response['RateLimit-Remaining'] = str(result.remaining)
+    response['RateLimit-Reset'] = str(result.reset)
+    response['RateLimit-Policy'] = f"{result.limit};w={result.period}"
+    if not result.allowed:
+        response['Retry-After'] = str(result.retry_after)
+        # Un refus ne doit pas être gardé en cache par le CDN ou le navigateur
+        response['Cache-Control'] = 'no-store'
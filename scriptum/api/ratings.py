@@ -0,0 +1,20 @@
+from .models import Book
+from .jobs import enqueue
+from .cdn import purge_surrogate_keys, book_keys
+
+# Délai avant le recalcul de la note : les reviews d'un même livre arrivées entre-temps ne déclenchent qu'un recalcul
+RATING_UPDATE_DELAY = 5
+
+
+# Recalcule la note d'un livre en tâche de fond (une seule tâche en attente par livre)
+def schedule_rating_update(book_id):
+    enqueue(update_book_rating, {'book_id': book_id}, dedup_key=f"book-rating:{book_id}", delay=RATING_UPDATE_DELAY)
+
+
+# La note change après la réponse de createreview : les pages qui l'affichent sont purgées ici, une fois recalculée,
+# sinon le CDN remettrait en cache l'ancienne note entre la purge de la vue et ce recalcul
+def update_book_rating(book_id):
+    book = Book.objects.select_related('author').filter(pk=book_id).first()
+    if book is not None:
+        book.update_rating()
+        purge_surrogate_keys(book_keys(book))
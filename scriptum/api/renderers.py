@@ -0,0 +1,90 @@
+from itertools import islice
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson est optionnel : sans lui, le rendu JSON standard de DRF est utilisé
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgpack est optionnel : les classes MessagePack ne sont déclarées dans settings.py que s'il est installé
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Nombre d'éléments sérialisés puis envoyés à la fois dans une réponse en flux
+STREAM_CHUNK_SIZE = 200
+
+_encoder = JSONEncoder()
+
+
+# Rendu JSON avec orjson (UUID, dates et dict/list natifs) ; les autres types (Decimal, textes traduits...)
+# passent par l'encodeur de DRF. Avec une indentation demandée, on garde le rendu de DRF
+# OPT_UTC_Z : les dates UTC finissent par "Z", comme avec l'encodeur de DRF
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+# Format binaire MessagePack, choisi avec "Accept: application/msgpack" (ou ?format=msgpack)
+# Les types sans équivalent MessagePack (UUID, dates, Decimal) sont convertis comme en JSON, pour renvoyer les mêmes données
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+# Corps de requête MessagePack, envoyé avec "Content-Type: application/msgpack"
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError):
+            raise ParseError("Corps MessagePack invalide.")
+
+
+# Pour les listes non paginées : au-delà de STREAM_CHUNK_SIZE éléments, la réponse est envoyée par morceaux
+# (lecture en base, sérialisation et rendu par lots) au lieu d'être construite entièrement en mémoire
+class StreamingListMixin:
+    stream_chunk_size = STREAM_CHUNK_SIZE
+
+    def list(self, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        if self.paginator is not None or not isinstance(renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        items = queryset.iterator(chunk_size=self.stream_chunk_size)
+        first = list(islice(items, self.stream_chunk_size + 1))
+        if len(first) <= self.stream_chunk_size:
+            return Response(self.get_serializer(first, many=True).data)
+
+        return StreamingHttpResponse(self.stream(renderer, first, items), content_type=renderer.media_type)
+
+    def stream(self, renderer, batch, items):
+        yield b'['
+        separator = b''
+        while batch:
+            # Chaque lot est rendu comme une liste JSON dont on retire les crochets
+            yield separator + renderer.render(self.get_serializer(batch, many=True).data)[1:-1]
+            separator = b','
+            batch = list(islice(items, self.stream_chunk_size))
+        yield b']'
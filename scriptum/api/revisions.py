@@ -0,0 +1,92 @@
+import json
+import zlib
+from difflib import SequenceMatcher
+from django.db import transaction
+from .models import Chapter, ChapterRevision
+
+# Une copie complète toutes les REVISION_SNAPSHOT_INTERVAL révisions :
+# reconstruire une version demande au plus une copie et REVISION_SNAPSHOT_INTERVAL - 1 diffs
+REVISION_SNAPSHOT_INTERVAL = 20
+
+
+# Compresse une copie complète du texte
+def encode_snapshot(text):
+    return zlib.compress(text.encode('utf-8'))
+
+
+# Compresse le diff ligne à ligne entre deux versions
+# Chaque opération est soit [début, fin] (lignes à recopier depuis l'ancienne version), soit un texte à insérer
+def encode_delta(old_text, new_text):
+    old_lines = old_text.splitlines(keepends=True)
+    new_lines = new_text.splitlines(keepends=True)
+    operations = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j2 > j1:
+            operations.append(''.join(new_lines[j1:j2]))
+    return zlib.compress(json.dumps(operations, separators=(',', ':')).encode('utf-8'))
+
+
+# Reconstruit le texte d'une révision à partir de ses données et du texte de la révision précédente
+def decode_revision(is_snapshot, data, previous_text=None):
+    raw = zlib.decompress(bytes(data)).decode('utf-8')
+    if is_snapshot:
+        return raw
+    old_lines = previous_text.splitlines(keepends=True)
+    parts = []
+    for operation in json.loads(raw):
+        if isinstance(operation, list):
+            parts.extend(old_lines[operation[0]:operation[1]])
+        else:
+            parts.append(operation)
+    return ''.join(parts)
+
+
+# Indique si la révision numéro "number" doit être une copie complète
+def is_snapshot_number(number):
+    return (number - 1) % REVISION_SNAPSHOT_INTERVAL == 0
+
+
+# Reconstruit le contenu d'une révision (2 requêtes : la copie complète de référence puis les diffs suivants)
+def get_revision_content(chapter, number):
+    snapshot = chapter.revisions.filter(is_snapshot=True, number__lte=number).order_by('-number').values_list('number', flat=True).first()
+    if snapshot is None:
+        raise ChapterRevision.DoesNotExist
+    revisions = chapter.revisions.filter(number__gte=snapshot, number__lte=number).order_by('number').values_list('number', 'is_snapshot', 'data')
+
+    text = None
+    last_number = None
+    for last_number, is_snapshot, data in revisions:
+        text = decode_revision(is_snapshot, data, text)
+    if last_number != number:
+        raise ChapterRevision.DoesNotExist
+    return text
+
+
+def _create_revision(chapter, number, text, previous_text):
+    snapshot = previous_text is None or is_snapshot_number(number)
+    data = encode_snapshot(text) if snapshot else encode_delta(previous_text, text)
+    return ChapterRevision.objects.create(chapter=chapter, number=number, is_snapshot=snapshot, data=data, size=len(text))
+
+
+# Enregistre le contenu actuel du chapitre comme nouvelle révision
+# previous_content permet de conserver l'ancienne version d'un chapitre qui n'avait pas encore d'historique
+# À appeler dans la même transaction que la sauvegarde du chapitre : la révision est validée (ou annulée) avec lui
+def record_revision(chapter, previous_content=None):
+    with transaction.atomic():
+        # Verrou sur la ligne du chapitre : deux sauvegardes simultanées numérotent leurs révisions l'une après l'autre,
+        # y compris la toute première (verrouiller la dernière révision ne verrouille rien quand il n'y en a pas)
+        Chapter.objects.select_for_update().filter(pk=chapter.pk).values_list('pk', flat=True).first()
+        last = chapter.revisions.order_by('-number').only('number', 'chapter').first()
+
+        if last is None:
+            if previous_content is not None and previous_content != chapter.content:
+                _create_revision(chapter, 1, previous_content, None)
+                return _create_revision(chapter, 2, chapter.content, previous_content)
+            return _create_revision(chapter, 1, chapter.content, None)
+
+        latest_content = get_revision_content(chapter, last.number)
+        if latest_content == chapter.content:
+            return last
+        return _create_revision(chapter, last.number + 1, chapter.content, latest_content)
@@ -0,0 +1,163 @@
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+from .models import Book, Character, Place, Creature, SearchEntry, SearchTerm
+
+# Mots trop fréquents pour être utiles à la recherche
+STOP_WORDS = {
+    'au', 'aux', 'avec', 'ce', 'ces', 'dans', 'de', 'des', 'du', 'elle', 'en', 'et', 'eux', 'il', 'ils', 'je', 'la', 'le',
+    'les', 'leur', 'lui', 'ma', 'mais', 'me', 'mes', 'moi', 'mon', 'ne', 'nos', 'notre', 'nous', 'on', 'ou', 'par', 'pas',
+    'pour', 'qu', 'que', 'qui', 'sa', 'se', 'ses', 'son', 'sur', 'ta', 'te', 'tes', 'toi', 'ton', 'tu', 'un', 'une', 'vos',
+    'votre', 'vous', 'est', 'sont', 'était', 'etait', 'the', 'of', 'and',
+}
+
+# Longueur maximale d'un terme (longueur de SearchTerm.term)
+MAX_TERM_LENGTH = 50
+
+# Champs indexés par type d'élément : (champ, poids). Les noms pèsent plus lourd que les textes
+SEARCH_FIELDS = {
+    'book': [('title', 3.0), ('tome_name', 2.0), ('description', 1.0)],
+    'character': [('name', 3.0), ('surname', 3.0), ('background', 1.0)],
+    'place': [('name', 3.0), ('content', 1.0)],
+    'creature': [('name', 3.0), ('content', 1.0)],
+}
+
+SEARCH_MODELS = {
+    'book': Book,
+    'character': Character,
+    'place': Place,
+    'creature': Creature,
+}
+
+# Champ texte utilisé pour l'extrait affiché dans les résultats
+EXCERPT_FIELDS = {
+    'book': 'description',
+    'character': 'background',
+    'place': 'content',
+    'creature': 'content',
+}
+
+# Champs dont dépend l'entrée d'un élément dans l'index : il n'est réindexé que si l'un d'eux change
+INDEXED_FIELDS = {
+    kind: {field for field, _ in fields} | {EXCERPT_FIELDS[kind], 'slug', 'title' if kind == 'book' else 'name'}
+    for kind, fields in SEARCH_FIELDS.items()
+}
+
+
+# Met un texte en minuscules et retire les accents ("Forêt" -> "foret")
+def normalize_text(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+# Découpe un texte en termes normalisés (minuscules, sans accents, sans mots vides)
+def tokenize(text):
+    return [term[:MAX_TERM_LENGTH] for term in re.findall(r'[a-z0-9]+', normalize_text(text)) if len(term) > 1 and term not in STOP_WORDS]
+
+
+# Poids de chaque terme d'un élément : somme sur les champs de poids_du_champ * (1 + log(occurrences))
+def compute_terms(kind, instance):
+    weights = defaultdict(float)
+    for field, field_weight in SEARCH_FIELDS[kind]:
+        counts = defaultdict(int)
+        for term in tokenize(getattr(instance, field, '')):
+            counts[term] += 1
+        for term, count in counts.items():
+            weights[term] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def _entry_values(kind, instance):
+    book_id = instance.pk if kind == 'book' else instance.book_id
+    title = instance.title if kind == 'book' else instance.name
+    excerpt = (getattr(instance, EXCERPT_FIELDS[kind]) or '')[:200]
+    return {'book_id': book_id, 'title': title[:200], 'slug': instance.slug or '', 'excerpt': excerpt}
+
+
+# Indexe (ou réindexe) un élément après sa sauvegarde
+def index_object(kind, instance):
+    with transaction.atomic():
+        entry, _ = SearchEntry.objects.update_or_create(kind=kind, object_id=instance.pk, defaults=_entry_values(kind, instance))
+        SearchTerm.objects.filter(entry=entry).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(entry=entry, term=term, weight=weight) for term, weight in compute_terms(kind, instance).items()
+        ])
+
+
+# Retire un élément de l'index après sa suppression
+def remove_object(kind, pk):
+    SearchEntry.objects.filter(kind=kind, object_id=pk).delete()
+
+
+# Recherche dans l'index : le dernier mot de la requête est traité comme un préfixe (recherche pendant la saisie)
+# Les résultats sont classés par nombre de mots de la requête trouvés puis par poids total
+def search(query, kind=None, limit=20):
+    terms = tokenize(query)
+    if not terms:
+        return []
+    *full_terms, prefix = terms
+    full_terms = list(dict.fromkeys(full_terms))
+
+    matches = SearchTerm.objects.filter(Q(term__in=full_terms) | Q(term__startswith=prefix), entry__book__deleted_at__isnull=True)
+    if kind:
+        matches = matches.filter(entry__kind=kind)
+    # Un mot de la requête compte une fois par élément, quel que soit le nombre de termes indexés qui le contiennent (préfixe)
+    token_matches = [Q(term=term) for term in full_terms] + [Q(term__startswith=prefix)]
+    matched = sum(
+        (Max(Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField())) for condition in token_matches),
+        Value(0),
+    )
+    ranking = list(
+        matches.values('entry')
+        .annotate(matched=matched, score=Sum('weight'))
+        .order_by('-matched', '-score', 'entry')[:limit]
+    )
+
+    entries = SearchEntry.objects.select_related('book').in_bulk([row['entry'] for row in ranking])
+    results = []
+    for row in ranking:
+        entry = entries[row['entry']]
+        results.append({
+            'type': entry.kind,
+            'slug': entry.slug,
+            'title': entry.title,
+            'book_slug': entry.book.slug,
+            'book_title': entry.book.title,
+            'excerpt': entry.excerpt,
+            'score': round(row['score'], 3),
+        })
+    return results
+
+
+# Reconstruit tout l'index en parcourant chaque table par lots (sans tout charger en mémoire)
+def rebuild_search_index(chunk_size=500):
+    total = 0
+    SearchEntry.objects.all().delete()
+    for kind, model in SEARCH_MODELS.items():
+        fields = set(INDEXED_FIELDS[kind])
+        if kind != 'book':
+            fields.add('book_id')
+        batch = []
+        for instance in model.objects.only('pk', *fields).order_by('pk').iterator(chunk_size=chunk_size):
+            batch.append(instance)
+            if len(batch) >= chunk_size:
+                total += _index_batch(kind, batch)
+                batch = []
+        total += _index_batch(kind, batch)
+    return total
+
+
+def _index_batch(kind, instances):
+    with transaction.atomic():
+        entries = SearchEntry.objects.bulk_create([
+            SearchEntry(kind=kind, object_id=instance.pk, **_entry_values(kind, instance)) for instance in instances
+        ])
+        SearchTerm.objects.bulk_create([
+            SearchTerm(entry=entry, term=term, weight=weight)
+            for entry, instance in zip(entries, instances)
+            for term, weight in compute_terms(kind, instance).items()
+        ], batch_size=1000)
+    return len(instances)
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.conf import settings
-from .models import User, Genre, Theme, Book, Review, Chapter, Character, Place, Creature, Favorite, FollowedAuthor
+from .fieldsets import SparseFieldsMixin
+from .character_search import CHARACTER_FACET_FIELDS, strip_values
+from .models import User, Genre, Theme, Book, Review, Chapter, ChapterRevision, ChapterComment, Character, Place, Creature, Favorite, FollowedAuthor, ReadingProgress, Notification, DeletionJob
 import json
 
 # Serializer pour créer un utilisateur dans Postgre
@@ -51,7 +53,7 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = "__all__"
-        read_only_fields = ["author", "slug", "release_date", "rating"]
+        read_only_fields = ["author", "slug", "release_date", "rating", "trending_score", "trending_updated_at", "last_activity_at", "word_count", "char_count", "reading_time", "view_count", "deleted_at"]
 
     def to_internal_value(self, data):
         # Convertir is_saga en booléen si besoin
@@ -130,7 +132,7 @@ class BookSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
     
-class BookReadSerializer(serializers.ModelSerializer):
+class BookReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     genres = serializers.SlugRelatedField(many=True, read_only=True, slug_field='name')
     themes = serializers.SlugRelatedField(many=True, read_only=True, slug_field='name')
     author_name = serializers.CharField(source="author.author_name", read_only=True)
@@ -140,9 +142,9 @@ class BookReadSerializer(serializers.ModelSerializer):
         model = Book
         fields = "__all__"
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = serializers.SlugRelatedField(
-        queryset=Book.objects.all(),
+        queryset=Book.objects.visible(),
         slug_field='slug'
     )
     book_title = serializers.CharField(source='book.title', read_only=True)
@@ -154,9 +156,9 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ['publication_date', 'user']
 
-class ChapterSerializer(serializers.ModelSerializer):
+class ChapterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = serializers.SlugRelatedField(
-        queryset=Book.objects.all(),
+        queryset=Book.objects.visible(),
         slug_field='slug'
     )
     book_title = serializers.CharField(source='book.title', read_only=True)
@@ -164,11 +166,27 @@ class ChapterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chapter
         fields = "__all__"
-        read_only_fields = ['slug', 'sort_order']
+        read_only_fields = ['slug', 'sort_order', 'word_count', 'char_count', 'reading_time', 'comment_count', 'view_count']
 
-class CharacterSerializer(serializers.ModelSerializer):
+# Serializer pour la liste des révisions d'un chapitre (sans le contenu)
+class ChapterRevisionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChapterRevision
+        fields = ['number', 'is_snapshot', 'size', 'created_at']
+
+class ChapterCommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    user_pseudo = serializers.CharField(source='user.pseudo', read_only=True)
+    chapter = serializers.SlugRelatedField(read_only=True, slug_field='slug')
+
+    class Meta:
+        model = ChapterComment
+        fields = "__all__"
+        read_only_fields = ['publication_date', 'user', 'chapter']
+
+class CharacterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = serializers.SlugRelatedField(
-        queryset=Book.objects.all(),
+        queryset=Book.objects.visible(),
         slug_field='slug'
     )
     zodiac_sign = serializers.ReadOnlyField()
@@ -181,14 +199,23 @@ class CharacterSerializer(serializers.ModelSerializer):
     fears = serializers.JSONField(required=False)
     talents = serializers.JSONField(required=False)
 
+    sparse_dependencies = {'zodiac_sign': ['day_birth', 'month_birth']}
+
+    # Les champs filtrables sont enregistrés sans espaces autour de leurs valeurs, comme dans l'index de recherche
+    def validate(self, data):
+        for field in CHARACTER_FACET_FIELDS:
+            if field in data:
+                data[field] = strip_values(data[field])
+        return data
+
     class Meta:
         model = Character
         fields = "__all__"
         read_only_fields = ['slug', 'book']
 
-class PlaceSerializer(serializers.ModelSerializer):
+class PlaceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = serializers.SlugRelatedField(
-        queryset=Book.objects.all(),
+        queryset=Book.objects.visible(),
         slug_field='slug'
     )
     class Meta:
@@ -196,9 +223,9 @@ class PlaceSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ['book', 'slug']
 
-class CreatureSerializer(serializers.ModelSerializer):
+class CreatureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     book = serializers.SlugRelatedField(
-        queryset=Book.objects.all(),
+        queryset=Book.objects.visible(),
         slug_field='slug'
     )
     class Meta:
@@ -206,9 +233,9 @@ class CreatureSerializer(serializers.ModelSerializer):
         fields = "__all__"
         read_only_fields = ['book', 'slug']
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
-    book = serializers.SlugRelatedField(queryset=Book.objects.all(), slug_field='slug')
+    book = serializers.SlugRelatedField(queryset=Book.objects.visible(), slug_field='slug')
     user_pseudo = serializers.CharField(source='user.pseudo', read_only=True)
     book_image = serializers.ImageField(source='book.image', read_only=True)
     book_title = serializers.CharField(source='book.title', read_only=True)
@@ -228,17 +255,55 @@ class AuthorWithBooksSerializer(serializers.ModelSerializer):
         model= User
         fields = ["author_name", "books"]
 
-class FollowedAuthorSerializer(serializers.ModelSerializer):
+class FollowedAuthorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     author = AuthorWithBooksSerializer(read_only=True)
 
     author_name = serializers.SlugRelatedField(
         slug_field="author_name",
-        queryset=User.objects.all(),
+        queryset=User.objects.filter(deleted_at__isnull=True),
         source="author",
         write_only=True
     )
 
     class Meta:
         model = FollowedAuthor
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+# Serializer pour la progression de lecture, avec la carte du livre (liste "continuer la lecture")
+class ReadingProgressSerializer(serializers.ModelSerializer):
+    book = serializers.SlugRelatedField(read_only=True, slug_field='slug')
+    chapter = serializers.SlugRelatedField(read_only=True, slug_field='slug')
+    chapter_title = serializers.CharField(source='chapter.title', read_only=True)
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    book_image = serializers.ImageField(source='book.image', read_only=True)
+    book_state = serializers.CharField(source='book.state', read_only=True)
+    book_author = serializers.CharField(source='book.author.author_name', read_only=True)
+
+    class Meta:
+        model = ReadingProgress
+        fields = ['book', 'chapter', 'offset', 'updated_at', 'chapter_title', 'book_title', 'book_image', 'book_state', 'book_author']
+
+# Serializer pour les notifications (nouveau livre ou chapitre d'un auteur suivi)
+class NotificationSerializer(serializers.ModelSerializer):
+    author_name = serializers.CharField(source='author.author_name', read_only=True)
+    book = serializers.SlugRelatedField(read_only=True, slug_field='slug')
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    chapter = serializers.SlugRelatedField(read_only=True, slug_field='slug')
+    chapter_title = serializers.CharField(source='chapter.title', read_only=True)
+    unread = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'created_at', 'author_name', 'book', 'book_title', 'chapter', 'chapter_title', 'unread']
+
+    # Non lue si elle est arrivée après la dernière lecture de la boîte
+    def get_unread(self, obj):
+        read_at = self.context.get('read_at')
+        return read_at is None or obj.created_at > read_at
+
+# Serializer pour le suivi d'une suppression en arrière-plan
+class DeletionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletionJob
+        fields = ['token', 'kind', 'label', 'status', 'total', 'deleted', 'progress', 'memory_growth', 'created_at', 'updated_at', 'finished_at']
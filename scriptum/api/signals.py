@@ -1,11 +1,194 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Review
+from .models import User, Genre, Theme, Book, Review, ReviewHistogram, Chapter, ChapterComment, Character, Place, Creature, Favorite, FollowedAuthor
+from .trending import mark_books_active
+from .stats import invalidate_author_stats
+from .character_search import index_character
+from .character_graph import index_character_relations, invalidate_character_graph
+from .search import SEARCH_MODELS, INDEXED_FIELDS, index_object, remove_object
+from .autocomplete import invalidate_autocomplete
+from .catalog import record_book_changes
+from .facets import FACET_FIELDS, FACET_AUTHOR_FIELDS, invalidate_book_facets
+from .deletion import updates_suppressed
+from .ratings import schedule_rating_update
 
 @receiver(post_save, sender=Review)
-def update_book_rating_on_save(sender, instance, **kwargs):
-    instance.book.update_rating()
+def update_book_rating_on_save(sender, instance, created, **kwargs):
+    schedule_rating_update(instance.book_id)
+    mark_books_active(pk=instance.book_id)
+    # Histogramme des notes : simple incrément pour une nouvelle review, recalcul complet si une note a été modifiée
+    field = f"score_{instance.score}"
+    if not created or not ReviewHistogram.objects.filter(book_id=instance.book_id).update(**{field: F(field) + 1}):
+        ReviewHistogram.rebuild(instance.book_id)
 
 @receiver(post_delete, sender=Review)
 def update_book_rating_on_delete(sender, instance, **kwargs):
-    instance.book.update_rating()
\ No newline at end of file
+    # Suppression par lots : la note est recalculée une seule fois à la fin (ou jamais si le livre disparaît aussi)
+    if updates_suppressed(book_id=instance.book_id):
+        return
+    schedule_rating_update(instance.book_id)
+    mark_books_active(pk=instance.book_id)
+    field = f"score_{instance.score}"
+    ReviewHistogram.objects.filter(book_id=instance.book_id, **{f"{field}__gt": 0}).update(**{field: F(field) - 1})
+
+# Met à jour les totaux de lecture du livre quand un chapitre est supprimé (la sauvegarde est gérée dans Chapter.save)
+@receiver(post_delete, sender=Chapter)
+def update_book_reading_stats_on_delete(sender, instance, **kwargs):
+    if updates_suppressed(book_id=instance.book_id):
+        return
+    instance.book.update_reading_stats()
+
+# Maintient le nombre de commentaires de chaque chapitre
+@receiver(post_save, sender=ChapterComment)
+def increment_chapter_comment_count(sender, instance, created, **kwargs):
+    if created:
+        Chapter.objects.filter(pk=instance.chapter_id).update(comment_count=F('comment_count') + 1)
+
+@receiver(post_delete, sender=ChapterComment)
+def decrement_chapter_comment_count(sender, instance, **kwargs):
+    if updates_suppressed(chapter_id=instance.chapter_id):
+        return
+    Chapter.objects.filter(pk=instance.chapter_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
+# Maintient l'index des attributs JSON du personnage (recherche et facettes)
+@receiver(post_save, sender=Character)
+def index_character_on_save(sender, instance, **kwargs):
+    index_character(instance)
+
+# Maintient les liens entre personnages et invalide le graphe du livre
+@receiver(post_save, sender=Character)
+def index_character_relations_on_save(sender, instance, **kwargs):
+    index_character_relations(instance)
+    invalidate_character_graph(instance.book_id)
+
+@receiver(post_delete, sender=Character)
+def invalidate_character_graph_on_delete(sender, instance, **kwargs):
+    invalidate_character_graph(instance.book_id)
+
+# Les favoris et les suivis d'auteur font évoluer le score de tendance
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def mark_book_active_on_favorite(sender, instance, **kwargs):
+    if updates_suppressed(book_id=instance.book_id):
+        return
+    mark_books_active(pk=instance.book_id)
+
+@receiver(post_save, sender=FollowedAuthor)
+@receiver(post_delete, sender=FollowedAuthor)
+def mark_books_active_on_follow(sender, instance, **kwargs):
+    mark_books_active(author_id=instance.author_id)
+    invalidate_author_stats(instance.author_id)
+
+# Invalide les statistiques de l'auteur quand un élément de l'un de ses livres change
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_author_stats_on_book(sender, instance, **kwargs):
+    invalidate_author_stats(instance.author_id)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+@receiver(post_save, sender=Character)
+@receiver(post_delete, sender=Character)
+@receiver(post_save, sender=Place)
+@receiver(post_delete, sender=Place)
+@receiver(post_save, sender=Creature)
+@receiver(post_delete, sender=Creature)
+def invalidate_author_stats_on_book_content(sender, instance, **kwargs):
+    if updates_suppressed(book_id=instance.book_id):
+        return
+    # Seul l'auteur est lu (sans charger le livre s'il n'est pas déjà en mémoire)
+    if sender.book.is_cached(instance):
+        author_id = instance.book.author_id
+    else:
+        author_id = Book.objects.filter(pk=instance.book_id).values_list('author_id', flat=True).first()
+    if author_id is not None:
+        invalidate_author_stats(author_id)
+
+# Maintient l'index de recherche commun à chaque sauvegarde/suppression
+SEARCH_KINDS = {model: kind for kind, model in SEARCH_MODELS.items()}
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Place)
+@receiver(post_save, sender=Creature)
+def update_search_index_on_save(sender, instance, created, update_fields, **kwargs):
+    kind = SEARCH_KINDS[sender]
+    if instance.fields_changed(INDEXED_FIELDS[kind], created, update_fields):
+        index_object(kind, instance)
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Place)
+@receiver(post_delete, sender=Creature)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    remove_object(SEARCH_KINDS[sender], instance.pk)
+
+# Rafraîchit les suggestions quand un genre/thème est créé, qu'un livre change de tags ou qu'un auteur change de nom
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Theme)
+def refresh_autocomplete_on_tag(sender, instance, created, **kwargs):
+    if created:
+        invalidate_autocomplete()
+
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.themes.through)
+def refresh_autocomplete_on_book_tags(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_autocomplete()
+
+@receiver(post_save, sender=Book)
+def refresh_autocomplete_on_book_create(sender, instance, created, **kwargs):
+    if created:
+        invalidate_autocomplete()
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=User)
+def refresh_autocomplete(sender, **kwargs):
+    invalidate_autocomplete()
+
+# Seuls le nom d'auteur et la suppression du compte changent les suggestions d'auteurs (pas une connexion ou une notification)
+@receiver(post_save, sender=User)
+def refresh_autocomplete_on_author(sender, instance, created, update_fields, **kwargs):
+    if instance.fields_changed(['author_name', 'deleted_at'], created, update_fields):
+        invalidate_autocomplete()
+
+# Signale les livres modifiés au catalogue en mémoire (une fois la transaction validée)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def update_catalog_on_book(sender, instance, **kwargs):
+    transaction.on_commit(lambda: record_book_changes([instance.pk]))
+
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.themes.through)
+def update_catalog_on_book_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        book_ids = list(pk_set or []) if reverse else [instance.pk]
+        transaction.on_commit(lambda: record_book_changes(book_ids))
+
+# Les compteurs de la barre latérale du catalogue sont recalculés quand un livre apparaît, disparaît, change de catégorie,
+# de note ou de texte recherché
+@receiver(post_save, sender=Book)
+def invalidate_facets_on_book(sender, instance, created, update_fields, **kwargs):
+    if instance.fields_changed(FACET_FIELDS, created, update_fields):
+        transaction.on_commit(invalidate_book_facets)
+
+@receiver(post_delete, sender=Book)
+def invalidate_facets_on_book_delete(sender, **kwargs):
+    transaction.on_commit(invalidate_book_facets)
+
+@receiver(post_save, sender=User)
+def invalidate_facets_on_author(sender, instance, created, update_fields, **kwargs):
+    if not created and instance.fields_changed(FACET_AUTHOR_FIELDS, created, update_fields):
+        transaction.on_commit(invalidate_book_facets)
+
+@receiver(m2m_changed, sender=Book.genres.through)
+@receiver(m2m_changed, sender=Book.themes.through)
+def invalidate_facets_on_book_tags(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidate_book_facets)
@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.db.models import Count, Sum, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Book, Review, Chapter, Character, Place, Creature, Favorite, FollowedAuthor
+
+# Durée de vie des statistiques en cache (elles sont aussi invalidées par les signaux)
+AUTHOR_STATS_CACHE_TIMEOUT = 60 * 10
+
+BOOK_COUNTERS = ["chapters", "words", "reviews", "favorites", "characters", "places", "creatures"]
+
+
+def author_stats_cache_key(author_id):
+    return f"author_stats:{author_id}"
+
+
+# Supprime les statistiques en cache d'un auteur (appelée depuis api/signals.py)
+def invalidate_author_stats(author_id):
+    cache.delete(author_stats_cache_key(author_id))
+
+
+# Sous-requête corrélée qui agrège une table liée au livre (une seule requête SQL au total)
+def _per_book(queryset, aggregate):
+    subquery = queryset.filter(book=OuterRef('pk')).order_by().values('book').annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+# Calcule les statistiques d'un auteur en un nombre fixe de requêtes (2), quel que soit le nombre de livres
+def compute_author_stats(author):
+    # Les annotations sont préfixées pour ne pas entrer en conflit avec les related_name du modèle Book
+    # Les livres en cours de suppression ne comptent plus
+    books = Book.objects.visible().filter(author=author).order_by('release_date', 'title').annotate(
+        stat_chapters=_per_book(Chapter.objects, Count('pk')),
+        stat_words=F('word_count'),
+        stat_reviews=_per_book(Review.objects, Count('pk')),
+        stat_score_total=_per_book(Review.objects, Sum('score')),
+        stat_favorites=_per_book(Favorite.objects, Count('pk')),
+        stat_characters=_per_book(Character.objects, Count('pk')),
+        stat_places=_per_book(Place.objects, Count('pk')),
+        stat_creatures=_per_book(Creature.objects, Count('pk')),
+    ).values('slug', 'title', 'stat_score_total', *[f"stat_{counter}" for counter in BOOK_COUNTERS])
+
+    totals = {counter: 0 for counter in BOOK_COUNTERS}
+    total_score = 0
+    books_stats = []
+    for row in books:
+        book = {'slug': row['slug'], 'title': row['title']}
+        for counter in BOOK_COUNTERS:
+            book[counter] = row[f"stat_{counter}"]
+            totals[counter] += book[counter]
+        book['average_score'] = round(row['stat_score_total'] / book['reviews'], 1) if book['reviews'] else 0.0
+        total_score += row['stat_score_total']
+        books_stats.append(book)
+
+    totals['books'] = len(books_stats)
+    totals['average_score'] = round(total_score / totals['reviews'], 1) if totals['reviews'] else 0.0
+    totals['followers'] = FollowedAuthor.objects.filter(author=author).count()
+
+    return {"books": books_stats, "totals": totals}
+
+
+# Retourne les statistiques depuis le cache, ou les calcule si besoin
+def get_author_stats(author):
+    key = author_stats_cache_key(author.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_author_stats(author)
+        cache.set(key, stats, AUTHOR_STATS_CACHE_TIMEOUT)
+    return stats
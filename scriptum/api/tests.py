@@ -1,3 +1,1519 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import math
+import random
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from urllib.parse import urlencode
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import F, QuerySet
+from django.test import TestCase, override_settings
+from unittest import skipIf
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from django.utils import timezone
+from .models import compute_text_stats, WORDS_PER_MINUTE, User, Book, Chapter, ChapterComment, Review, ReviewHistogram, Genre, Character, CharacterAttribute, Favorite, Job, CatalogChange, ReadingProgress, FollowedAuthor, Notification, InboxEntry
+from .jobs import enqueue, claim_jobs, run_job, fail_job, release_jobs, requeue_stale_jobs, retry_delay, JOB_RETRY_BASE_DELAY
+from .deletion import schedule_book_deletion, schedule_user_deletion, run_deletion_job, DeletionRunner
+from .ratings import update_book_rating
+from .cdn import book_keys, book_all_keys, user_keys, get_purger, FastlyPurger, PURGE_BATCH_SIZE
+from .ratelimit import LocalBuckets, warn_if_not_shared
+from .catalog import CatalogSnapshot, np
+from .trending import compute_trending_score, refresh_trending_scores, review_weight, TRENDING_EPOCH, TRENDING_HALF_LIFE_DAYS
+from .revisions import encode_delta, decode_revision, encode_snapshot, record_revision, get_revision_content, REVISION_SNAPSHOT_INTERVAL
+from .character_search import extract_values, filter_characters, character_facets
+from .character_graph import extract_relations, get_character_graph, shortest_path
+from .search import search, tokenize
+from .autocomplete import PrefixIndex, autocomplete
+from .renderers import FastJSONRenderer, orjson, msgpack
+from .middleware import brotli
+from .stats import compute_author_stats, get_author_stats
+from .autosave import autosave, apply_operations, content_version, current_content, flush_autosave, AutosaveConflict
+from .notifications import publish_notification, fan_out_notification, notifications_for, unread_count, mark_notifications_read
+from .management.commands.load_test import Command as LoadTestCommand, SCENARIO, LOAD_PREFIX, percentile
+from .progress import sync_reading_progress, continue_reading, PROGRESS_SYNC_MAX_ITEMS
+from .counters import flush_view_counts, record_book_view, record_chapter_view, COUNTED_MODELS
 
-# Create your tests here.
+# Appels reçus par les tâches de test (remis à zéro avant chaque test)
+CALLS = []
+
+
+def record_call(value):
+    CALLS.append(value)
+
+
+def always_fail():
+    raise RuntimeError("échec voulu")
+
+
+def make_user(name):
+    user = User(
+        pseudo=name, first_name="Test", last_name=name, author_name=f"Auteur {name}",
+        email=f"{name}@example.com", birth_date=date(1990, 1, 1),
+    )
+    user.set_password("pw")
+    user.save()
+    return user
+
+
+def make_book(author, title):
+    return Book.objects.create(title=title, author=author, description=f"desc {title}", public_type='adulte', image="books/test.jpg")
+
+
+def make_chapter(book, number):
+    return Chapter.objects.create(book=book, title=f"Chapitre {number}", slug=f"chapitre-{number}", content="un deux trois", type='chapitre', chapter_number=number)
+
+
+def make_character(book, name, **fields):
+    defaults = {'role': 'allié', 'image': "characters/test.jpg", 'age': 30, 'sexe': 'femme', 'height': "1m70", 'background': f"Histoire de {name}"}
+    return Character.objects.create(book=book, name=name, **{**defaults, **fields})
+
+
+# Tests des vues : les réponses 4xx attendues ne sont pas journalisées
+class ApiTestCase(TestCase):
+    def setUp(self):
+        logger = logging.getLogger('django.request')
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.ERROR)
+        self.client = APIClient()
+
+
+# Exécute les tâches prêtes comme un worker (Worker.run ferme la connexion, ce qui casserait la transaction du test)
+def run_ready_jobs(worker_id="test-worker"):
+    jobs = claim_jobs(worker_id, limit=100)
+    for job in jobs:
+        run_job(job)
+    return jobs
+
+
+@override_settings(JOBS_EAGER=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_claim_marks_running_and_counts_attempt(self):
+        job = enqueue(record_call, {'value': 1})
+        claimed = claim_jobs("worker-a")
+        self.assertEqual([j.pk for j in claimed], [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('running', "worker-a", 1))
+        self.assertIsNotNone(job.locked_at)
+        # Une tâche prise ne l'est pas une seconde fois par un autre worker
+        self.assertEqual(claim_jobs("worker-b"), [])
+
+    def test_claim_skips_delayed_jobs(self):
+        enqueue(record_call, {'value': 1}, delay=60)
+        self.assertEqual(claim_jobs("worker-a"), [])
+
+    def test_run_job_calls_function(self):
+        job = enqueue(record_call, {'value': 42})
+        run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(CALLS, [42])
+        self.assertEqual(job.status, 'done')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_dedup_key_merges_queued_jobs(self):
+        first = enqueue(record_call, {'value': 1}, dedup_key="dedup")
+        self.assertIsNone(enqueue(record_call, {'value': 2}, dedup_key="dedup"))
+        self.assertEqual(Job.objects.filter(dedup_key="dedup").count(), 1)
+        # Une fois la tâche prise, une nouvelle demande est de nouveau mise en attente
+        claim_jobs("worker-a")
+        second = enqueue(record_call, {'value': 3}, dedup_key="dedup")
+        self.assertIsNotNone(second)
+        self.assertNotEqual(first.pk, second.pk)
+
+    def test_failure_keeps_the_traceback(self):
+        job = enqueue('api.tests.record_call', {'value': 1, 'unexpected': True})
+        with self.assertLogs('api.jobs', level='ERROR'):
+            run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertTrue(job.last_error.startswith("Traceback"))
+        self.assertIn("TypeError", job.last_error)
+
+    def test_retry_delay_grows_and_is_capped(self):
+        with mock.patch('api.jobs.random.uniform', return_value=1):
+            self.assertEqual(retry_delay(1), JOB_RETRY_BASE_DELAY)
+            self.assertEqual(retry_delay(3), JOB_RETRY_BASE_DELAY * 4)
+            self.assertEqual(retry_delay(30), 60 * 60)
+
+    def test_failure_is_retried_with_backoff(self):
+        job = enqueue(always_fail)
+        before = timezone.now()
+        with self.assertLogs('api.jobs', level='ERROR'):
+            run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', 1, ''))
+        self.assertIn("échec voulu", job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=JOB_RETRY_BASE_DELAY * 0.75))
+        # Pas de nouvel essai avant la fin de l'attente
+        self.assertEqual(claim_jobs("worker-a"), [])
+
+    def test_failure_after_max_attempts(self):
+        job = enqueue(always_fail, max_attempts=2)
+        for _ in range(2):
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            with self.assertLogs('api.jobs', level='ERROR'):
+                run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_is_dropped_when_duplicate_is_queued(self):
+        job = enqueue(always_fail, dedup_key="dedup")
+        claimed = claim_jobs("worker-a")
+        duplicate = enqueue(always_fail, dedup_key="dedup")
+        fail_job(claimed[0], "erreur")
+        self.assertFalse(Job.objects.filter(pk=job.pk).exists())
+        self.assertTrue(Job.objects.filter(pk=duplicate.pk, status='queued').exists())
+
+    def test_release_does_not_count_attempt(self):
+        job = enqueue(record_call, {'value': 1})
+        release_jobs(claim_jobs("worker-a"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', 0, ''))
+        self.assertEqual(CALLS, [])
+
+    def test_stale_running_jobs_are_requeued(self):
+        stale = enqueue(record_call, {'value': 1})
+        active = enqueue(record_call, {'value': 2})
+        claim_jobs("worker-a")
+        Job.objects.filter(pk=stale.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        requeue_stale_jobs(timeout=600)
+        stale.refresh_from_db()
+        active.refresh_from_db()
+        self.assertEqual(stale.status, 'queued')
+        self.assertIn("worker-a", stale.last_error)
+        self.assertEqual(active.status, 'running')
+
+
+@override_settings(JOBS_EAGER=False)
+class RatingJobTests(TestCase):
+    def test_review_schedules_one_rating_job(self):
+        author, reader, other = make_user("author"), make_user("reader"), make_user("other")
+        book = make_book(author, "Livre")
+        Review.objects.create(book=book, user=reader, score=4)
+        Review.objects.create(book=book, user=other, score=2)
+        self.assertEqual(Job.objects.filter(dedup_key=f"book-rating:{book.pk}", status='queued').count(), 1)
+
+    def test_rating_job_updates_rating_and_purges_book_pages(self):
+        author, reader = make_user("author"), make_user("reader")
+        book = make_book(author, "Livre")
+        Review.objects.create(book=book, user=reader, score=4)
+        with mock.patch('api.ratings.purge_surrogate_keys') as purge:
+            update_book_rating(book.pk)
+        book.refresh_from_db()
+        self.assertEqual(book.rating, 4)
+        purge.assert_called_once_with(book_keys(book))
+
+
+@override_settings(JOBS_EAGER=False)
+class DeletionTests(TestCase):
+    def setUp(self):
+        self.author = make_user("author")
+        self.reader = make_user("reader")
+        self.book = make_book(self.author, "Livre")
+        self.other_book = make_book(self.reader, "Autre livre")
+        self.chapters = [make_chapter(self.book, number) for number in range(1, 4)]
+        ChapterComment.objects.create(chapter=self.chapters[0], user=self.reader, content="Bravo")
+        Review.objects.create(book=self.book, user=self.reader, score=5)
+        Favorite.objects.create(book=self.book, user=self.reader)
+
+    def test_book_deletion_hides_then_deletes_in_background(self):
+        job = schedule_book_deletion(self.book)
+        self.assertIsNotNone(Book.objects.get(pk=self.book.pk).deleted_at)
+        self.assertEqual(job.status, 'pending')
+        self.assertTrue(Job.objects.filter(dedup_key=f"deletion:{job.pk}", status='queued').exists())
+
+        run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.deleted, job.total)
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+        self.assertFalse(Chapter.objects.filter(book_id=self.book.pk).exists())
+        self.assertFalse(Review.objects.filter(book_id=self.book.pk).exists())
+        self.assertTrue(Book.objects.filter(pk=self.other_book.pk).exists())
+        self.assertTrue(User.objects.filter(pk=self.reader.pk).exists())
+
+    def test_user_deletion_removes_books_and_contributions(self):
+        Review.objects.create(book=self.other_book, user=self.author, score=3)
+        job = schedule_user_deletion(self.author)
+        self.assertIsNotNone(User.objects.get(pk=self.author.pk).deleted_at)
+        self.assertIsNotNone(Book.objects.get(pk=self.book.pk).deleted_at)
+
+        run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Book.objects.filter(author_id=self.author.pk).exists())
+        self.assertFalse(Review.objects.filter(user_id=self.author.pk).exists())
+        # La note du livre d'un autre auteur est recalculée sans l'avis supprimé
+        self.assertTrue(Job.objects.filter(dedup_key=f"book-rating:{self.other_book.pk}", status='queued').exists())
+
+    def test_failed_deletion_is_resumed(self):
+        job = schedule_book_deletion(self.book)
+        with mock.patch('api.deletion.DeletionRunner.delete_books', side_effect=RuntimeError("coupure")), self.assertLogs('api.jobs', level='ERROR'):
+            run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(Book.objects.filter(pk=self.book.pk).exists())
+
+        # Le nouvel essai de la tâche reprend la suppression échouée
+        Job.objects.filter(dedup_key=f"deletion:{job.pk}").update(run_at=timezone.now())
+        run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+
+    def test_resumed_user_deletion_still_updates_reviewed_books(self):
+        job = schedule_user_deletion(self.reader)
+        delete_batches = DeletionRunner.delete_batches
+
+        # Coupure juste après la suppression des avis du lecteur
+        def interrupted(runner, queryset):
+            if queryset.model is ChapterComment and not Review.objects.filter(user=self.reader).exists():
+                raise RuntimeError("coupure")
+            delete_batches(runner, queryset)
+
+        with mock.patch('api.deletion.DeletionRunner.delete_batches', interrupted), self.assertLogs('api.jobs', level='ERROR'):
+            run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertFalse(Review.objects.filter(user=self.reader).exists())
+        self.assertEqual((job.progress['reviewed_books'], job.progress['favorited_books']), ([self.book.pk], [self.book.pk]))
+
+        Job.objects.filter(dedup_key=f"deletion:{job.pk}").update(run_at=timezone.now())
+        run_ready_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertTrue(Job.objects.filter(dedup_key=f"book-rating:{self.book.pk}", status='queued').exists())
+
+    def test_memory_growth_is_measured_from_the_start_of_the_job(self):
+        job = schedule_book_deletion(self.book)
+        # Le processus avait déjà atteint 50 000 Ko avant la suppression
+        peaks = iter([50000] + [50300] * 100)
+        with mock.patch('api.deletion.memory_peak', side_effect=lambda: next(peaks)):
+            run_deletion_job(job.pk, resume=True)
+        job.refresh_from_db()
+        self.assertEqual(job.memory_growth, 300)
+
+    def test_finished_deletion_is_not_run_again(self):
+        job = schedule_book_deletion(self.book)
+        run_ready_jobs()
+        self.assertIsNone(run_deletion_job(job.pk, resume=True))
+
+
+# Chaque test part de seaux vides, avec un budget de 2 requêtes par minute sur toutes les routes
+@override_settings(RATE_LIMIT_ENABLED=True)
+class RateLimitTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in [mock.patch('api.ratelimit._buckets', LocalBuckets()), mock.patch('api.ratelimit.budget_for', return_value=(2, 60))]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.reader = make_user("reader")
+        self.book = make_book(make_user("author"), "Livre")
+
+    def favorite(self, token=None, address='10.0.0.1'):
+        body = {'book': self.book.slug} if token is None else {'token': token, 'book': self.book.slug}
+        return self.client.post(reverse('favorite-create'), body, format='json', REMOTE_ADDR=address)
+
+    def test_headers_and_429_on_public_route(self):
+        url = reverse('user-login')
+        first = self.client.post(url, {}, format='json')
+        self.assertEqual((first['RateLimit-Limit'], first['RateLimit-Remaining'], first['RateLimit-Policy']), ('2', '1', '2;w=60'))
+        self.client.post(url, {}, format='json')
+        refused = self.client.post(url, {}, format='json')
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['RateLimit-Remaining'], '0')
+        self.assertGreater(int(refused['Retry-After']), 0)
+        self.assertEqual(refused['Cache-Control'], 'no-store')
+
+    def test_missing_or_invalid_token_is_charged_to_the_ip(self):
+        missing = self.favorite()
+        self.assertEqual((missing.status_code, missing.data['error']), (401, 'Token manquant'))
+        self.assertEqual(missing['RateLimit-Remaining'], '1')
+        invalid = self.favorite("pas-un-uuid")
+        self.assertEqual((invalid.status_code, invalid.data['error']), (401, 'Token invalide'))
+        # Le budget de l'IP est épuisé, même pour un token au bon format mais inconnu
+        self.assertEqual(self.favorite("00000000-0000-0000-0000-000000000000").status_code, 429)
+        # Une autre IP, et un utilisateur authentifié depuis la même IP, ont leur propre budget
+        self.assertEqual(self.favorite(address='10.0.0.2').status_code, 401)
+        self.assertEqual(self.favorite(str(self.reader.token)).status_code, 201)
+
+    def test_valid_token_is_limited_per_user_across_ips(self):
+        token = str(self.reader.token)
+        self.assertEqual(self.favorite(token, '10.0.0.1').status_code, 201)
+        self.assertEqual(self.favorite(token, '10.0.0.2').status_code, 400)
+        self.assertEqual(self.favorite(token, '10.0.0.3').status_code, 429)
+
+    def test_disabled(self):
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            responses = [self.favorite() for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [401] * 3)
+        self.assertFalse(responses[0].has_header('RateLimit-Limit'))
+
+    @override_settings(DEBUG=False, RATE_LIMIT_BACKEND='api.ratelimit.LocalBuckets')
+    def test_startup_warning_for_local_buckets(self):
+        with self.assertLogs('api.ratelimit', level='WARNING'):
+            warn_if_not_shared()
+        with override_settings(DEBUG=True), self.assertNoLogs('api.ratelimit', level='WARNING'):
+            warn_if_not_shared()
+
+
+class FavoriteTests(ApiTestCase):
+    def test_delete_returns_empty_204(self):
+        reader = make_user("reader")
+        book = make_book(make_user("author"), "Livre")
+        Favorite.objects.create(book=book, user=reader)
+        response = self.client.delete(reverse('favorite-delete', kwargs={'slug_book': book.slug}) + f"?token={reader.token}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.content, b'')
+        self.assertFalse(Favorite.objects.filter(book=book, user=reader).exists())
+        # Un second appel ne trouve plus le favori
+        response = self.client.delete(reverse('favorite-delete', kwargs={'slug_book': book.slug}) + f"?token={reader.token}")
+        self.assertEqual(response.status_code, 404)
+
+
+
+# Le tampon des vues est propre à chaque test, et aucun minuteur d'écriture n'est lancé
+class ViewCounterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in [mock.patch('api.counters._pending', {kind: Counter() for kind in COUNTED_MODELS}), mock.patch('api.counters._timer', object())]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.book = make_book(make_user("author"), "Livre")
+        self.chapter = make_chapter(self.book, 1)
+
+    def test_pages_do_not_count_and_beacons_do(self):
+        self.assertEqual(self.client.get(reverse('book-getinfo', kwargs={'slug': self.book.slug})).status_code, 200)
+        self.assertEqual(self.client.get(reverse('chapter-getinfo', kwargs={'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug})).status_code, 200)
+        self.assertEqual(flush_view_counts(), 0)
+
+        self.assertEqual(self.client.post(reverse('book-view', kwargs={'slug': self.book.slug})).status_code, 204)
+        response = self.client.post(reverse('chapter-view', kwargs={'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug}))
+        self.assertEqual((response.status_code, response.content), (204, b''))
+        self.assertFalse(response.has_header('Cache-Control'))
+        self.assertEqual(flush_view_counts(), 3)
+        self.book.refresh_from_db()
+        self.chapter.refresh_from_db()
+        self.assertEqual((self.book.view_count, self.chapter.view_count), (2, 1))
+
+    def test_beacon_for_unknown_or_deleted_book(self):
+        self.assertEqual(self.client.post(reverse('book-view', kwargs={'slug': 'inconnu'})).status_code, 404)
+        Book.objects.filter(pk=self.book.pk).update(deleted_at=timezone.now())
+        self.assertEqual(self.client.post(reverse('chapter-view', kwargs={'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug})).status_code, 404)
+        self.assertEqual(flush_view_counts(), 0)
+
+    def test_flush_writes_one_case_update_per_batch(self):
+        books = [self.book] + [make_book(self.book.author, f"Livre {n}") for n in range(2)]
+        for views, book in enumerate(books, start=1):
+            for _ in range(views):
+                record_book_view(book.pk)
+        with mock.patch('api.counters.VIEW_FLUSH_BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_view_counts(), 6)
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(all('CASE' in query['sql'] for query in queries))
+        self.assertEqual([Book.objects.get(pk=book.pk).view_count for book in books], [1, 2, 3])
+        # Le tampon est vidé : rien à écrire au passage suivant
+        with self.assertNumQueries(0):
+            self.assertEqual(flush_view_counts(), 0)
+
+    def test_failed_flush_keeps_views_for_next_pass(self):
+        record_chapter_view(self.chapter.pk, self.book.pk)
+        with mock.patch.object(QuerySet, 'update', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            flush_view_counts()
+        self.assertEqual(flush_view_counts(), 2)
+        self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).view_count, 1)
+
+    @override_settings(CATALOG_ENGINE=True)
+    def test_flush_is_not_journaled_for_the_catalog(self):
+        record_book_view(self.book.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            flush_view_counts()
+        self.assertFalse(CatalogChange.objects.exists())
+
+
+# Les compteurs (maintained_fields) ne sont jamais réécrits par la sauvegarde d'une instance complète
+class TrackedFieldsTests(TestCase):
+    def setUp(self):
+        self.book = make_book(make_user("author"), "Livre")
+        self.chapter = make_chapter(self.book, 1)
+
+    def test_full_save_keeps_counters_written_meanwhile(self):
+        book = Book.objects.get(pk=self.book.pk)
+        chapter = Chapter.objects.get(pk=self.chapter.pk)
+        Book.objects.filter(pk=book.pk).update(view_count=F('view_count') + 5, rating=4)
+        Chapter.objects.filter(pk=chapter.pk).update(view_count=7, comment_count=3)
+
+        book.title = "Nouveau titre"
+        book.save()
+        chapter.title = "Nouveau chapitre"
+        chapter.save()
+
+        book.refresh_from_db()
+        chapter.refresh_from_db()
+        self.assertEqual((book.title, book.view_count, book.rating), ("Nouveau titre", 5, 4))
+        self.assertEqual((chapter.title, chapter.view_count, chapter.comment_count), ("Nouveau chapitre", 7, 3))
+
+    def test_explicit_update_fields_write_counters(self):
+        book = Book.objects.get(pk=self.book.pk)
+        book.rating = 3
+        book.save(update_fields=['rating'])
+        self.assertEqual(Book.objects.get(pk=book.pk).rating, 3)
+
+    def test_deferred_fields_are_not_written(self):
+        book = Book.objects.only('id', 'title').get(pk=self.book.pk)
+        Book.objects.filter(pk=book.pk).update(description="modifiée ailleurs")
+        book.title = "Titre"
+        book.save()
+        self.assertEqual(Book.objects.values_list('title', 'description').get(pk=book.pk), ("Titre", "modifiée ailleurs"))
+
+    def test_fields_changed(self):
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertFalse(book.fields_changed(['title']))
+        book.title = "Autre"
+        self.assertTrue(book.fields_changed(['title']))
+        self.assertFalse(book.fields_changed(['title'], update_fields=['rating']))
+        book.save()
+        self.assertFalse(book.fields_changed(['title']))
+
+
+
+@skipIf(np is None, "NumPy n'est pas installé")
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        self.author = make_user("author")
+        for title in ["Dune", "Arbre", "Moisson", "arbre", "Zéphyr"]:
+            make_book(self.author, title)
+        self.snapshot = CatalogSnapshot.load()
+
+    # Même ordre que la base pour les livres présents dans le catalogue
+    def assertSameOrder(self, ordering):
+        expected = [pk for pk in Book.objects.visible().order_by(*ordering, 'id').values_list('id', flat=True) if pk in self.snapshot.ids]
+        self.assertEqual([int(pk) for pk in self.snapshot.query({}, {}, ordering)], expected)
+
+    def test_load_matches_database_order(self):
+        self.assertSameOrder(['title'])
+        self.assertSameOrder(['-title'])
+        self.assertSameOrder(['-rating', '-release_date', 'title'])
+
+    def test_rating_change_keeps_title_ranks_without_queries(self):
+        book = Book.objects.get(title="Dune")
+        Book.objects.filter(pk=book.pk).update(rating=4.5)
+        ranks = self.snapshot.title_rank.copy()
+        with mock.patch.object(CatalogSnapshot, '_neighbour_rank') as neighbour_rank:
+            self.snapshot.apply_changes([book.pk])
+        neighbour_rank.assert_not_called()
+        self.assertTrue((self.snapshot.title_rank == ranks).all())
+        self.assertSameOrder(['-rating', 'title'])
+
+    def test_new_and_renamed_books_are_ranked_between_neighbours(self):
+        new = make_book(self.author, "Lune")
+        renamed = Book.objects.get(title="Zéphyr")
+        Book.objects.filter(pk=renamed.pk).update(title="Boréal")
+        duplicate = make_book(self.author, "Moisson")
+        self.snapshot.apply_changes([new.pk, renamed.pk, duplicate.pk])
+        self.assertSameOrder(['title'])
+        self.assertSameOrder(['-title'])
+
+    def test_deleted_books_leave_the_catalog(self):
+        book = Book.objects.get(title="Moisson")
+        Book.objects.filter(pk=book.pk).update(deleted_at=timezone.now())
+        self.snapshot.apply_changes([book.pk])
+        self.assertNotIn(book.pk, self.snapshot.ids)
+        self.assertSameOrder(['title'])
+
+    def test_ranks_are_renumbered_when_too_close(self):
+        with mock.patch('api.catalog.TITLE_RANK_MIN_GAP', 0.3):
+            for title in ["Arc", "Arch", "Archi", "Archip"]:
+                self.snapshot.apply_changes([make_book(self.author, title).pk])
+        self.assertSameOrder(['title'])
+
+    def test_unknown_neighbours_reload_all_ranks(self):
+        # Un livre ajouté en base mais pas encore rejoué : le voisin direct du nouveau titre n'est pas classé
+        make_book(self.author, "Duo")
+        new = make_book(self.author, "Dunes")
+        with mock.patch('api.catalog.TITLE_NEIGHBOURS', 1):
+            self.snapshot.apply_changes([new.pk])
+        self.assertEqual(len(self.snapshot), 6)
+        self.assertFalse(np.isnan(self.snapshot.title_rank).any())
+        self.assertSameOrder(['title'])
+
+
+class BookFacetsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.book = make_book(self.author, "Dragon")
+        make_book(self.author, "Forêt")
+
+    def facets(self, **params):
+        return self.client.get(reverse('book-getall'), {'facets': 'true', **params}).data['facets']
+
+    def save(self, instance, **fields):
+        for name, value in fields.items():
+            setattr(instance, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    def test_counts_follow_filters(self):
+        self.assertEqual(self.facets()['public_type'], {'adulte': 2})
+        self.assertEqual(self.facets(search="dragon")['public_type'], {'adulte': 1})
+
+    def test_rating_change_invalidates_min_rating_counts(self):
+        self.assertEqual(self.facets(min_rating=3)['public_type'], {})
+        Review.objects.create(book=self.book, user=make_user("reader"), score=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_book_rating(self.book.pk)
+        self.assertEqual(self.facets(min_rating=3)['public_type'], {'adulte': 1})
+
+    def test_searched_fields_invalidate_search_counts(self):
+        self.assertEqual(self.facets(search="licorne")['public_type'], {})
+        self.save(self.book, title="Licorne")
+        self.assertEqual(self.facets(search="licorne")['public_type'], {'adulte': 1})
+        self.save(self.author, author_name="Licorne d'or")
+        self.assertEqual(self.facets(search="licorne")['public_type'], {'adulte': 2})
+
+    def test_counter_updates_keep_the_cache(self):
+        self.facets()
+        with mock.patch('api.signals.invalidate_book_facets') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.book.trending_score = 3
+                self.book.save(update_fields=['trending_score'])
+                self.book.view_count = 10
+                self.book.save(update_fields=['view_count'])
+        invalidate.assert_not_called()
+
+
+
+class AutosaveOperationsTests(TestCase):
+    def test_operations_apply_in_order(self):
+        operations = [{'pos': 0, 'insert': "Il "}, {'pos': 3, 'delete': 7, 'insert': "était"}, {'pos': 8, 'insert': " une"}]
+        self.assertEqual(apply_operations("faisait fois", operations), "Il était une fois")
+        self.assertEqual(apply_operations("texte", []), "texte")
+
+    def test_invalid_operations(self):
+        for operations in [None, "ops", [{'pos': 6}], [{'pos': -1}], [{'pos': 2, 'delete': 4}], [{'pos': 'x'}], ["op"]]:
+            with self.assertRaises(ValueError):
+                apply_operations("texte", operations)
+
+
+# Cache en mémoire : les requêtes comptées sont uniquement celles de la base
+@override_settings(JOBS_EAGER=False, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AutosaveTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.book = make_book(self.author, "Livre")
+        self.chapter = make_chapter(self.book, 1)
+        self.addCleanup(cache.clear)
+
+    def test_saves_only_touch_the_cache_until_the_flush(self):
+        version = content_version(self.chapter.content)
+        with self.assertNumQueries(3):
+            # Ajout de la tâche d'écriture (dans un point de sauvegarde) à la première sauvegarde de l'intervalle
+            version = autosave(self.chapter, version, [{'pos': 0, 'insert': "Un, "}])
+        with self.assertNumQueries(0):
+            version = autosave(self.chapter, version, [{'pos': 0, 'insert': "Zéro, "}])
+        self.assertEqual(current_content(self.chapter), "Zéro, Un, un deux trois")
+        self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).content, "un deux trois")
+        self.assertEqual(Job.objects.filter(dedup_key=f"autosave:{self.chapter.pk}").count(), 1)
+
+        self.assertTrue(flush_autosave(self.chapter.pk))
+        chapter = Chapter.objects.get(pk=self.chapter.pk)
+        self.assertEqual(chapter.content, "Zéro, Un, un deux trois")
+        # Révision du contenu d'origine puis du brouillon écrit
+        self.assertEqual(sorted(chapter.revisions.values_list('number', flat=True)), [1, 2])
+        # Le brouillon écrit est oublié : la version de la base est celle du dernier brouillon
+        self.assertEqual(current_content(chapter), chapter.content)
+        self.assertEqual(content_version(current_content(chapter)), version)
+        self.assertFalse(flush_autosave(self.chapter.pk))
+
+    def test_stale_base_version_conflicts(self):
+        base = content_version(self.chapter.content)
+        version = autosave(self.chapter, base, [{'pos': 0, 'insert': "A"}])
+        with self.assertRaises(AutosaveConflict) as conflict:
+            autosave(self.chapter, base, [{'pos': 0, 'insert': "B"}])
+        self.assertEqual(conflict.exception.version, version)
+        self.assertEqual(current_content(self.chapter), "Aun deux trois")
+
+    def test_save_during_another_save_conflicts(self):
+        cache.add(f"autosave:lock:{self.chapter.pk}", "autre", 5)
+        with mock.patch('api.autosave.AUTOSAVE_LOCK_WAIT', 0), self.assertRaises(AutosaveConflict):
+            autosave(self.chapter, content_version(self.chapter.content), [{'pos': 0, 'insert': "A"}])
+        self.assertEqual(current_content(self.chapter), "un deux trois")
+
+    def test_draft_changed_during_flush_is_kept_and_rescheduled(self):
+        version = autosave(self.chapter, content_version(self.chapter.content), [{'pos': 0, 'insert': "A"}])
+        run_ready_jobs()
+        Job.objects.filter(dedup_key=f"autosave:{self.chapter.pk}").update(status='running')
+
+        def save_meanwhile(chapter, previous_content):
+            autosave(self.chapter, version, [{'pos': 0, 'insert': "B"}])
+
+        with mock.patch('api.autosave.record_revision', side_effect=save_meanwhile):
+            flush_autosave(self.chapter.pk)
+        self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).content, "Aun deux trois")
+        self.assertEqual(current_content(self.chapter), "BAun deux trois")
+        self.assertTrue(Job.objects.filter(dedup_key=f"autosave:{self.chapter.pk}", status='queued').exists())
+
+    def test_eager_jobs_write_every_save(self):
+        version = content_version(self.chapter.content)
+        with override_settings(JOBS_EAGER=True):
+            for insert, content in [("A", "Aun deux trois"), ("B", "BAun deux trois")]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    # Chaque requête relit le chapitre
+                    version = autosave(Chapter.objects.get(pk=self.chapter.pk), version, [{'pos': 0, 'insert': insert}])
+                self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).content, content)
+
+    def test_view_conflict_and_current_version(self):
+        url = reverse('chapter-autosave', kwargs={'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug})
+        token = str(self.author.token)
+        response = self.client.get(url, {'token': token})
+        self.assertEqual(response.data, {'version': content_version("un deux trois"), 'content': "un deux trois"})
+        saved = self.client.patch(url, {'token': token, 'base_version': response.data['version'], 'ops': [{'pos': 0, 'insert': "A"}]}, format='json')
+        self.assertEqual(saved.status_code, 200)
+        conflict = self.client.patch(url, {'token': token, 'base_version': response.data['version'], 'ops': []}, format='json')
+        self.assertEqual((conflict.status_code, conflict.data['version']), (409, saved.data['version']))
+        invalid = self.client.patch(url, {'token': token, 'base_version': saved.data['version'], 'ops': [{'pos': 99}]}, format='json')
+        self.assertEqual(invalid.status_code, 400)
+        self.assertEqual(self.client.get(url, {'token': token}).data['content'], "Aun deux trois")
+
+
+class ChapterReorderTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.book = make_book(self.author, "Livre")
+        self.prologue = Chapter.objects.create(book=self.book, title="Prologue", content="début", type='prologue')
+        self.chapters = [make_chapter(self.book, number) for number in range(1, 4)]
+        self.epilogue = Chapter.objects.create(book=self.book, title="Épilogue", content="fin", type='epilogue')
+        self.url = reverse('chapter-reorder', kwargs={'slug_book': self.book.slug})
+
+    def reorder(self, body):
+        return self.client.patch(self.url, {'token': str(self.author.token), **body}, format='json')
+
+    def titles(self):
+        return list(Chapter.objects.filter(book=self.book).order_by('sort_order', 'position').values_list('title', 'slug'))
+
+    def test_full_reorder_renumbers_and_reslugs(self):
+        response = self.reorder({'chapters': ['prologue', 'chapitre-3', 'chapitre-1', 'chapitre-2', 'epilogue']})
+        self.assertEqual(response.status_code, 200)
+        # Le numéro et donc l'adresse des chapitres suivent leur nouvelle place
+        self.assertEqual(self.titles(), [
+            ("Prologue", 'prologue'), ("Chapitre 3", 'chapitre-1'), ("Chapitre 1", 'chapitre-2'), ("Chapitre 2", 'chapitre-3'), ("Épilogue", 'epilogue'),
+        ])
+        self.assertEqual([chapter['slug'] for chapter in response.data], ['prologue', 'chapitre-1', 'chapitre-2', 'chapitre-3', 'epilogue'])
+
+    def test_move_one_chapter(self):
+        self.assertEqual(self.reorder({'chapter': 'chapitre-1', 'after': 'chapitre-3'}).status_code, 200)
+        self.assertEqual([title for title, _ in self.titles()], ["Prologue", "Chapitre 2", "Chapitre 3", "Chapitre 1", "Épilogue"])
+
+    def test_prologue_and_epilogue_stay_in_place(self):
+        for body in [
+            {'chapters': ['chapitre-1', 'prologue', 'chapitre-2', 'chapitre-3', 'epilogue']},
+            {'chapters': ['prologue', 'chapitre-1', 'epilogue', 'chapitre-2', 'chapitre-3']},
+            {'chapter': 'epilogue', 'before': 'chapitre-3'},
+            {'chapter': 'prologue', 'after': 'chapitre-1'},
+            {'chapter': 'chapitre-1', 'before': 'prologue'},
+        ]:
+            response = self.reorder(body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual([title for title, _ in self.titles()], ["Prologue", "Chapitre 1", "Chapitre 2", "Chapitre 3", "Épilogue"])
+
+    def test_incomplete_list_is_refused(self):
+        self.assertEqual(self.reorder({'chapters': ['prologue', 'chapitre-1', 'epilogue']}).status_code, 400)
+        self.assertEqual(self.reorder({'chapter': 'chapitre-9', 'after': 'chapitre-1'}).status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AuthorStatsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.reader = make_user("reader")
+        self.books = [make_book(self.author, f"Livre {index}") for index in range(3)]
+        for book in self.books:
+            make_chapter(book, 1)
+            Review.objects.create(book=book, user=self.reader, score=4)
+        Favorite.objects.create(book=self.books[0], user=self.reader)
+        self.addCleanup(cache.clear)
+
+    def test_two_queries_whatever_the_number_of_books(self):
+        with self.assertNumQueries(2):
+            stats = compute_author_stats(self.author)
+        self.assertEqual(stats['totals'], {
+            'chapters': 3, 'words': sum(book.word_count for book in Book.objects.filter(author=self.author)), 'reviews': 3, 'favorites': 1,
+            'characters': 0, 'places': 0, 'creatures': 0, 'books': 3, 'average_score': 4.0, 'followers': 0,
+        })
+        make_book(self.author, "Livre 3")
+        with self.assertNumQueries(2):
+            self.assertEqual(compute_author_stats(self.author)['totals']['books'], 4)
+
+    def test_cached_then_invalidated(self):
+        get_author_stats(self.author)
+        with self.assertNumQueries(0):
+            get_author_stats(self.author)
+        Review.objects.create(book=self.books[1], user=self.author, score=1)
+        self.assertEqual(get_author_stats(self.author)['totals']['reviews'], 4)
+
+    def test_deleted_books_are_not_counted(self):
+        self.assertEqual(get_author_stats(self.author)['totals']['books'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_book_deletion(self.books[0])
+        stats = get_author_stats(self.author)
+        self.assertEqual((stats['totals']['books'], stats['totals']['favorites']), (2, 0))
+        self.assertNotIn(self.books[0].slug, [book['slug'] for book in stats['books']])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('user-authorstats'), {'token': str(self.author.token)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['slug'] for book in response.data['books']], [book['slug'] for book in get_author_stats(self.author)['books']])
+        self.assertEqual(self.client.get(reverse('user-authorstats')).status_code, 401)
+
+
+# Drain de la file par le cron des hébergements sans worker
+@override_settings(JOBS_EAGER=False, CRON_SECRET="secret-cron", JOBS_DRAIN_SECONDS=5)
+class RunJobsViewTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        CALLS.clear()
+        # Worker.run ferme la connexion en fin de drain, ce qui casserait la transaction du test
+        patcher = mock.patch.object(connection, 'close')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_secret_is_required(self):
+        enqueue(record_call, {'value': 1})
+        self.assertEqual(self.client.get(reverse('jobs-run')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('jobs-run'), HTTP_AUTHORIZATION="Bearer autre").status_code, 403)
+        with override_settings(CRON_SECRET=None):
+            self.assertEqual(self.client.get(reverse('jobs-run'), HTTP_AUTHORIZATION="Bearer None").status_code, 403)
+        self.assertEqual(CALLS, [])
+
+    def test_runs_ready_jobs_only(self):
+        enqueue(record_call, {'value': 1})
+        enqueue(record_call, {'value': 2})
+        delayed = enqueue(record_call, {'value': 3}, delay=60)
+        response = self.client.get(reverse('jobs-run'), HTTP_AUTHORIZATION="Bearer secret-cron")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'processed': 2, 'failed': 0})
+        self.assertEqual(sorted(CALLS), [1, 2])
+        self.assertEqual(Job.objects.get(pk=delayed.pk).status, 'queued')
+
+    def test_stops_taking_jobs_after_the_time_budget(self):
+        for value in range(3):
+            enqueue(record_call, {'value': value})
+        with override_settings(JOBS_DRAIN_SECONDS=0):
+            response = self.client.get(reverse('jobs-run'), HTTP_AUTHORIZATION="Bearer secret-cron")
+        self.assertEqual(response.data, {'processed': 0, 'failed': 0})
+        self.assertEqual(Job.objects.filter(status='queued').count(), 3)
+
+
+class TrendingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.readers = [make_user(f"reader{index}") for index in range(3)]
+        self.quiet = make_book(self.author, "Calme")
+        self.popular = make_book(self.author, "Populaire")
+
+    def test_score_decays_with_half_life(self):
+        self.assertEqual(compute_trending_score([]), 0.0)
+        start = TRENDING_EPOCH + timedelta(days=100)
+        later = start + timedelta(days=TRENDING_HALF_LIFE_DAYS)
+        # Une activité vaut deux fois plus qu'une activité identique une demi-vie plus tôt, comme deux activités à la fois
+        self.assertAlmostEqual(compute_trending_score([(1.0, later)]) - compute_trending_score([(1.0, start)]), math.log(2), places=5)
+        self.assertAlmostEqual(compute_trending_score([(1.0, start), (1.0, start)]) - compute_trending_score([(1.0, start)]), math.log(2), places=5)
+        # Sans débordement des années après la date de référence
+        self.assertTrue(math.isfinite(compute_trending_score([(1.0, TRENDING_EPOCH + timedelta(days=3650))])))
+        self.assertLess(review_weight(0), review_weight(5))
+
+    def test_refresh_only_recomputes_active_books(self):
+        for reader in self.readers:
+            Review.objects.create(book=self.popular, user=reader, score=5)
+        Favorite.objects.create(book=self.quiet, user=self.readers[0])
+        self.assertEqual(refresh_trending_scores(), 2)
+        self.popular.refresh_from_db()
+        self.quiet.refresh_from_db()
+        self.assertGreater(self.popular.trending_score, self.quiet.trending_score)
+        # Rien n'a changé depuis : aucun livre à recalculer
+        self.assertEqual(refresh_trending_scores(), 0)
+
+        Review.objects.create(book=self.quiet, user=self.readers[1], score=2)
+        self.assertEqual(refresh_trending_scores(), 1)
+        response = self.client.get(reverse('book-getall'), {'ordering': 'trending'})
+        self.assertEqual([book['slug'] for book in response.data['results']], [self.popular.slug, self.quiet.slug])
+
+
+class ReadingStatsTests(TestCase):
+    def setUp(self):
+        self.book = make_book(make_user("author"), "Livre")
+
+    def test_text_stats_ignore_markup(self):
+        self.assertEqual(compute_text_stats("<p>Il était <b>une</b> fois</p>"), (4, 17, 1))
+        self.assertEqual(compute_text_stats(""), (0, 0, 0))
+        self.assertEqual(compute_text_stats("mot " * (WORDS_PER_MINUTE + 1))[2], 2)
+
+    def test_book_totals_follow_its_chapters(self):
+        first = make_chapter(self.book, 1)
+        second = make_chapter(self.book, 2)
+        self.book.refresh_from_db()
+        self.assertEqual((first.word_count, self.book.word_count, self.book.char_count), (3, 6, 2 * len("un deux trois")))
+
+        second.content = "quatre"
+        second.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.word_count, 4)
+        first.delete()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.word_count, self.book.reading_time), (1, 1))
+
+    def test_backfill_recomputes_stored_stats(self):
+        chapter = make_chapter(self.book, 1)
+        Chapter.objects.filter(pk=chapter.pk).update(word_count=0, char_count=0, reading_time=0)
+        Book.objects.filter(pk=self.book.pk).update(word_count=0)
+        call_command('backfill_reading_stats', stdout=StringIO())
+        chapter.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual((chapter.word_count, chapter.reading_time, self.book.word_count), (3, 1, 3))
+
+
+class RevisionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.book = make_book(self.author, "Livre")
+        self.chapter = make_chapter(self.book, 1)
+
+    def test_delta_round_trip(self):
+        old = "ligne 1\nligne 2\nligne 3\n"
+        for new in ["ligne 1\nligne 2 modifiée\nligne 3\n", "", "début\n" + old + "fin sans retour", old]:
+            self.assertEqual(decode_revision(False, encode_delta(old, new), old), new)
+        self.assertEqual(decode_revision(True, encode_snapshot("é" * 10)), "é" * 10)
+
+    def test_every_version_is_rebuilt_with_periodic_snapshots(self):
+        versions = []
+        for index in range(REVISION_SNAPSHOT_INTERVAL + 5):
+            self.chapter.content = "\n".join(f"ligne {line} v{index if line == index % 7 else 0}" for line in range(7))
+            self.chapter.save()
+            record_revision(self.chapter)
+            versions.append(self.chapter.content)
+        self.assertEqual(list(self.chapter.revisions.filter(is_snapshot=True).order_by('number').values_list('number', flat=True)), [1, REVISION_SNAPSHOT_INTERVAL + 1])
+        for number in [1, 2, REVISION_SNAPSHOT_INTERVAL, REVISION_SNAPSHOT_INTERVAL + 1, len(versions)]:
+            with self.assertNumQueries(2):
+                self.assertEqual(get_revision_content(self.chapter, number), versions[number - 1])
+        # Un contenu inchangé ne crée pas de révision
+        record_revision(self.chapter)
+        self.assertEqual(self.chapter.revisions.count(), len(versions))
+
+    def test_restore_creates_a_new_revision(self):
+        record_revision(self.chapter)
+        self.chapter.content = "nouveau texte"
+        self.chapter.save()
+        record_revision(self.chapter)
+        token = str(self.author.token)
+        kwargs = {'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug}
+
+        response = self.client.post(reverse('chapter-revision-restore', kwargs={**kwargs, 'number': 1}), {'token': token}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Chapter.objects.get(pk=self.chapter.pk).content, "un deux trois")
+        self.assertEqual(self.client.get(reverse('chapter-revisions', kwargs=kwargs), {'token': token}).data[0]['number'], 3)
+        self.assertEqual(self.client.get(reverse('chapter-revision-getinfo', kwargs={**kwargs, 'number': 2}), {'token': token}).data['content'], "nouveau texte")
+        self.assertEqual(self.client.get(reverse('chapter-revision-getinfo', kwargs={**kwargs, 'number': 9}), {'token': token}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('chapter-revisions', kwargs=kwargs), {'token': str(make_user("other").token)}).status_code, 403)
+
+
+class ChapterCommentTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(make_user("author"), "Livre")
+        self.chapter = make_chapter(self.book, 1)
+        self.readers = [make_user(f"reader{index}") for index in range(3)]
+        self.kwargs = {'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug}
+        get_purger().clear()
+
+    def comment_count(self):
+        return Chapter.objects.get(pk=self.chapter.pk).comment_count
+
+    def test_create_and_delete_keep_the_count_and_purge(self):
+        token = str(self.readers[0].token)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post(reverse('comment-create', kwargs=self.kwargs), {'token': token, 'content': "Bravo"}, format='json')
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(self.comment_count(), 1)
+        self.assertEqual(get_purger().purged, [sorted([f"comments:{self.book.slug}/chapitre-1", f"chapter:{self.book.slug}/chapitre-1", f"toc:{self.book.slug}"])])
+
+        duplicate = self.client.post(reverse('comment-create', kwargs=self.kwargs), {'token': token, 'content': "Encore"}, format='json')
+        self.assertEqual(duplicate.status_code, 400)
+        self.assertEqual(self.comment_count(), 1)
+
+        self.assertEqual(self.client.delete(reverse('comment-delete', kwargs=self.kwargs), {'token': token}, format='json').status_code, 204)
+        self.assertEqual(self.comment_count(), 0)
+        self.assertEqual(self.client.delete(reverse('comment-delete', kwargs=self.kwargs), {'token': token}, format='json').status_code, 404)
+
+    def test_list_is_cursor_paginated_newest_first(self):
+        for index, reader in enumerate(self.readers):
+            ChapterComment.objects.create(chapter=self.chapter, user=reader, content=f"Commentaire {index}")
+        User.objects.filter(pk=self.readers[1].pk).update(deleted_at=timezone.now())
+
+        first = self.client.get(reverse('comment-getall', kwargs=self.kwargs), {'size': 1})
+        self.assertEqual([comment['content'] for comment in first.data['results']], ["Commentaire 2"])
+        second = self.client.get(first.data['next'])
+        # Les commentaires d'un compte en cours de suppression ne sont plus affichés
+        self.assertEqual([comment['content'] for comment in second.data['results']], ["Commentaire 0"])
+        self.assertIsNone(second.data['next'])
+        self.assertEqual(second.data['results'][0]['user_pseudo'], "reader0")
+
+
+class ReviewHistogramTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(make_user("author"), "Livre")
+        self.readers = [make_user(f"reader{index}") for index in range(3)]
+
+    def histogram(self):
+        return ReviewHistogram.objects.get(book=self.book).as_dict()
+
+    def test_histogram_follows_reviews(self):
+        reviews = [Review.objects.create(book=self.book, user=reader, score=score) for reader, score in zip(self.readers, [5, 5, 2])]
+        self.assertEqual(self.histogram(), {'0': 0, '1': 0, '2': 1, '3': 0, '4': 0, '5': 2})
+        # Une note modifiée reconstruit l'histogramme, une review supprimée le décrémente
+        reviews[0].score = 3
+        reviews[0].save()
+        reviews[2].delete()
+        self.assertEqual(self.histogram(), {'0': 0, '1': 0, '2': 0, '3': 1, '4': 0, '5': 1})
+
+    def test_first_page_only_carries_the_histogram(self):
+        for index, reader in enumerate(self.readers):
+            Review.objects.create(book=self.book, user=reader, score=index, comment=f"Avis {index}")
+        url = reverse('review-getall', kwargs={'slug': self.book.slug})
+        first = self.client.get(url, {'size': 2})
+        self.assertEqual([review['comment'] for review in first.data['results']], ["Avis 2", "Avis 1"])
+        self.assertEqual(first.data['histogram'], {'0': 1, '1': 1, '2': 1, '3': 0, '4': 0, '5': 0})
+        second = self.client.get(first.data['next'])
+        self.assertEqual([review['comment'] for review in second.data['results']], ["Avis 0"])
+        self.assertNotIn('histogram', second.data)
+
+    def test_book_without_reviews(self):
+        response = self.client.get(reverse('review-getall', kwargs={'slug': self.book.slug}))
+        self.assertEqual((response.data['results'], response.data['histogram']['5']), ([], 0))
+
+
+class CharacterSearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(make_user("author"), "Livre")
+        self.aria = make_character(self.book, "Aria", traits=["courageuse", " loyale "], languages=["elfique", 3], family=[{'nom': "Eldor"}])
+        self.bren = make_character(self.book, "Bren", traits=["loyale"], languages="commun", role='antagoniste')
+        self.cael = make_character(self.book, "Cael", traits=["courageuse", "loyale"])
+        make_character(make_book(make_user("other"), "Autre"), "Aria", traits=["courageuse"])
+
+    def test_values_are_normalized(self):
+        self.assertEqual(extract_values([" a ", "a", 3, True, {'x': 1}, None, ""]), ["a", "3"])
+        self.assertEqual(extract_values("seule"), ["seule"])
+        self.assertEqual(extract_values(None), [])
+        # Les objets (famille détaillée) ne sont pas indexés
+        self.assertFalse(CharacterAttribute.objects.filter(character=self.aria, field='family').exists())
+
+    def test_filters_require_every_value(self):
+        characters = Character.objects.filter(book=self.book).order_by('name')
+        names = lambda filters: list(filter_characters(characters, self.book, filters).values_list('name', flat=True))
+        self.assertEqual(names({'traits': ["courageuse"]}), ["Aria", "Cael"])
+        self.assertEqual(names({'traits': ["courageuse", "loyale"], 'languages': ["3"]}), ["Aria"])
+        self.assertEqual(names({'traits': ["inconnue"]}), [])
+
+    def test_facets_count_characters_per_value(self):
+        facets = character_facets(Character.objects.filter(book=self.book))
+        self.assertEqual(facets['traits'], {'loyale': 3, 'courageuse': 2})
+        self.assertEqual(facets['languages'], {'3': 1, 'commun': 1, 'elfique': 1})
+        self.assertEqual(facets['fears'], {})
+
+    def test_index_follows_updates_and_view(self):
+        self.bren.traits = ["courageuse"]
+        self.bren.save()
+        response = self.client.get(reverse('character-search', kwargs={'slug_book': self.book.slug}), {'traits': "courageuse", 'role': "antagoniste"})
+        self.assertEqual([character['name'] for character in response.data['results']], ["Bren"])
+        self.assertEqual(response.data['facets']['traits'], {'courageuse': 1})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CharacterGraphTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+        self.book = make_book(make_user("author"), "Livre")
+        with self.captureOnCommitCallbacks(execute=True):
+            # Bren vise Cael avant que Cael n'existe : le lien est rattaché à sa création
+            make_character(self.book, "Aria", family=["Bren (frère)"])
+            make_character(self.book, "Bren", family=[{'nom': "cael", 'lien': "ami"}])
+            make_character(self.book, "Cael")
+            make_character(self.book, "Dara", family="Inconnu")
+
+    def test_relations_are_extracted_from_family(self):
+        self.assertEqual(
+            extract_relations(["Aria (soeur)", {'name': "Bren", 'type': "père"}, {'age': 3}, "  ", "Cael"]),
+            [("Aria", "soeur"), ("Bren", "père"), ("Cael", "")],
+        )
+        self.assertEqual(extract_relations(None), [])
+
+    def test_graph_components_and_shortest_path(self):
+        graph = get_character_graph(self.book.pk)
+        self.assertEqual(graph['components'], 2)
+        self.assertEqual({node['slug']: node['degree'] for node in graph['nodes'].values()}, {'aria': 1, 'bren': 2, 'cael': 1, 'dara': 0})
+        self.assertEqual(shortest_path(graph, 'cael', 'aria'), ['cael', 'bren', 'aria'])
+        self.assertIsNone(shortest_path(graph, 'aria', 'dara'))
+        self.assertIsNone(shortest_path(graph, 'aria', 'inconnu'))
+
+    def test_cached_graph_is_invalidated_by_character_changes(self):
+        get_character_graph(self.book.pk)
+        with self.assertNumQueries(0):
+            get_character_graph(self.book.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_character(self.book, "Eli", family=["Dara (mère)"])
+        response = self.client.get(reverse('character-graph', kwargs={'slug_book': self.book.slug}), {'from': 'eli', 'to': 'dara'})
+        self.assertEqual((response.data['components'], response.data['path']), (2, ['eli', 'dara']))
+        self.assertIn({'source': 'eli', 'target': 'dara', 'relation': "mère"}, response.data['edges'])
+
+
+class SearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        author = make_user("author")
+        self.forest = Book.objects.create(title="La Forêt des dragons", author=author, description="Un royaume perdu", public_type='adulte', image="books/test.jpg")
+        self.kingdom = Book.objects.create(title="Royaume", author=author, description="Une forêt, une forêt, encore une forêt", public_type='adulte', image="books/test.jpg")
+        self.character = make_character(self.kingdom, "Drago", background="Gardien de la forêt")
+
+    def test_tokenize_normalizes_and_drops_stop_words(self):
+        self.assertEqual(tokenize("La Forêt ÉTAIT sombre, et l'été 2024"), ["foret", "sombre", "ete", "2024"])
+
+    def test_ranking_prefers_every_word_then_weight(self):
+        # Seul le premier livre contient les deux mots ; le titre pèse plus que des répétitions dans la description
+        self.assertEqual([result['slug'] for result in search("forêt dragons")][:1], [self.forest.slug])
+        self.assertEqual([result['title'] for result in search("foret", kind='book')], ["La Forêt des dragons", "Royaume"])
+        # Le dernier mot est un préfixe
+        self.assertEqual([(result['type'], result['slug']) for result in search("forêt dra")][:2], [('book', self.forest.slug), ('character', 'drago')])
+        self.assertEqual(search("le la"), [])
+
+    def test_index_follows_changes_and_deletions(self):
+        self.forest.title = "Les Marais"
+        self.forest.save()
+        self.assertEqual([result['slug'] for result in search("dragons")], [])
+        self.assertEqual([result['slug'] for result in search("marais")], [self.forest.slug])
+        # Les éléments d'un livre en cours de suppression disparaissent des résultats
+        Book.objects.filter(pk=self.kingdom.pk).update(deleted_at=timezone.now())
+        self.assertEqual([result['slug'] for result in search("royaume")], [self.forest.slug])
+
+    def test_view(self):
+        response = self.client.get(reverse('search'), {'q': "drago", 'type': 'character'})
+        self.assertEqual([(result['slug'], result['book_slug']) for result in response.data['results']], [('drago', self.kingdom.slug)])
+        self.assertEqual(self.client.get(reverse('search'), {'q': "drago", 'type': 'planet'}).status_code, 400)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AutocompleteTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+        # Index de ce processus vides au début de chaque test
+        patcher = mock.patch.multiple('api.autocomplete', _indexes=None, _loaded_version=None, _checked_at=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.author = make_user("author")
+        fantasy, epic = Genre.objects.create(name="Fantasy"), Genre.objects.create(name="Fantastique épique")
+        for index in range(2):
+            make_book(self.author, f"Livre {index}").genres.add(fantasy)
+        make_book(self.author, "Livre 2").genres.add(epic)
+
+    def test_prefix_index(self):
+        index = PrefixIndex([("Le Petit Prince", 1), ("Prince de Perse", 3), ("Éléphant", 2), ("Petit", 5)])
+        self.assertEqual([item['name'] for item in index.complete("pri")], ["Prince de Perse", "Le Petit Prince"])
+        self.assertEqual([item['name'] for item in index.complete("PETIT")], ["Petit", "Le Petit Prince"])
+        self.assertEqual(index.complete("ele"), [{'name': "Éléphant", 'count': 2}])
+        self.assertEqual(len(index.complete("", limit=3)), 3)
+        self.assertEqual(index.complete("z"), [])
+
+    def test_suggestions_are_ranked_and_served_from_memory(self):
+        self.assertEqual(autocomplete("fan", kinds=['genre'])['genre'], [{'name': "Fantasy", 'count': 2}, {'name': "Fantastique épique", 'count': 1}])
+        self.assertEqual(autocomplete("epi", kinds=['genre'])['genre'][0]['name'], "Fantastique épique")
+        with self.assertNumQueries(0):
+            autocomplete("aut")
+
+    def test_changes_rebuild_the_index(self):
+        self.assertEqual(autocomplete("auteur", kinds=['author'])['author'], [{'name': "Auteur author", 'count': 3}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.author_name = "Plume Rapide"
+            self.author.save()
+        self.assertEqual(autocomplete("rap", kinds=['author'])['author'], [{'name': "Plume Rapide", 'count': 3}])
+        self.assertEqual(autocomplete("auteur", kinds=['author'])['author'], [])
+
+    def test_view(self):
+        response = self.client.get(reverse('autocomplete'), {'q': "fan", 'type': 'genre', 'limit': 1})
+        self.assertEqual(response.data, {'genre': [{'name': "Fantasy", 'count': 2}]})
+        self.assertEqual(self.client.get(reverse('autocomplete'), {'q': "fan", 'type': 'planet'}).status_code, 400)
+
+
+class SparseFieldsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(make_user("author"), "Livre")
+        self.character = make_character(self.book, "Aria", traits=["loyale"])
+        self.chapter = make_chapter(self.book, 1)
+
+    def get(self, name, kwargs, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs), params)
+        return response, ' '.join(query['sql'] for query in queries.captured_queries)
+
+    def test_only_requested_fields_are_read_and_returned(self):
+        kwargs = {'slug_book': self.book.slug, 'slug_character': self.character.slug}
+        response, sql = self.get('character-getinfo', kwargs, {'fields': "name,slug,inconnu"})
+        self.assertEqual(set(response.data), {'name', 'slug'})
+        self.assertNotIn('"api_character"."background"', sql)
+
+        response, sql = self.get('character-getinfo', kwargs, {'exclude': "background,traits"})
+        self.assertNotIn('background', response.data)
+        self.assertIn('name', response.data)
+        self.assertNotIn('"api_character"."background"', sql)
+
+        response, sql = self.get('character-getinfo', kwargs, {})
+        self.assertIn('background', response.data)
+        self.assertIn('"api_character"."background"', sql)
+
+    def test_cursor_pagination_keeps_its_ordering_column(self):
+        for index in range(3):
+            ChapterComment.objects.create(chapter=self.chapter, user=make_user(f"reader{index}"), content=f"Commentaire {index}")
+        kwargs = {'slug_book': self.book.slug, 'slug_chapter': self.chapter.slug}
+        first, _ = self.get('comment-getall', kwargs, {'fields': "content", 'size': 2})
+        self.assertEqual(first.data['results'], [{'content': "Commentaire 2"}, {'content': "Commentaire 1"}])
+        self.assertEqual(self.client.get(first.data['next']).data['results'], [{'content': "Commentaire 0"}])
+
+
+class RenderingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(make_user("author"), "Livre")
+        for number in range(1, 6):
+            Chapter.objects.create(book=self.book, title=f"Chapitre {number}", content="mot " * 400, type='chapitre', chapter_number=number)
+        self.url = reverse('chapter-getall', kwargs={'slug': self.book.slug})
+
+    @skipIf(orjson is None, "orjson n'est pas installé")
+    def test_fast_renderer_matches_drf(self):
+        data = {'id': uuid.uuid4(), 'date': timezone.now(), 'day': date(2025, 1, 31), 'score': Decimal("4.5"), 'items': [1, None, "é"], 3: True}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_long_lists_are_streamed_in_chunks(self):
+        expected = self.client.get(self.url).data
+        with mock.patch('api.views.ChapterListView.stream_chunk_size', 2):
+            response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), json.loads(JSONRenderer().render(expected)))
+
+    @skipIf(brotli is None, "brotli n'est pas installé")
+    def test_compression(self):
+        plain = self.client.get(self.url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual((compressed['Content-Encoding'], compressed['Vary'].count('Accept-Encoding')), ('br', 1))
+        self.assertEqual(brotli.decompress(compressed.content), plain.content)
+        gzipped = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        # Flux compressé morceau par morceau
+        with mock.patch('api.views.ChapterListView.stream_chunk_size', 2):
+            streamed = self.client.get(self.url, HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(json.loads(brotli.decompress(b''.join(streamed.streaming_content))), json.loads(plain.content))
+        # Petites réponses envoyées telles quelles
+        small = self.client.get(reverse('book-getinfo', kwargs={'slug': self.book.slug}), {'fields': "slug"}, HTTP_ACCEPT_ENCODING="br")
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+@skipIf(msgpack is None, "msgpack n'est pas installé")
+class MessagePackTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("author")
+        self.book = make_book(self.user, "Livre")
+
+    def test_same_data_as_json(self):
+        url = reverse('book-getinfo', kwargs={'slug': self.book.slug})
+        as_json = self.client.get(url).json()
+        response = self.client.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response['Content-Type'], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), as_json)
+        self.assertEqual(msgpack.unpackb(self.client.get(url, {'format': 'msgpack'}).content, raw=False), as_json)
+
+    def test_list_views_are_not_streamed_in_msgpack(self):
+        for number in range(1, 4):
+            make_chapter(self.book, number)
+        url = reverse('chapter-getall', kwargs={'slug': self.book.slug})
+        with mock.patch('api.views.ChapterListView.stream_chunk_size', 2):
+            response = self.client.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(msgpack.unpackb(response.content, raw=False)), 3)
+
+    def test_request_bodies(self):
+        body = msgpack.packb({'pseudo': "author", 'password': "pw"})
+        response = self.client.post(reverse('user-login'), body, content_type="application/msgpack")
+        self.assertEqual((response.status_code, response.data['pseudo']), (200, "author"))
+        invalid = self.client.post(reverse('user-login'), b"\xc1", content_type="application/msgpack")
+        self.assertEqual(invalid.status_code, 400)
+
+
+class SurrogateKeyTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.book = make_book(self.author, "Livre")
+        get_purger().clear()
+
+    def test_public_get_is_tagged_with_its_keys(self):
+        response = self.client.get(reverse('book-getinfo', kwargs={'slug': self.book.slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("s-maxage=", response['Cache-Control'])
+        self.assertEqual(response['Surrogate-Key'], f"book:{self.book.slug} book-all:{self.book.slug}")
+        self.assertIn('Accept', response['Vary'])
+
+        # Une erreur n'est jamais mise en cache par le CDN
+        missing = self.client.get(reverse('book-getinfo', kwargs={'slug': "inconnu"}))
+        self.assertEqual(missing.status_code, 404)
+        self.assertFalse(missing.has_header('Surrogate-Key'))
+
+    def test_update_purges_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(reverse('book-update', kwargs={'slug': self.book.slug}), {'token': str(self.author.token), 'title': "Nouveau titre"}, format='json')
+            self.assertEqual(response.status_code, 200)
+            # Rien n'est purgé avant la validation de la transaction
+            self.assertEqual(get_purger().purged, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_purger().purged, [sorted(book_all_keys(self.book))])
+
+    def test_purge_failure_does_not_fail_the_write(self):
+        with mock.patch.object(get_purger(), 'purge', side_effect=RuntimeError("CDN indisponible")), self.assertLogs('api.cdn', level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(reverse('book-update', kwargs={'slug': self.book.slug}), {'token': str(self.author.token), 'title': "Nouveau titre"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, "Nouveau titre")
+
+    def test_deleted_user_keys_cover_reviewed_books(self):
+        reader = make_user("reader")
+        other = make_book(make_user("other"), "Autre")
+        Review.objects.create(book=other, user=reader, score=4, comment="Bien")
+        keys = user_keys(reader, deleted=True)
+        self.assertIn(f"reviews:{other.slug}", keys)
+        # La note du livre et le catalogue de son auteur sont recalculés
+        self.assertIn(f"book:{other.slug}", keys)
+        self.assertIn(f"author:{other.author.token}", keys)
+        self.assertNotIn(f"book:{other.slug}", user_keys(reader))
+
+    @override_settings(FASTLY_SERVICE_ID="service", FASTLY_API_TOKEN="secret")
+    def test_fastly_purger_sends_sorted_batches(self):
+        keys = [f"chapter:{self.book.slug}/chapitre-{number}" for number in range(PURGE_BATCH_SIZE + 10)]
+        with mock.patch('api.cdn.requests.post') as post:
+            FastlyPurger().purge(keys)
+        self.assertEqual(post.call_count, 2)
+        sent = [call.kwargs['headers']['Surrogate-Key'].split(' ') for call in post.call_args_list]
+        self.assertEqual([len(batch) for batch in sent], [PURGE_BATCH_SIZE, 10])
+        self.assertEqual(sent[0] + sent[1], sorted(keys))
+        self.assertEqual(post.call_args.kwargs['headers']['Fastly-Key'], "secret")
+
+
+class ReadingProgressTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user("reader")
+        self.books = [make_book(make_user(f"author{index}"), f"Livre {index}") for index in range(2)]
+        self.chapters = [make_chapter(self.books[0], number) for number in (1, 2)]
+        self.now = timezone.now()
+
+    def item(self, book, chapter, offset, minutes_ago):
+        return {'book': book.slug, 'chapter': chapter.slug if chapter else None, 'offset': offset, 'updated_at': (self.now - timedelta(minutes=minutes_ago)).isoformat()}
+
+    def test_most_recent_progress_wins(self):
+        sync_reading_progress(self.reader, [self.item(self.books[0], self.chapters[1], 300, minutes_ago=5)])
+        # Un appareil resté hors ligne envoie une progression plus ancienne : elle est ignorée
+        progress, ignored = sync_reading_progress(self.reader, [self.item(self.books[0], self.chapters[0], 100, minutes_ago=30)])
+        self.assertEqual([(entry.chapter_id, entry.offset) for entry in progress], [(self.chapters[1].pk, 300)])
+        self.assertEqual(ignored, [])
+
+        # Dans un même lot, la plus récente l'emporte quel que soit l'ordre
+        sync_reading_progress(self.reader, [self.item(self.books[0], self.chapters[1], 900, minutes_ago=1), self.item(self.books[0], self.chapters[0], 50, minutes_ago=2)])
+        stored = ReadingProgress.objects.get(user=self.reader, book=self.books[0])
+        self.assertEqual((stored.chapter_id, stored.offset), (self.chapters[1].pk, 900))
+
+    def test_future_dates_are_clamped_to_now(self):
+        sync_reading_progress(self.reader, [self.item(self.books[0], None, 10, minutes_ago=-60)])
+        # Sinon l'appareil à l'heure ne pourrait plus rien synchroniser pendant une heure
+        sync_reading_progress(self.reader, [{'book': self.books[0].slug, 'offset': 20}])
+        self.assertEqual(ReadingProgress.objects.get(user=self.reader, book=self.books[0]).offset, 20)
+
+    def test_unknown_slugs_are_ignored(self):
+        schedule_book_deletion(self.books[1])
+        progress, ignored = sync_reading_progress(self.reader, [
+            self.item(self.books[0], None, 10, minutes_ago=1),
+            self.item(self.books[1], None, 10, minutes_ago=1),
+            {'book': "inconnu", 'chapter': "chapitre-9", 'offset': 5},
+            {'book': self.books[0].slug, 'chapter': "chapitre-9", 'offset': 5, 'updated_at': self.now.isoformat()},
+        ])
+        self.assertEqual(ignored, sorted(["inconnu", self.books[1].slug]))
+        # Un chapitre inconnu garde la progression du livre, sans chapitre
+        self.assertEqual([(entry.book_id, entry.chapter_id, entry.offset) for entry in progress], [(self.books[0].pk, None, 5)])
+
+    def test_invalid_batches_are_rejected(self):
+        for items in ["livre", [{'offset': 1}], [{'book': self.books[0].slug, 'offset': -1}], [{'book': self.books[0].slug, 'updated_at': "hier"}]]:
+            with self.assertRaises(ValueError):
+                sync_reading_progress(self.reader, items)
+        with self.assertRaises(ValueError):
+            sync_reading_progress(self.reader, [{'book': self.books[0].slug}] * (PROGRESS_SYNC_MAX_ITEMS + 1))
+        self.assertFalse(ReadingProgress.objects.exists())
+
+    def test_sync_takes_a_fixed_number_of_queries(self):
+        items = [self.item(book, None, 10, minutes_ago=1) for book in self.books]
+        with CaptureQueriesContext(connection) as few:
+            sync_reading_progress(self.reader, items[:1])
+        ReadingProgress.objects.all().delete()
+        with CaptureQueriesContext(connection) as many:
+            progress, ignored = sync_reading_progress(self.reader, items)
+            list(progress)
+        self.assertLessEqual(len(many.captured_queries), len(few.captured_queries) + 1)
+
+    def test_sync_and_continue_reading_views(self):
+        token = str(self.reader.token)
+        response = self.client.post(reverse('progress-sync'), {'token': token, 'progress': [
+            self.item(self.books[1], None, 40, minutes_ago=10),
+            self.item(self.books[0], self.chapters[0], 80, minutes_ago=1),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ignored'], [])
+        self.assertEqual(response.data['progress'][0]['chapter_title'], self.chapters[0].title)
+
+        listed = self.client.get(reverse('progress-continue'), {'token': token, 'limit': 1})
+        self.assertEqual([entry['book'] for entry in listed.data], [self.books[0].slug])
+        self.assertEqual(self.client.post(reverse('progress-sync'), {'token': token, 'progress': "x"}, format='json').status_code, 400)
+
+
+@override_settings(JOBS_EAGER=False)
+class NotificationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.book = make_book(self.author, "Livre")
+        self.followers = [make_user(f"follower{index}") for index in range(3)]
+        for follower in self.followers:
+            FollowedAuthor.objects.create(user=follower, author=self.author)
+
+    def unread(self):
+        return [unread_count(User.objects.get(pk=follower.pk)) for follower in self.followers]
+
+    def test_fan_out_is_a_background_job(self):
+        notification = publish_notification('book', self.book)
+        self.assertTrue(notification.fanned_out)
+        self.assertFalse(InboxEntry.objects.exists())
+        self.assertEqual([job.name for job in run_ready_jobs()], [Job.objects.get().name])
+        self.assertEqual(InboxEntry.objects.filter(notification=notification).count(), 3)
+        self.assertEqual(self.unread(), [1, 1, 1])
+
+    def test_retried_fan_out_does_not_count_twice(self):
+        notification = publish_notification('chapter', self.book, make_chapter(self.book, 1))
+        # Une première exécution interrompue après avoir servi le premier abonné
+        InboxEntry.objects.create(user=self.followers[0], notification=notification)
+        User.objects.filter(pk=self.followers[0].pk).update(unread_notifications=1)
+
+        with mock.patch('api.notifications.NOTIFICATION_BATCH_SIZE', 2):
+            self.assertEqual(fan_out_notification(notification.pk), 2)
+        self.assertEqual(fan_out_notification(notification.pk), 0)
+        self.assertEqual(self.unread(), [1, 1, 1])
+        self.assertEqual(fan_out_notification(notification.pk + 1), 0)
+
+    def test_popular_authors_are_pulled_at_read_time(self):
+        with mock.patch('api.notifications.NOTIFICATION_FANOUT_THRESHOLD', 2):
+            notification = publish_notification('book', self.book)
+        self.assertFalse(notification.fanned_out)
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(InboxEntry.objects.exists())
+
+        follower = self.followers[0]
+        self.assertEqual(list(notifications_for(follower)), [notification])
+        self.assertEqual(self.unread(), [1, 1, 1])
+        # Un lecteur qui ne suit pas l'auteur ne la reçoit pas
+        self.assertEqual(list(notifications_for(make_user("reader"))), [])
+
+        mark_notifications_read(follower)
+        self.assertEqual(unread_count(follower), 0)
+        self.assertEqual(list(notifications_for(follower)), [notification])
+
+    def test_views_list_count_and_mark_read(self):
+        publish_notification('book', self.book)
+        run_ready_jobs()
+        other = make_book(self.author, "Supprimé")
+        publish_notification('book', other)
+        run_ready_jobs()
+        schedule_book_deletion(other)
+        token = str(self.followers[0].token)
+
+        listed = self.client.get(reverse('notification-getall'), {'token': token})
+        self.assertEqual(listed.status_code, 200)
+        # Les notifications d'un livre supprimé ne sont plus affichées
+        self.assertEqual([entry['book'] for entry in listed.data['results']], [self.book.slug])
+        self.assertIn('unread', listed.data)
+
+        self.assertEqual(self.client.post(reverse('notification-read'), {'token': token}, format='json').data, {'unread': 0})
+        self.assertEqual(self.client.get(reverse('notification-count'), {'token': token}).data, {'unread': 0})
+        self.assertEqual(self.client.get(reverse('notification-count')).status_code, 401)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, JOBS_EAGER=False)
+class LoadTestCommandTests(ApiTestCase):
+    def seed(self):
+        call_command('load_test', seed=True, readers=3, authors=2, books_per_author=2, chapters_per_book=3, stdout=StringIO())
+
+    def test_seed_and_cleanup(self):
+        reader = make_user("reader")
+        self.seed()
+        self.assertEqual(User.objects.filter(pseudo__startswith=LOAD_PREFIX).count(), 5)
+        self.assertEqual(Chapter.objects.filter(book__slug__startswith=LOAD_PREFIX).count(), 12)
+        # Relancer --seed repart de zéro au lieu de dupliquer les données
+        self.seed()
+        self.assertEqual(Book.objects.filter(slug__startswith=LOAD_PREFIX).count(), 4)
+
+        call_command('load_test', cleanup=True, stdout=StringIO())
+        self.assertFalse(User.objects.filter(pseudo__startswith=LOAD_PREFIX).exists())
+        self.assertFalse(Book.objects.filter(slug__startswith=LOAD_PREFIX).exists())
+        self.assertTrue(User.objects.filter(pk=reader.pk).exists())
+
+    def test_generated_requests_are_accepted_by_the_api(self):
+        self.seed()
+        command = LoadTestCommand()
+        command.rng = random.Random(1)
+        command.load_state()
+        sent = Counter()
+        for index in range(60):
+            url_name, method, path, params, body = command.next_request(command.readers[index % len(command.readers)])
+            url = f"{path}?{urlencode(params)}" if params else path
+            response = self.client.generic(method, url, json.dumps(body) if body else '', content_type='application/json')
+            sent[url_name] += 1
+            self.assertLess(response.status_code, 300, (url_name, response.status_code, getattr(response, 'data', None)))
+        # Le mélange couvre les lectures comme les écritures
+        self.assertTrue({'book-getall', 'chapter-getinfo'} <= set(sent))
+        self.assertTrue(set(sent) - {'book-getall', 'chapter-getinfo'})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 51)
+        self.assertEqual(percentile(values, 0.99), 100)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertEqual(sum(SCENARIO.values()), 100)
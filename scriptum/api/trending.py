@@ -0,0 +1,85 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Book, Review, Favorite, FollowedAuthor
+from .catalog import invalidate_catalog
+
+# Une activité perd la moitié de son poids tous les TRENDING_HALF_LIFE_DAYS jours
+TRENDING_HALF_LIFE_DAYS = 3
+TRENDING_DECAY = math.log(2) / (TRENDING_HALF_LIFE_DAYS * 24 * 3600)
+
+# Date de référence fixe : les scores sont exprimés par rapport à elle (forward decay),
+# ce qui permet de comparer des livres recalculés à des moments différents sans toucher les livres inactifs
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Poids de chaque type d'activité
+TRENDING_WEIGHTS = {
+    'review': 3.0,
+    'favorite': 2.0,
+    'follow': 1.0,
+}
+
+
+# Poids d'une review : une review 5 étoiles compte le poids plein, une review 0 étoile en compte 1/6
+def review_weight(score):
+    return TRENDING_WEIGHTS['review'] * (score + 1) / 6
+
+
+# Calcule le score de tendance à partir d'une liste de (poids, date)
+# Le score est log(somme(poids * exp(decay * (date - epoch)))), calculé en espace logarithmique pour éviter les débordements
+def compute_trending_score(events):
+    exponents = [
+        math.log(weight) + TRENDING_DECAY * (date - TRENDING_EPOCH).total_seconds()
+        for weight, date in events
+    ]
+    if not exponents:
+        return 0.0
+    peak = max(exponents)
+    return round(peak + math.log(sum(math.exp(exponent - peak) for exponent in exponents)), 6)
+
+
+# Marque des livres comme ayant une nouvelle activité pour le prochain passage de refresh_trending
+def mark_books_active(**filters):
+    Book.objects.filter(**filters).update(last_activity_at=timezone.now())
+
+
+# Recalcule le score des livres ayant eu de l'activité depuis leur dernier calcul (ou de tous si full=True)
+def refresh_trending_scores(batch_size=500, full=False):
+    started_at = timezone.now()
+    books = Book.objects.all()
+    if not full:
+        books = books.filter(last_activity_at__isnull=False).filter(
+            Q(trending_updated_at__isnull=True) | Q(last_activity_at__gt=F('trending_updated_at'))
+        )
+    book_ids = list(books.order_by('pk').values_list('pk', flat=True))
+
+    for start in range(0, len(book_ids), batch_size):
+        chunk = book_ids[start:start + batch_size]
+        events = defaultdict(list)
+
+        for book_id, score, date in Review.objects.filter(book_id__in=chunk).values_list('book_id', 'score', 'publication_date'):
+            events[book_id].append((review_weight(score), date))
+
+        for book_id, date in Favorite.objects.filter(book_id__in=chunk, created_at__isnull=False).values_list('book_id', 'created_at'):
+            events[book_id].append((TRENDING_WEIGHTS['favorite'], date))
+
+        # Les favoris et suivis sans date (antérieurs au score de tendance) ne comptent pas comme une activité récente
+        # Un suivi d'auteur profite à tous les livres de cet auteur
+        books_by_author = defaultdict(list)
+        for book_id, author_id in Book.objects.filter(pk__in=chunk).values_list('pk', 'author_id'):
+            books_by_author[author_id].append(book_id)
+        for author_id, date in FollowedAuthor.objects.filter(author_id__in=books_by_author, created_at__isnull=False).values_list('author_id', 'created_at'):
+            for book_id in books_by_author[author_id]:
+                events[book_id].append((TRENDING_WEIGHTS['follow'], date))
+
+        updated_books = [
+            Book(pk=book_id, trending_score=compute_trending_score(events[book_id]), trending_updated_at=started_at)
+            for book_id in chunk
+        ]
+        Book.objects.bulk_update(updated_books, ['trending_score', 'trending_updated_at'])
+
+    # bulk_update ne déclenche pas les signaux : le catalogue en mémoire est rechargé
+    invalidate_catalog()
+    return len(book_ids)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import UserCreateView, UserLoginView, UserDeleteView, UserRetrieveView, UserUpdateView, BookCreateView, BookRetrieveView, BookListAllView, BookUpdateView, ReviewCreateView, ReviewListView, ChapterCreateView, ChapterRetrieveView, ChapterListView, ChapterUpdateView, CharacterCreateView, CharacterUpdateView, CharacterListView, CharactRetrieveView, CharacterDeleteView, ChapterDeleteView, PlaceCreateView, PlaceListView, PlaceRetrieveView, PlaceUpdateView, PlaceDeleteView, CreatureCreateView, CreatureListView, CreatureRetrieveView, CreatureUpdateView, CreatureDeleteView, BookListByAuthorView, BookDeleteView, FavoriteCreateView, FavoriteDeleteView, FavoriteListView, FollowedAuthorCreateView, FollowedAuthorDeleteView, FollowedAuthorListView, healthcheck
+from .views import UserCreateView, UserLoginView, UserDeleteView, UserRetrieveView, UserUpdateView, AuthorStatsView, BookCreateView, BookRetrieveView, BookViewBeaconView, BookListAllView, BookUpdateView, ReviewCreateView, ReviewListView, ChapterCreateView, ChapterRetrieveView, ChapterViewBeaconView, ChapterListView, ChapterUpdateView, ChapterReorderView, ChapterAutosaveView, ChapterRevisionListView, ChapterRevisionRetrieveView, ChapterRevisionRestoreView, ChapterCommentCreateView, ChapterCommentListView, ChapterCommentDeleteView, CharacterCreateView, CharacterUpdateView, CharacterListView, CharactRetrieveView, CharacterSearchView, CharacterGraphView, CharacterDeleteView, ChapterDeleteView, PlaceCreateView, PlaceListView, PlaceRetrieveView, PlaceUpdateView, PlaceDeleteView, CreatureCreateView, CreatureListView, CreatureRetrieveView, CreatureUpdateView, CreatureDeleteView, BookListByAuthorView, BookDeleteView, FavoriteCreateView, FavoriteDeleteView, FavoriteListView, FollowedAuthorCreateView, FollowedAuthorDeleteView, FollowedAuthorListView, NotificationListView, NotificationCountView, NotificationReadView, ReadingProgressSyncView, ContinueReadingView, DeletionJobRetrieveView, RunJobsView, SearchView, AutocompleteView, healthcheck
 urlpatterns = [
     # PARTIE USER
     path('register/', UserCreateView.as_view(), name='user-register'),
@@ -7,9 +7,11 @@ urlpatterns = [
     path('delete/', UserDeleteView.as_view(), name='user-delete'),
     path('getinfo/', UserRetrieveView.as_view(), name='user-getinfo'),
     path('updateinfo/', UserUpdateView.as_view(), name='user-updateinfo'),
+    path('authorstats/', AuthorStatsView.as_view(), name='user-authorstats'),
     # PARTIE BOOK
     path('createbook/', BookCreateView.as_view(), name='book-create'),
     path('getbookinfo/<slug:slug>/', BookRetrieveView.as_view(), name='book-getinfo'),
+    path('viewbook/<slug:slug>/', BookViewBeaconView.as_view(), name='book-view'),
     path('getallbook/', BookListAllView.as_view(), name='book-getall'),
     path('editbook/<slug:slug>/', BookUpdateView.as_view(), name='book-update'),
     path('<uuid:token>/getallauthorbook/', BookListByAuthorView.as_view(), name='book-getallbyauthor'),
@@ -20,14 +22,26 @@ urlpatterns = [
     # PARTIE CHAPTER
     path('createchapter/', ChapterCreateView.as_view(), name='chapter-create'),
     path('<slug:slug_book>/getchapterinfo/<slug:slug_chapter>/', ChapterRetrieveView.as_view(), name='chapter-getinfo'),
+    path('<slug:slug_book>/viewchapter/<slug:slug_chapter>/', ChapterViewBeaconView.as_view(), name='chapter-view'),
     path('<slug:slug>/getallchapters/', ChapterListView.as_view(), name='chapter-getall'),
     path('<slug:slug_book>/editchapter/<slug:slug_chapter>/', ChapterUpdateView.as_view(), name='chapter-update'),
     path('<slug:slug_book>/deletechapter/<slug:slug_chapter>/', ChapterDeleteView.as_view(), name='chapter-delete'),
+    path('<slug:slug_book>/reorderchapters/', ChapterReorderView.as_view(), name='chapter-reorder'),
+    path('<slug:slug_book>/autosavechapter/<slug:slug_chapter>/', ChapterAutosaveView.as_view(), name='chapter-autosave'),
+    path('<slug:slug_book>/getchapterrevisions/<slug:slug_chapter>/', ChapterRevisionListView.as_view(), name='chapter-revisions'),
+    path('<slug:slug_book>/getchapterrevision/<slug:slug_chapter>/<int:number>/', ChapterRevisionRetrieveView.as_view(), name='chapter-revision-getinfo'),
+    path('<slug:slug_book>/restorechapterrevision/<slug:slug_chapter>/<int:number>/', ChapterRevisionRestoreView.as_view(), name='chapter-revision-restore'),
+    # PARTIE COMMENTAIRE
+    path('<slug:slug_book>/createcomment/<slug:slug_chapter>/', ChapterCommentCreateView.as_view(), name='comment-create'),
+    path('<slug:slug_book>/getallcomments/<slug:slug_chapter>/', ChapterCommentListView.as_view(), name='comment-getall'),
+    path('<slug:slug_book>/deletecomment/<slug:slug_chapter>/', ChapterCommentDeleteView.as_view(), name='comment-delete'),
     # PARTIE CHARACTER
     path('createcharacter/', CharacterCreateView.as_view(), name='character-create'),
     path('<slug:slug_book>/updatecharacter/<slug:slug_character>/', CharacterUpdateView.as_view(), name='character-update'),
     path('<slug:slug>/getallcharacters/', CharacterListView.as_view(), name='character-getall'),
     path('<slug:slug_book>/getcharacterinfo/<slug:slug_character>/', CharactRetrieveView.as_view(), name='character-getinfo'),
+    path('<slug:slug_book>/searchcharacters/', CharacterSearchView.as_view(), name='character-search'),
+    path('<slug:slug_book>/charactergraph/', CharacterGraphView.as_view(), name='character-graph'),
     path('<slug:slug_book>/deletecharacter/<slug:slug_character>/', CharacterDeleteView.as_view(), name='character-delete'),
     # PARTIE PLACE
     path('createplace/', PlaceCreateView.as_view(), name='place-create'),
@@ -49,7 +63,60 @@ urlpatterns = [
     path('newfollowedauthor/', FollowedAuthorCreateView.as_view(), name='followedauthor-create'),
     path('deletefollowedauthor/<str:author_name>/', FollowedAuthorDeleteView.as_view(), name='followedauthor-delete'),
     path('getallfollowedauthors/<uuid:token>/', FollowedAuthorListView.as_view(), name='followedauthor-getall'),
+    # PARTIE NOTIFICATION
+    path('notifications/', NotificationListView.as_view(), name='notification-getall'),
+    path('notificationcount/', NotificationCountView.as_view(), name='notification-count'),
+    path('readnotifications/', NotificationReadView.as_view(), name='notification-read'),
+    # PARTIE PROGRESSION DE LECTURE
+    path('syncprogress/', ReadingProgressSyncView.as_view(), name='progress-sync'),
+    path('continuereading/', ContinueReadingView.as_view(), name='progress-continue'),
+    # PARTIE SUPPRESSION
+    path('getdeletionjob/<uuid:token>/', DeletionJobRetrieveView.as_view(), name='deletionjob-getinfo'),
+    # PARTIE TÂCHES DE FOND
+    path('runjobs/', RunJobsView.as_view(), name='jobs-run'),
+    # PARTIE RECHERCHE
+    path('search/', SearchView.as_view(), name='search'),
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
 
     # TEST REQUETE DEPLOIEMENT
     path("healthcheck/", healthcheck, name="healthcheck")
-]
\ No newline at end of file
+]
+
+# Budgets de requêtes par nom d'URL (voir api/ratelimit.py) : "nombre/période" (s, min, hour, day), None pour aucune limite
+# Par utilisateur pour les vues à token, par IP pour les autres ; les routes absentes utilisent RATE_LIMIT_DEFAULT
+RATE_LIMITS = {
+    # PARTIE USER
+    'user-register': '10/hour',
+    'user-login': '10/min',
+    'user-delete': '5/hour',
+    # PARTIE BOOK
+    'book-create': '20/hour',
+    'book-getall': '60/min',
+    'book-view': '60/min',
+    'book-update': '60/min',
+    'book-delete': '10/hour',
+    # PARTIE REVIEW
+    'review-create': '10/min',
+    # PARTIE CHAPTER (une sauvegarde automatique toutes les secondes pendant la frappe)
+    'chapter-view': '60/min',
+    'chapter-create': '60/hour',
+    'chapter-update': '60/min',
+    'chapter-autosave': '120/min',
+    'chapter-revision-restore': '30/min',
+    # PARTIE COMMENTAIRE
+    'comment-create': '20/min',
+    # PARTIE FAVORITE ET AUTEUR SUIVI
+    'favorite-create': '30/min',
+    'favorite-delete': '30/min',
+    'followedauthor-create': '30/min',
+    'followedauthor-delete': '30/min',
+    # PARTIE PROGRESSION DE LECTURE
+    'progress-sync': '60/min',
+    # PARTIE RECHERCHE (une suggestion par frappe)
+    'search': '60/min',
+    'autocomplete': '600/min',
+    # PARTIE TÂCHES DE FOND (cron toutes les minutes)
+    'jobs-run': '10/min',
+    # TEST REQUETE DEPLOIEMENT
+    'healthcheck': None,
+}
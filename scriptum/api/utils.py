@@ -1,22 +1,34 @@
 from functools import wraps
+from django.core.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import status
 from .models import User
+from .ratelimit import check_rate_limit, client_ip
 
 def require_token(view_func):
     @wraps(view_func)
     def wrapper(self, request, *args, **kwargs):
         token = request.data.get('token') or request.query_params.get('token')
+        try:
+            user = User.objects.filter(token=token, deleted_at__isnull=True).first() if token else None
+        except ValidationError:
+            # Token qui n'est pas un UUID
+            user = None
+
+        # Budget de requêtes par utilisateur et par route ; un token manquant ou invalide est compté sur le budget de l'IP,
+        # sinon les essais de tokens ne seraient jamais limités
+        limit = check_rate_limit(request, f"user:{user.pk}" if user is not None else f"ip:{client_ip(request)}")
+        if limit is not None and not limit.allowed:
+            return Response({'error': 'Trop de requêtes, réessayez plus tard'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         if not token:
             return Response({'error': 'Token manquant'}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        try:
-            user = User.objects.get(token=token)
-        except User.DoesNotExist:
+        if user is None:
             return Response({'error': 'Token invalide'}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        request.user = user 
+
+        request.user = user
+
         return view_func(self, request, *args, **kwargs)
     
+    wrapper.requires_token = True
     return wrapper
\ No newline at end of file
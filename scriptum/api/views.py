@@ -4,13 +4,34 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from .models import User, Book, Review, Chapter, Character, Place, Creature, Favorite, FollowedAuthor
+from .models import User, Book, Review, ReviewHistogram, Chapter, ChapterRevision, ChapterComment, Character, Place, Creature, Favorite, FollowedAuthor, DeletionJob
 from .utils import require_token
-from .serializers import UserSerializer, LoginSerializer, BookSerializer, BookReadSerializer, ReviewSerializer, ChapterSerializer, CharacterSerializer, PlaceSerializer, CreatureSerializer, FavoriteSerializer, FollowedAuthorSerializer
-from .pagination import BookPagination
-from .filters import BookFilter
-from django.db import IntegrityError
+from .stats import get_author_stats
+from .chapter_order import reorder_chapters, move_chapter, chapter_positions
+from .revisions import record_revision, get_revision_content
+from .character_search import filter_characters, character_facets, CHARACTER_FACET_FIELDS
+from .character_graph import get_character_graph, shortest_path
+from .search import search, SEARCH_MODELS
+from .autocomplete import autocomplete, AUTOCOMPLETE_KINDS
+from .catalog import catalog_book_ids, hydrate_books
+from .facets import get_book_facets
+from .fieldsets import SparseFieldsViewMixin, sparse_queryset
+from .renderers import StreamingListMixin
+from .cdn import SurrogateKeyMixin, purge_surrogate_keys, book_keys, book_all_keys, chapter_keys, worldbuilding_keys, user_keys
+from .deletion import schedule_user_deletion, schedule_book_deletion
+from .counters import record_book_view, record_chapter_view
+from .progress import sync_reading_progress, continue_reading
+from .notifications import publish_notification, notifications_for, unread_count, mark_notifications_read
+from .jobs import Worker
+from .autosave import autosave, current_content, content_version, discard_autosave, AutosaveConflict
+from .serializers import UserSerializer, LoginSerializer, BookSerializer, BookReadSerializer, ReviewSerializer, ChapterSerializer, ChapterRevisionSerializer, ChapterCommentSerializer, CharacterSerializer, PlaceSerializer, CreatureSerializer, FavoriteSerializer, FollowedAuthorSerializer, ReadingProgressSerializer, NotificationSerializer, DeletionJobSerializer
+from .pagination import BookPagination, CharacterPagination, CommentCursorPagination, ReviewCursorPagination, NotificationCursorPagination
+from .filters import BookFilter, BookOrderingFilter
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.http import JsonResponse
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 
 
 # PARTIE UTILISATEUR
@@ -30,7 +51,7 @@ class UserLoginView(APIView):
             password = serializer.validated_data['password']
 
             try:
-                user = User.objects.get(pseudo=pseudo)
+                user = User.objects.get(pseudo=pseudo, deleted_at__isnull=True)
             except User.DoesNotExist:
                 return Response({'error': 'Utilisateur non trouvé'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -46,12 +67,12 @@ class UserLoginView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 #DELETE delete/ pour supprimer un compte utilisateur
+# Le compte et ses livres sont masqués tout de suite, la suppression se fait en arrière-plan (suivi avec getdeletionjob/)
 class UserDeleteView(APIView):
     @require_token
     def delete(self, request):
-        user = request.user
-        user.delete()
-        return Response({"message": "Compte supprimé"}, status=status.HTTP_204_NO_CONTENT)
+        job = schedule_user_deletion(request.user)
+        return Response({"message": "Suppression du compte en cours", "job": job.token}, status=status.HTTP_202_ACCEPTED)
 
 # POST getinfo/ pour récupérer toutes les données d'un utilisateur
 class UserRetrieveView(APIView):
@@ -69,8 +90,10 @@ class UserUpdateView(APIView):
         serializer = UserSerializer(user, data=request.data, partial=True)
 
         if serializer.is_valid():
+            keys = user_keys(user)
             try:
                 serializer.save()
+                purge_surrogate_keys(keys)
                 return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
             except IntegrityError as e:
                 return Response({'error': "Ce pseudo ou cet email est déjà utilisé."}, status=status.HTTP_400_BAD_REQUEST)
@@ -78,6 +101,13 @@ class UserUpdateView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
 
+# GET authorstats/ pour récupérer les statistiques de tous les livres de l'auteur connecté
+class AuthorStatsView(APIView):
+    @require_token
+    def get(self, request):
+        return Response(get_author_stats(request.user), status=status.HTTP_200_OK)
+        
+
 # PARTIE ROMAN
 
 # POST createbook/ pour créer un nouveau roman
@@ -90,47 +120,79 @@ class BookCreateView(APIView):
 
         if serializer.is_valid():
             book = serializer.save()  # pas besoin de passer author, il est déjà dans create()
+            purge_surrogate_keys(book_keys(book))
+            publish_notification('book', book)
             return Response(BookReadSerializer(book).data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     
 # GET getbookinfo/ pour récupérer les données d'un livre
-class BookRetrieveView(APIView):
+class BookRetrieveView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['book:{slug}', 'book-all:{slug}']
+
     def get(self, request, slug):
         try:
-            book = Book.objects.get(slug=slug)
+            book = sparse_queryset(Book.objects.visible(), BookReadSerializer, request).get(slug=slug)
         except Book.DoesNotExist:
             return Response({'error': 'Livre non trouvé'}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = BookReadSerializer(book, context={'request': request})
         return Response(serializer.data)
 
+# POST viewbook/ pour compter une lecture d'un livre
+# getbookinfo est mis en cache par le CDN : le client appelle cette route (jamais mise en cache) à chaque affichage
+class BookViewBeaconView(APIView):
+    def post(self, request, slug):
+        book_id = Book.objects.visible().filter(slug=slug).values_list('pk', flat=True).first()
+        if book_id is None:
+            return Response({'error': 'Livre non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+        record_book_view(book_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # GET getallbook/ pour récupérer tous les livres
-class BookListAllView(generics.ListAPIView):
-    queryset = Book.objects.all()
+class BookListAllView(SurrogateKeyMixin, SparseFieldsViewMixin, generics.ListAPIView):
+    surrogate_keys = ['catalog']
+    queryset = Book.objects.visible()
     serializer_class = BookReadSerializer
     pagination_class = BookPagination
 
     # Ajout des filtres de recherche
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, BookOrderingFilter]
     filterset_class = BookFilter
 
     # Recherche textuelle
     search_fields = ["title", "description", "author__author_name", "tome_name"]
 
-    # Tri
-    ordering_fields = ["release_date", "rating", "title"]
+    # Tri (?ordering=trending pour les livres les plus tendance en premier, ?ordering=views pour les plus lus)
+    ordering_fields = ["release_date", "rating", "title", "trending", "views"]
     ordering = ["-rating", "-release_date", "title"] #ordre par défaut
 
+    # Avec CATALOG_ENGINE=True, filtres et tri sont calculés en mémoire : seuls les livres de la page sont lus en base
+    # ?facets=true ajoute le nombre de livres par genre, thème, état, public et saga pour les filtres actifs
+    def list(self, request, *args, **kwargs):
+        book_ids = catalog_book_ids(request, self)
+        if book_ids is None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            page = self.paginate_queryset(book_ids)
+            books = hydrate_books(sparse_queryset(self.get_queryset(), self.get_serializer_class(), request), page)
+            serializer = self.get_serializer(books, many=True)
+            response = self.get_paginated_response(serializer.data)
+
+        if request.query_params.get('facets', '').lower() in ['true', '1', 'yes']:
+            response.data['facets'] = get_book_facets(request.query_params, self.filter_queryset(self.get_queryset()))
+        return response
+
 # GET getallauthorbook/ pour récupérer tous les livres d'un auteur
-class BookListByAuthorView(generics.ListAPIView):
+class BookListByAuthorView(SurrogateKeyMixin, SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
+    surrogate_keys = ['author:{token}']
     serializer_class = BookReadSerializer
     pagination_class = None
 
     def get_queryset(self):
         token = self.kwargs.get('token')
-        return Book.objects.filter(author__token=token)
+        return Book.objects.visible().filter(author__token=token)
 
 
 # PUT editbook/ pour modifier des éléments du livre
@@ -151,22 +213,25 @@ class BookUpdateView(APIView):
 
         if serializer.is_valid():
             serializer.save()
+            # Titre, image, état... sont repris dans les chapitres, avis et fiches du livre
+            purge_surrogate_keys(book_all_keys(book))
             return Response(BookReadSerializer(book).data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
               
 # DELETE deletebook/ pour supprimer un livre
+# Le livre est masqué tout de suite, la suppression se fait en arrière-plan (suivi avec getdeletionjob/)
 class BookDeleteView(APIView):
     @require_token
 
     def delete(self, request, slug):
-        book = get_object_or_404(Book, slug=slug)
+        book = get_object_or_404(Book.objects.visible(), slug=slug)
 
         if book.author != request.user:
             return Response({"error": "Vous devez être l'auteur de ce livre pour le supprimer"}, status=status.HTTP_403_FORBIDDEN)
 
-        book.delete()
-        return Response({"message": "Le livre a été supprimé"}, status=status.HTTP_204_NO_CONTENT)   
+        job = schedule_book_deletion(book)
+        return Response({"message": "Suppression du livre en cours", "job": job.token}, status=status.HTTP_202_ACCEPTED)   
 
 # PARTIE REVIEW
         
@@ -177,17 +242,29 @@ class ReviewCreateView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = ReviewSerializer(data = request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            review = serializer.save(user=request.user)
+            # La note moyenne du livre est recalculée
+            purge_surrogate_keys(book_keys(review.book) + [f"reviews:{review.book.slug}"])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-# GET getallbookreviews/ pour récupérer toutes les reviews d'un livre
-class ReviewListView(generics.ListAPIView):
+# GET getallbookreviews/ pour récupérer toutes les reviews d'un livre, paginées par curseur (?cursor=...)
+# La première page contient aussi l'histogramme des notes du livre
+class ReviewListView(SurrogateKeyMixin, SparseFieldsViewMixin, generics.ListAPIView):
+    surrogate_keys = ['reviews:{slug}', 'book-all:{slug}']
     serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
 
     def get_queryset(self):
         slug = self.kwargs.get('slug')
-        return Review.objects.filter(book__slug=slug).order_by('-publication_date')
+        return Review.objects.filter(book__slug=slug, book__deleted_at__isnull=True, user__deleted_at__isnull=True).select_related('book', 'user')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not request.query_params.get('cursor'):
+            histogram = ReviewHistogram.objects.filter(book__slug=self.kwargs.get('slug')).first()
+            response.data['histogram'] = histogram.as_dict() if histogram else {str(score): 0 for score in range(6)}
+        return response
     
 
 # PARTIE CHAPITRE
@@ -199,42 +276,173 @@ class ChapterCreateView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = ChapterSerializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            with transaction.atomic():
+                chapter = serializer.save()
+                record_revision(chapter)
+            purge_surrogate_keys(chapter_keys(chapter.book, chapter.slug))
+            publish_notification('chapter', chapter.book, chapter)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 # GET getchapterinfo/ pour récupérer les données d'un chapitre
-class ChapterRetrieveView(APIView):
+class ChapterRetrieveView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['chapter:{slug_book}/{slug_chapter}', 'book-all:{slug_book}']
+
     def get(self, request, slug_book, slug_chapter):
-        chapter = get_object_or_404(Chapter, book__slug=slug_book, slug=slug_chapter)
+        chapter = get_object_or_404(sparse_queryset(Chapter.objects.all(), ChapterSerializer, request, keep=['book']), book__slug=slug_book, book__deleted_at__isnull=True, slug=slug_chapter)
         serializer = ChapterSerializer(chapter, context={'request': request})
         return Response(serializer.data)
+
+# POST viewchapter/ pour compter une lecture d'un chapitre (et de son livre), comme viewbook/
+class ChapterViewBeaconView(APIView):
+    def post(self, request, slug_book, slug_chapter):
+        chapter = Chapter.objects.filter(book__slug=slug_book, book__deleted_at__isnull=True, slug=slug_chapter).values_list('pk', 'book_id').first()
+        if chapter is None:
+            return Response({'error': 'Chapitre non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+        record_chapter_view(*chapter)
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 # GET getallchapters/ pour récupérer tous les chapitres d'un livre
-class ChapterListView(generics.ListAPIView):
+class ChapterListView(SurrogateKeyMixin, SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
+    surrogate_keys = ['toc:{slug}', 'book-all:{slug}']
     serializer_class = ChapterSerializer
     pagination_class = None
 
     def get_queryset(self):
         slug = self.kwargs.get('slug')
-        return Chapter.objects.filter(book__slug=slug).order_by('sort_order', 'chapter_number')
+        return Chapter.objects.filter(book__slug=slug, book__deleted_at__isnull=True).select_related('book').order_by('sort_order', 'position', 'chapter_number')
     
 # PUT editchapter/ pour modifier des éléments du chapitre
 class ChapterUpdateView(APIView):
     @require_token
     def patch(self, request, slug_book, slug_chapter): 
         chapter = get_object_or_404(Chapter, book__slug=slug_book, slug=slug_chapter)
+        previous_content = chapter.content
         serializer = ChapterSerializer(chapter, data=request.data, partial=True)
 
         if chapter.book.author != request.user:
             return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
 
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                # Garde une trace de l'ancienne version dans l'historique
+                if 'content' in serializer.validated_data:
+                    record_revision(chapter, previous_content=previous_content)
+            if 'content' in serializer.validated_data:
+                discard_autosave(chapter.pk)
+            # Le slug change si le numéro du chapitre change : l'ancienne et la nouvelle adresse sont purgées
+            purge_surrogate_keys(chapter_keys(chapter.book, slug_chapter, chapter.slug))
             return Response(ChapterSerializer(chapter).data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+# PATCH reorderchapters/ pour réorganiser les chapitres d'un livre
+# - {"chapters": [slugs dans le nouvel ordre]} : réordonne tout le livre en une seule requête
+# - {"chapter": slug, "before": slug} ou {"chapter": slug, "after": slug} : déplace un seul chapitre
+class ChapterReorderView(APIView):
+    @require_token
+    def patch(self, request, slug_book):
+        book = get_object_or_404(Book, slug=slug_book)
+
+        if book.author != request.user:
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        previous_slugs = set(book.chapters.values_list('slug', flat=True))
+        try:
+            if 'chapters' in request.data:
+                reorder_chapters(book, request.data.get('chapters'))
+            else:
+                move_chapter(book, request.data.get('chapter'), before=request.data.get('before'), after=request.data.get('after'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Chaque chapitre affiche sa position et son numéro ; une renumérotation change aussi l'adresse (slug) des chapitres
+        slugs = previous_slugs | set(book.chapters.values_list('slug', flat=True))
+        purge_surrogate_keys([f"toc:{book.slug}"] + [f"chapter:{book.slug}/{slug}" for slug in sorted(slugs)])
+        return Response(chapter_positions(book), status=status.HTTP_200_OK)
+        
+# GET/PATCH autosavechapter/ pour la sauvegarde automatique de l'éditeur
+# GET renvoie le contenu le plus récent et sa version, PATCH applique des opérations {"pos", "delete", "insert"} sur la version "base_version"
+class ChapterAutosaveView(APIView):
+    @require_token
+    def get(self, request, slug_book, slug_chapter):
+        chapter = get_object_or_404(Chapter.objects.select_related('book'), book__slug=slug_book, slug=slug_chapter)
+
+        if chapter.book.author != request.user:
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        content = current_content(chapter)
+        return Response({'version': content_version(content), 'content': content})
+
+    @require_token
+    def patch(self, request, slug_book, slug_chapter):
+        chapter = get_object_or_404(Chapter.objects.select_related('book'), book__slug=slug_book, slug=slug_chapter)
+
+        if chapter.book.author != request.user:
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            version = autosave(chapter, request.data.get('base_version'), request.data.get('ops', []))
+        except AutosaveConflict as e:
+            return Response({'error': str(e), 'version': e.version}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'version': version}, status=status.HTTP_200_OK)
+
+# GET getchapterrevisions/ pour lister l'historique des versions d'un chapitre (réservé à l'auteur)
+class ChapterRevisionListView(APIView):
+    @require_token
+    def get(self, request, slug_book, slug_chapter):
+        chapter = get_object_or_404(Chapter, book__slug=slug_book, slug=slug_chapter)
+
+        if chapter.book.author != request.user:
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        revisions = chapter.revisions.only('number', 'is_snapshot', 'size', 'created_at')
+        return Response(ChapterRevisionSerializer(revisions, many=True).data)
+
+# GET getchapterrevision/ pour afficher le contenu d'une version d'un chapitre (réservé à l'auteur)
+class ChapterRevisionRetrieveView(APIView):
+    @require_token
+    def get(self, request, slug_book, slug_chapter, number):
+        chapter = get_object_or_404(Chapter, book__slug=slug_book, slug=slug_chapter)
+
+        if chapter.book.author != request.user:
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            content = get_revision_content(chapter, number)
+        except ChapterRevision.DoesNotExist:
+            return Response({'error': 'Révision non trouvée'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'number': number, 'content': content})
+
+# POST restorechapterrevision/ pour remettre un chapitre dans une version précédente
+class ChapterRevisionRestoreView(APIView):
+    @require_token
+    def post(self, request, slug_book, slug_chapter, number):
+        chapter = get_object_or_404(Chapter, book__slug=slug_book, slug=slug_chapter)
+
+        if chapter.book.author != request.user:
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            content = get_revision_content(chapter, number)
+        except ChapterRevision.DoesNotExist:
+            return Response({'error': 'Révision non trouvée'}, status=status.HTTP_404_NOT_FOUND)
+
+        # La restauration crée une nouvelle révision : l'historique n'est jamais réécrit
+        previous_content = chapter.content
+        chapter.content = content
+        with transaction.atomic():
+            chapter.save()
+            record_revision(chapter, previous_content=previous_content)
+        discard_autosave(chapter.pk)
+        purge_surrogate_keys(chapter_keys(chapter.book, chapter.slug))
+        return Response(ChapterSerializer(chapter).data, status=status.HTTP_200_OK)
+
 # DELETE deletechapter/ pour supprimer un chapitre
 class ChapterDeleteView(APIView):
     @require_token
@@ -245,9 +453,52 @@ class ChapterDeleteView(APIView):
             return Response({"error": "non autorisé"}, status=status.HTTP_403_FORBIDDEN)
         
         chapter.delete()
+        purge_surrogate_keys(chapter_keys(chapter.book, slug_chapter) + [f"comments:{slug_book}/{slug_chapter}"])
         return Response({"message": "Chapitre supprimé"}, status=status.HTTP_204_NO_CONTENT)
     
     
+# PARTIE COMMENTAIRE
+
+# POST createcomment/ pour commenter un chapitre (un commentaire par utilisateur et par chapitre)
+class ChapterCommentCreateView(APIView):
+    @require_token
+    def post(self, request, slug_book, slug_chapter):
+        chapter = get_object_or_404(Chapter, book__slug=slug_book, slug=slug_chapter)
+        serializer = ChapterCommentSerializer(data=request.data)
+
+        if serializer.is_valid():
+            # Point de sauvegarde : un doublon n'interrompt pas une transaction englobante
+            try:
+                with transaction.atomic():
+                    serializer.save(user=request.user, chapter=chapter)
+            except IntegrityError:
+                return Response({'error': "Vous avez déjà commenté ce chapitre."}, status=status.HTTP_400_BAD_REQUEST)
+            # Le nombre de commentaires est affiché dans le chapitre et la table des matières
+            purge_surrogate_keys([f"comments:{slug_book}/{slug_chapter}", f"chapter:{slug_book}/{slug_chapter}", f"toc:{slug_book}"])
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+# GET getallcomments/ pour récupérer les commentaires d'un chapitre, paginés par curseur (?cursor=...)
+class ChapterCommentListView(SurrogateKeyMixin, SparseFieldsViewMixin, generics.ListAPIView):
+    surrogate_keys = ['comments:{slug_book}/{slug_chapter}', 'book-all:{slug_book}']
+    serializer_class = ChapterCommentSerializer
+    pagination_class = CommentCursorPagination
+
+    def get_queryset(self):
+        chapter = get_object_or_404(Chapter, book__slug=self.kwargs.get('slug_book'), book__deleted_at__isnull=True, slug=self.kwargs.get('slug_chapter'))
+        return ChapterComment.objects.filter(chapter=chapter, user__deleted_at__isnull=True).select_related('user', 'chapter')
+
+# DELETE deletecomment/ pour supprimer son commentaire sur un chapitre
+class ChapterCommentDeleteView(APIView):
+    @require_token
+    def delete(self, request, slug_book, slug_chapter):
+        comment = get_object_or_404(ChapterComment, user=request.user, chapter__book__slug=slug_book, chapter__slug=slug_chapter)
+
+        comment.delete()
+        purge_surrogate_keys([f"comments:{slug_book}/{slug_chapter}", f"chapter:{slug_book}/{slug_chapter}", f"toc:{slug_book}"])
+        return Response({"message": "Commentaire supprimé"}, status=status.HTTP_204_NO_CONTENT)
+    
+    
 # PARTIE PERSONNAGE
         
 # POST createcharacter/ pour créer un nouveau personnage
@@ -259,7 +510,8 @@ class CharacterCreateView(APIView):
         serializer = CharacterSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            character = serializer.save()
+            purge_surrogate_keys(worldbuilding_keys('character', character.book, character.slug))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -278,23 +530,67 @@ class CharacterUpdateView(APIView):
 
         if serializer.is_valid():
             serializer.save()
+            purge_surrogate_keys(worldbuilding_keys('character', character.book, slug_character, character.slug))
             return Response(CharacterSerializer(character).data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
 # GET getallcharacters/ pour afficher tous les personnages d'un livre
-class CharacterListView(generics.ListAPIView):
+class CharacterListView(SurrogateKeyMixin, SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
+    surrogate_keys = ['characters:{slug}', 'book-all:{slug}']
     serializer_class = CharacterSerializer
     pagination_class = None
 
     def get_queryset(self):
         slug = self.kwargs.get('slug')
-        return Character.objects.filter(book__slug=slug).order_by('name')
+        return Character.objects.filter(book__slug=slug, book__deleted_at__isnull=True).order_by('name')
+    
+# GET searchcharacters/ pour filtrer les personnages d'un livre sur leurs attributs JSON
+# ex: ?languages=elfique&traits=courageux&traits=loyal&role=allié, avec le nombre de personnages par valeur (facets)
+class CharacterSearchView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['characters:{slug_book}', 'book-all:{slug_book}']
+
+    def get(self, request, slug_book):
+        book = get_object_or_404(Book.objects.visible(), slug=slug_book)
+        characters = Character.objects.filter(book=book).select_related('book').order_by('name', 'pk')
+
+        for field in ['role', 'sexe', 'relation', 'species', 'race']:
+            if request.query_params.get(field):
+                characters = characters.filter(**{f"{field}__iexact": request.query_params.get(field)})
+
+        filters = {field: request.query_params.getlist(field) for field in CHARACTER_FACET_FIELDS if request.query_params.getlist(field)}
+        characters = filter_characters(characters, book, filters)
+
+        paginator = CharacterPagination()
+        page = paginator.paginate_queryset(sparse_queryset(characters, CharacterSerializer, request), request, view=self)
+        response = paginator.get_paginated_response(CharacterSerializer(page, many=True, context={'request': request}).data)
+        response.data['facets'] = character_facets(characters)
+        return response
+    
+# GET charactergraph/ pour récupérer le graphe des liens entre les personnages d'un livre
+# ?from=<slug>&to=<slug> ajoute le plus court chemin entre deux personnages
+class CharacterGraphView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['characters:{slug_book}', 'book-all:{slug_book}']
+
+    def get(self, request, slug_book):
+        book = get_object_or_404(Book.objects.visible(), slug=slug_book)
+        graph = get_character_graph(book.pk)
+
+        data = {
+            "nodes": list(graph['nodes'].values()),
+            "edges": graph['edges'],
+            "components": graph['components'],
+        }
+        if request.query_params.get('from') and request.query_params.get('to'):
+            data["path"] = shortest_path(graph, request.query_params.get('from'), request.query_params.get('to'))
+        return Response(data)
     
 # GET getcharacterinfo/ pour afficher toutes les informations d'un personnage
-class CharactRetrieveView(APIView):
+class CharactRetrieveView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['character:{slug_book}/{slug_character}', 'book-all:{slug_book}']
+
     def get(self, request, slug_book, slug_character):
-        character = get_object_or_404(Character, book__slug=slug_book, slug=slug_character)
+        character = get_object_or_404(sparse_queryset(Character.objects.all(), CharacterSerializer, request), book__slug=slug_book, book__deleted_at__isnull=True, slug=slug_character)
         serializer = CharacterSerializer(character, context={'request': request})
         return Response(serializer.data)
     
@@ -308,6 +604,7 @@ class CharacterDeleteView(APIView):
             return Response({"error": "non autorisé"}, status=status.HTTP_403_FORBIDDEN)
         
         character.delete()
+        purge_surrogate_keys(worldbuilding_keys('character', character.book, slug_character))
         return Response({"message": "Personnage supprimé"}, status=status.HTTP_204_NO_CONTENT)
     
 
@@ -321,23 +618,27 @@ class PlaceCreateView(APIView):
         serializer = PlaceSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            place = serializer.save()
+            purge_surrogate_keys(worldbuilding_keys('place', place.book, place.slug))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 # GET getallplaces/ pour afficher tous les lieux d'un livre
-class PlaceListView(generics.ListAPIView):
+class PlaceListView(SurrogateKeyMixin, SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
+    surrogate_keys = ['places:{slug_book}', 'book-all:{slug_book}']
     serializer_class = PlaceSerializer
     pagination_class = None
 
     def get_queryset(self):
         slug = self.kwargs.get('slug_book')
-        return Place.objects.filter(book__slug=slug)
+        return Place.objects.filter(book__slug=slug, book__deleted_at__isnull=True)
     
 # GET getinfoplace/ pour obtenir le détail d'un lieu
-class PlaceRetrieveView(APIView):
+class PlaceRetrieveView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['place:{slug_book}/{slug_place}', 'book-all:{slug_book}']
+
     def get(self, request, slug_book, slug_place):
-        place = get_object_or_404(Place, book__slug=slug_book, slug=slug_place)
+        place = get_object_or_404(sparse_queryset(Place.objects.all(), PlaceSerializer, request), book__slug=slug_book, book__deleted_at__isnull=True, slug=slug_place)
         serializer = PlaceSerializer(place, context={"request": request})
         return Response(serializer.data)
     
@@ -355,6 +656,7 @@ class PlaceUpdateView(APIView):
         
         if serializer.is_valid():
             serializer.save()
+            purge_surrogate_keys(worldbuilding_keys('place', place.book, slug_place, place.slug))
             return Response(PlaceSerializer(place).data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -370,6 +672,7 @@ class PlaceDeleteView(APIView):
             return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
         
         place.delete()
+        purge_surrogate_keys(worldbuilding_keys('place', place.book, slug_place))
         return Response({"message": "Lieu supprimé"}, status=status.HTTP_204_NO_CONTENT)
     
 
@@ -385,24 +688,27 @@ class CreatureCreateView(APIView):
         serializer = CreatureSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            creature = serializer.save()
+            purge_surrogate_keys(worldbuilding_keys('creature', creature.book, creature.slug))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 # GET getallcreatures/ pour afficher toutes les créatures d'un livre
-class CreatureListView(generics.ListAPIView):
+class CreatureListView(SurrogateKeyMixin, SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
+    surrogate_keys = ['creatures:{slug_book}', 'book-all:{slug_book}']
     serializer_class = CreatureSerializer
     pagination_class = None
 
     def get_queryset(self):
         slug = self.kwargs.get('slug_book')
-        return Creature.objects.filter(book__slug=slug)
+        return Creature.objects.filter(book__slug=slug, book__deleted_at__isnull=True)
 
 # GET getinfocreature/ pour récupérer les détails d'une créature
-class CreatureRetrieveView(APIView):
+class CreatureRetrieveView(SurrogateKeyMixin, APIView):
+    surrogate_keys = ['creature:{slug_book}/{slug_creature}', 'book-all:{slug_book}']
 
     def get(self, request, slug_book, slug_creature):
-        creature = get_object_or_404(Creature, book__slug=slug_book, slug=slug_creature)
+        creature = get_object_or_404(sparse_queryset(Creature.objects.all(), CreatureSerializer, request), book__slug=slug_book, book__deleted_at__isnull=True, slug=slug_creature)
         serializer = CreatureSerializer(creature, context={"request": request})
         return Response(serializer.data)
     
@@ -420,6 +726,7 @@ class CreatureUpdateView(APIView):
         
         if serializer.is_valid():
             serializer.save()
+            purge_surrogate_keys(worldbuilding_keys('creature', creature.book, slug_creature, creature.slug))
             return Response(CreatureSerializer(creature).data, status=status.HTTP_200_OK)
         else :
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -435,6 +742,7 @@ class CreatureDeleteView(APIView):
             return Response({"error": "utilisateur non autorisé"}, status=status.HTTP_403_FORBIDDEN)
         
         creature.delete()
+        purge_surrogate_keys(worldbuilding_keys('creature', creature.book, slug_creature))
         return Response({"message": "créature supprimée"}, status=status.HTTP_204_NO_CONTENT)
     
 
@@ -470,17 +778,17 @@ class FavoriteDeleteView(APIView):
         favorite_book = get_object_or_404(Favorite, user=request.user, book__slug=slug_book)
 
         favorite_book.delete()
-        return Response({"message": "Le livre a été supprimé des favoris de l'utilisateur"}, status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 # GET getallfavorite/ pour récupérer tous les favoris d'un utilisateur
-class FavoriteListView(generics.ListAPIView):
+class FavoriteListView(SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
     serializer_class = FavoriteSerializer
     pagination_class = None
 
     def get_queryset(self):
         token = self.kwargs.get('token')
         user = get_object_or_404(User, token=token)
-        return Favorite.objects.filter(user=user)
+        return Favorite.objects.filter(user=user, book__deleted_at__isnull=True)
     
 
 # PARTIE AUTEUR SUIVI
@@ -514,14 +822,138 @@ class FollowedAuthorDeleteView(APIView):
         return Response({"message": f"{author_name} a été supprimé des suivis de l'utilisateurs"}, status=status.HTTP_204_NO_CONTENT)
     
 # GET getallfollowedauthors/ pour récupérer tous les auteurs suivis de l'utilisateurs
-class FollowedAuthorListView(generics.ListAPIView):
+class FollowedAuthorListView(SparseFieldsViewMixin, StreamingListMixin, generics.ListAPIView):
     serializer_class = FollowedAuthorSerializer
     pagination_class = None
 
     def get_queryset(self):
         token = self.kwargs.get('token')
         user = get_object_or_404(User, token=token)
-        return FollowedAuthor.objects.filter(user=user)
+        return FollowedAuthor.objects.filter(user=user, author__deleted_at__isnull=True).prefetch_related(Prefetch('author__books', queryset=Book.objects.visible()))
+    
+
+# PARTIE NOTIFICATION
+
+# GET notifications/ pour la boîte de notifications de l'utilisateur (nouveaux livres et chapitres des auteurs suivis)
+# Paginée par curseur (?cursor=...), avec le nombre de notifications non lues
+class NotificationListView(generics.ListAPIView):
+    serializer_class = NotificationSerializer
+    pagination_class = NotificationCursorPagination
+
+    @require_token
+    def get(self, request, *args, **kwargs):
+        response = self.list(request, *args, **kwargs)
+        response.data['unread'] = unread_count(request.user)
+        return response
+
+    def get_queryset(self):
+        return notifications_for(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['read_at'] = self.request.user.notifications_read_at
+        return context
+
+# GET notificationcount/ pour le nombre de notifications non lues (badge)
+class NotificationCountView(APIView):
+    @require_token
+    def get(self, request):
+        return Response({'unread': unread_count(request.user)})
+
+# POST readnotifications/ pour marquer toute la boîte comme lue
+class NotificationReadView(APIView):
+    @require_token
+    def post(self, request):
+        mark_notifications_read(request.user)
+        return Response({'unread': 0}, status=status.HTTP_200_OK)
+
+
+# PARTIE PROGRESSION DE LECTURE
+
+# POST syncprogress/ pour synchroniser en une requête les progressions de lecture d'un appareil
+# {"progress": [{"book": slug, "chapter": slug, "offset": 1200, "updated_at": "2025-01-31T20:15:00Z"}, ...]}
+# Pour chaque livre la progression la plus récente l'emporte ; la réponse contient l'état à jour de ces livres
+class ReadingProgressSyncView(APIView):
+    @require_token
+    def post(self, request):
+        try:
+            progress, ignored = sync_reading_progress(request.user, request.data.get('progress'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'progress': ReadingProgressSerializer(progress, many=True).data, 'ignored': ignored}, status=status.HTTP_200_OK)
+
+# GET continuereading/ pour la liste "continuer la lecture" : livres en cours, du plus récemment lu au plus ancien (?limit=, 50 max)
+class ContinueReadingView(APIView):
+    @require_token
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+        except ValueError:
+            limit = 20
+
+        return Response(ReadingProgressSerializer(continue_reading(request.user, limit), many=True).data)
+
+
+# PARTIE SUPPRESSION
+
+# GET getdeletionjob/ pour suivre la suppression d'un compte ou d'un livre (progression et mémoire utilisée)
+class DeletionJobRetrieveView(APIView):
+    def get(self, request, token):
+        job = get_object_or_404(DeletionJob, token=token)
+        return Response(DeletionJobSerializer(job).data)
+
+
+# PARTIE TÂCHES DE FOND
+
+# GET runjobs/ pour exécuter les tâches prêtes sur un hébergement sans worker (appelé par le cron de vercel.json)
+# Protégé par "Authorization: Bearer <CRON_SECRET>" ; les tâches sont prises pendant au plus JOBS_DRAIN_SECONDS
+class RunJobsView(APIView):
+    def get(self, request):
+        secret = settings.CRON_SECRET
+        if not secret or not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {secret}"):
+            return Response({'error': 'Permission refusée'}, status=status.HTTP_403_FORBIDDEN)
+
+        worker = Worker()
+        worker.run(burst=True, max_seconds=settings.JOBS_DRAIN_SECONDS)
+        return Response({'processed': worker.processed, 'failed': worker.failed})
+
+
+# PARTIE RECHERCHE
+
+# GET search/?q=... pour rechercher dans les livres, personnages, lieux et créatures (?type=character pour filtrer)
+class SearchView(APIView):
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        kind = request.query_params.get('type')
+
+        if kind and kind not in SEARCH_MODELS:
+            return Response({'error': f"Type inconnu, valeurs possibles : {', '.join(SEARCH_MODELS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            limit = 20
+
+        return Response({'query': query, 'results': search(query, kind=kind, limit=limit)})
+
+
+# GET autocomplete/?q=fan pour suggérer des genres, thèmes et noms d'auteur (?type=genre pour un seul type)
+# Les suggestions sont servies depuis un index en mémoire, sans requête en base
+class AutocompleteView(APIView):
+    def get(self, request):
+        prefix = request.query_params.get('q', '')
+        kind = request.query_params.get('type')
+
+        if kind and kind not in AUTOCOMPLETE_KINDS:
+            return Response({'error': f"Type inconnu, valeurs possibles : {', '.join(AUTOCOMPLETE_KINDS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            limit = 10
+
+        return Response(autocomplete(prefix, kinds=[kind] if kind else None, limit=limit))
     
 
 # TEST REQUETE DEPLOIEMENT
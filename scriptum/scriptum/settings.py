@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import dj_database_url
 import os
+import importlib.util
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -58,6 +59,7 @@ DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RateLimitMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = False
@@ -122,15 +125,65 @@ DATABASES = {
     )
 }
 
+# Cache partagé par tous les processus web et les workers (statistiques, catalogue, facettes, suggestions, graphe...)
+# Redis si REDIS_URL est défini, sinon une table de la base (créée par la migration 0040, ou "python manage.py createcachetable")
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'api_cache'}}
+
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "api.renderers.FastJSONRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ],
 }
 
+# Format MessagePack en plus du JSON (choisi avec les en-têtes Accept / Content-Type), si msgpack est installé
+if importlib.util.find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append("api.renderers.MessagePackRenderer")
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"].append("api.renderers.MessagePackParser")
+
+# Catalogue en mémoire pour les filtres et tris de getallbook (nécessite NumPy)
+CATALOG_ENGINE = os.environ.get('CATALOG_ENGINE', 'False') == 'True'
+
+# Cache CDN des GET publics : en-têtes Cache-Control et Surrogate-Key, purge par clés à chaque écriture
+# CDN_PURGER=api.cdn.FastlyPurger en production, api.cdn.LocalPurger (purges gardées en mémoire) par défaut
+CDN_PURGER = os.environ.get('CDN_PURGER', 'api.cdn.LocalPurger')
+CDN_SURROGATE_KEY_HEADER = os.environ.get('CDN_SURROGATE_KEY_HEADER', 'Surrogate-Key')
+CDN_BROWSER_MAX_AGE = int(os.environ.get('CDN_BROWSER_MAX_AGE', 60))
+CDN_EDGE_MAX_AGE = int(os.environ.get('CDN_EDGE_MAX_AGE', 60 * 60 * 24))
+FASTLY_API_TOKEN = os.environ.get('FASTLY_API_TOKEN')
+FASTLY_SERVICE_ID = os.environ.get('FASTLY_SERVICE_ID')
+
+# File de tâches en base (api/jobs.py) exécutée par "python manage.py run_worker"
+# JOBS_EAGER=True exécute les tâches dans le processus web après chaque transaction (développement sans worker)
+JOBS_EAGER = os.environ.get('JOBS_EAGER', 'False') == 'True'
+# Hébergement sans worker (Vercel) : le cron de vercel.json appelle GET /api/runjobs/ avec "Authorization: Bearer <CRON_SECRET>"
+# (en-tête envoyé par Vercel quand CRON_SECRET est défini), qui exécute les tâches prêtes pendant au plus JOBS_DRAIN_SECONDS
+CRON_SECRET = os.environ.get('CRON_SECRET')
+JOBS_DRAIN_SECONDS = int(os.environ.get('JOBS_DRAIN_SECONDS', 8))
+
+# Limite de requêtes par seau à jetons : par utilisateur pour les vues à token, par IP pour les autres
+# Budgets par route dans api/urls.py (RATE_LIMITS), RATE_LIMIT_DEFAULT pour les routes absentes
+# Seaux partagés entre processus dans Redis (api.ratelimit.RedisBuckets) dès que RATE_LIMIT_REDIS_URL (ou REDIS_URL) est défini,
+# sinon en mémoire du processus (api.ratelimit.LocalBuckets, un budget par processus : avertissement au démarrage hors DEBUG)
+# Activée par défaut seulement avec des seaux partagés
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', REDIS_URL)
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'api.ratelimit.RedisBuckets' if RATE_LIMIT_REDIS_URL else 'api.ratelimit.LocalBuckets')
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', str(bool(RATE_LIMIT_REDIS_URL))) == 'True'
+RATE_LIMIT_DEFAULT = os.environ.get('RATE_LIMIT_DEFAULT', '300/min')
+# Nombre de proxys de confiance devant l'application (X-Forwarded-For), 1 derrière le routeur de l'hébergeur
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 1))
+
 # Cloudinary config
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': os.environ.get('CLOUDINARY_CLOUD_NAME'),